@@ -0,0 +1,15 @@
+"""
+Configuracion para los tests del ruteo a replicas: agrega una replica con
+su propia base de prueba en lugar de reflejar a default.
+
+    python manage.py test core.tests.test_replicas \
+        --settings=app.replica_test_settings
+"""
+from app.settings import *  # noqa
+from app.settings import DATABASES
+
+DATABASES['replica1'] = {
+    **DATABASES['default'],
+    'TEST': {'NAME': 'test_replica'},
+}
+DATABASE_REPLICAS = ['replica1']
@@ -49,6 +49,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.HealthCheckMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.profiling.ProfilingMiddleware',
+    'core.querylog.QueryLogMiddleware',
+    'core.traffic.TrafficRecorderMiddleware',
+    'core.replicas.ReplicaMiddleware',
+    'core.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,20 +88,163 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+DB_POOL_ENABLED = bool(int(os.environ.get('DB_POOL_ENABLED', 1)))
+
 DATABASES = {
     # 'default': {
     #     'ENGINE': 'django.db.backends.sqlite3',
     #     'NAME': BASE_DIR / 'db.sqlite3',
     # }
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql'
+        if DB_POOL_ENABLED else 'django.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Con el pool cada peticion devuelve su conexion al terminar, sin
+        # pool conviene mantenerla abierta entre peticiones.
+        'CONN_MAX_AGE': int(
+            os.environ.get('DB_CONN_MAX_AGE', 0 if DB_POOL_ENABLED else 60)
+        ),
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'MAX_LIFETIME': float(
+                os.environ.get('DB_POOL_MAX_LIFETIME', 1800)
+            ),
+            'HEALTH_CHECK_AFTER': float(
+                os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', 10)
+            ),
+        },
     }
 }
 
+# Replicas de solo lectura, una por host en DB_REPLICA_HOSTS. En los tests
+# apuntan a la misma base que default.
+DB_REPLICA_HOSTS = [
+    host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host
+]
+for index, host in enumerate(DB_REPLICA_HOSTS, 1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [f'replica{index}'
+                     for index in range(1, len(DB_REPLICA_HOSTS) + 1)]
+# Shards de recetas, categorias e ingredientes, uno por host en
+# DB_SHARD_HOSTS. Sin shards todo vive en default.
+DB_SHARD_HOSTS = [
+    host for host in os.environ.get('DB_SHARD_HOSTS', '').split(',') if host
+]
+for index, host in enumerate(DB_SHARD_HOSTS, 1):
+    DATABASES[f'shard{index}'] = {**DATABASES['default'], 'HOST': host}
+DATABASE_SHARDS = [f'shard{index}'
+                   for index in range(1, len(DB_SHARD_HOSTS) + 1)]
+SHARD_VNODES = int(os.environ.get('SHARD_VNODES', 64))
+# Cada shard genera ids de su clase modulo este numero para que mover un
+# usuario no choque con los ids del destino. No se debe cambiar despues de
+# crear datos y tiene que ser mayor que el numero de shards.
+SHARD_ID_STRIDE = int(os.environ.get('SHARD_ID_STRIDE', 64))
+DATABASE_ROUTERS = ['core.sharding.ShardRouter', 'core.replicas.ReplicaRouter']
+# Segundos que un cliente lee del primario despues de escribir
+REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 5))
+# 'cookie' o 'cache'; 'cache' requiere un cache compartido entre workers
+REPLICA_PIN_STORE = os.environ.get('REPLICA_PIN_STORE', 'cookie')
+REPLICA_PIN_COOKIE = 'db_pin'
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 10))
+REPLICA_LAG_CHECK_SECONDS = float(
+    os.environ.get('REPLICA_LAG_CHECK_SECONDS', 5)
+)
+
+# Sondas de salud, atendidas por core.middleware.HealthCheckMiddleware
+
+HEALTH_LIVENESS_PATH = '/healthz'
+HEALTH_READINESS_PATH = '/readyz'
+HEALTH_READINESS_CACHE_SECONDS = float(
+    os.environ.get('HEALTH_READINESS_CACHE_SECONDS', 5)
+)
+HEALTH_MAX_POOL_SATURATION = float(
+    os.environ.get('HEALTH_MAX_POOL_SATURATION', 0.95)
+)
+
+# Metricas Prometheus expuestas en /metrics. Con varios workers de uWSGI se
+# agregan por archivos en PROMETHEUS_MULTIPROC_DIR.
+
+METRICS_ENABLED = bool(int(os.environ.get('METRICS_ENABLED', 1)))
+
+# Perfilado bajo demanda con el header X-Profile (ver profile_token) o por
+# muestreo. Deshabilitado el middleware no se instala.
+
+PROFILING_ENABLED = bool(int(os.environ.get('PROFILING_ENABLED', 0)))
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/vol/profiles')
+PROFILING_RING_SIZE = int(os.environ.get('PROFILING_RING_SIZE', 50))
+PROFILING_TOKEN_MAX_AGE = int(os.environ.get('PROFILING_TOKEN_MAX_AGE', 3600))
+
+# Compresion de respuestas con brotli (si esta instalado) o gzip. Las
+# metricas de tamano de respuesta miden el cuerpo ya comprimido.
+
+COMPRESSION_ENABLED = bool(int(os.environ.get('COMPRESSION_ENABLED', 1)))
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)
+)
+
+# Log de consultas lentas y repetidas por peticion (ver querylog_summary)
+
+QUERY_LOG_ENABLED = bool(int(os.environ.get('QUERY_LOG_ENABLED', 1)))
+QUERY_LOG_FILE = os.environ.get('QUERY_LOG_FILE')
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'querylog': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': QUERY_LOG_FILE,
+            'formatter': 'json',
+        } if QUERY_LOG_FILE else {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'core.querylog': {
+            'handlers': ['querylog'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Grabacion anonimizada del trafico para replay_traffic, deshabilitada si no
+# hay archivo.
+
+TRAFFIC_RECORD_FILE = os.environ.get('TRAFFIC_RECORD_FILE')
+TRAFFIC_USER_BUCKETS = int(os.environ.get('TRAFFIC_USER_BUCKETS', 1000))
+# Parametros de consulta que se graban; cualquier otro se descarta. Al
+# agregar un parametro a un endpoint tambien se agrega aqui.
+TRAFFIC_RECORD_PARAMS = [
+    # Filtros de recetas, categorias e ingredientes
+    'tags', 'ingredientes', 'assigned_only',
+    'time_minutes_min', 'time_minutes_max', 'price_min', 'price_max',
+    'ordering',
+    # Paginacion
+    'limit', 'cursor',
+    # Recetas con la despensa, lista de compras y cambios
+    'max_missing', 'ids', 'since',
+    # Formato e idioma de la respuesta
+    'format', 'lang',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -134,6 +284,46 @@ MEDIA_URL = '/static/media/'
 
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
+# collectstatic agrega el hash del contenido al nombre (staticfiles.json), el
+# proxy sirve esos nombres como inmutables.
+STATICFILES_STORAGE = \
+    'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+
+# 'public' deja que el proxy sirva la media directamente, 'accel' valida que
+# el usuario sea duenio de la receta y delega la transferencia a nginx con
+# X-Accel-Redirect.
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'public')
+MEDIA_ACCEL_REDIRECT_URL = MEDIA_URL
+if MEDIA_DELIVERY == 'accel':
+    MEDIA_URL = '/api/recipe/images/'
+
+# 'uuid' guarda cada subida con un nombre nuevo, 'content' guarda cada imagen
+# una sola vez bajo el digest de su contenido.
+RECIPE_IMAGE_STORAGE = os.environ.get('RECIPE_IMAGE_STORAGE', 'uuid')
+
+# Importacion de recetas en segundo plano (ver process_imports). Los archivos
+# se guardan fuera de MEDIA_ROOT para que el proxy nunca los sirva.
+IMPORT_DIR = os.environ.get('IMPORT_DIR', '/vol/imports')
+IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', 500 * 1024 * 1024))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 100))
+IMPORT_STALE_SECONDS = int(os.environ.get('IMPORT_STALE_SECONDS', 300))
+
+# Cola de tareas en la base de datos (ver run_worker). Apagada, las tareas
+# se ejecutan en el momento dentro de la peticion.
+TASK_QUEUE_ENABLED = bool(int(os.environ.get('TASK_QUEUE_ENABLED', 0)))
+TASK_RETRY_BASE_SECONDS = float(os.environ.get('TASK_RETRY_BASE_SECONDS', 5))
+TASK_RETRY_MAX_SECONDS = float(os.environ.get('TASK_RETRY_MAX_SECONDS', 600))
+
+# Registro de cambios para la sincronizacion incremental. Los tombstones mas
+# viejos que CHANGES_TOMBSTONE_SECONDS se borran al compactar; un cliente que
+# no sincronizo en ese tiempo vuelve a descargar todo.
+CHANGES_PAGE_SIZE = int(os.environ.get('CHANGES_PAGE_SIZE', 500))
+CHANGES_MAX_PAGE_SIZE = int(os.environ.get('CHANGES_MAX_PAGE_SIZE', 1000))
+CHANGES_TOMBSTONE_SECONDS = int(
+    os.environ.get('CHANGES_TOMBSTONE_SECONDS', 30 * 24 * 3600)
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -141,10 +331,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# JSON sigue siendo el formato por defecto; MessagePack y CBOR se eligen con
+# el header Accept (o Content-Type al enviar).
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+        'core.renderers.CBORRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.parsers.MessagePackParser',
+        'core.parsers.CBORParser',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
+
+# Schema OpenAPI precalculado con build_schema. En DEBUG solo se cachea en
+# memoria para que refleje los cambios del codigo al recargar.
+SCHEMA_CACHE_DIR = None if DEBUG else os.environ.get(
+    'SCHEMA_CACHE_DIR', str(BASE_DIR / '.schema-cache')
+)
@@ -17,13 +17,20 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView
+from drf_spectacular.views import SpectacularSwaggerView
 from core import views
+from core.metrics import metrics_view
+from core.schema import CachedSpectacularAPIView
 
 urlpatterns = [
     path('api/check-health',views.check_health,name='check-health'),
+    path('metrics', metrics_view, name='metrics'),
     path('admin/', admin.site.urls),
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+    path(
+        'api/schema/',
+        CachedSpectacularAPIView.as_view(),
+        name='api-schema'
+    ),
     path(
         'api/docs/',
         SpectacularSwaggerView.as_view(url_name='api-schema'),
@@ -33,7 +40,7 @@ urlpatterns = [
     path('api/recipe/', include('recipe.urls'))
 ]
 
-if settings.DEBUG:
+if settings.DEBUG and settings.MEDIA_DELIVERY == 'public':
     urlpatterns += static(
         settings.MEDIA_URL,
         document_root=settings.MEDIA_ROOT
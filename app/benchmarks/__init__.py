@@ -0,0 +1,6 @@
+"""
+Benchmarks de rendimiento de la api de recetas.
+
+Los casos se registran con el decorador `benchmark` y se corren con
+`python manage.py benchmark`.
+"""
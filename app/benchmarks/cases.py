@@ -0,0 +1,227 @@
+"""
+Casos de benchmark de serializers, querysets y vistas
+"""
+from functools import partial
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from benchmarks import fixtures
+from benchmarks.runner import benchmark
+from core import changes, compression, pantry
+from core.models import ChangeSequence, Recipe
+from core.renderers import CBORRenderer, MessagePackRenderer
+from recipe import serializers, views
+
+ROW_SIZES = (10, 1000, 10000)
+RENDERERS = {
+    'json': JSONRenderer,
+    'msgpack': MessagePackRenderer,
+    'cbor': CBORRenderer,
+}
+factory = APIRequestFactory()
+
+
+def recipes_setup(size):
+    """Usuario con `size` recetas, 3 categorias y 5 ingredientes cada una"""
+    user = fixtures.create_user()
+    tag_ids, ingredient_ids = fixtures.create_vocabulary(user)
+    fixtures.create_recipes(user, size, tag_ids, ingredient_ids)
+    return {'user': user, 'tag_ids': tag_ids,
+            'ingredient_ids': ingredient_ids}
+
+
+def vocabulary_setup(size):
+    """Usuario con vocabulario y 1000 recetas"""
+    return recipes_setup(1000)
+
+
+def _queryset(context):
+    return Recipe.objects.filter(user=context['user']).order_by('-id')
+
+
+@benchmark('recipe_serializer', sizes=ROW_SIZES, setup=recipes_setup,
+           tags=['serializers'])
+def recipe_serializer(context):
+    serializers.RecipeSerializer(_queryset(context), many=True).data
+
+
+@benchmark('recipe_detail_serializer', sizes=ROW_SIZES, setup=recipes_setup,
+           tags=['serializers'])
+def recipe_detail_serializer(context):
+    serializers.RecipeDetailSerializer(_queryset(context), many=True).data
+
+
+def _viewset(context, params):
+    request = factory.get('/api/recipe/recipes/', params)
+    request.user = context['user']
+    view = views.RecipeViewSet(action='list', format_kwarg=None)
+    view.request = Request(request)
+    view.request.user = context['user']
+    return view
+
+
+@benchmark('recipe_get_queryset_filters', sizes=(1000, 10000),
+           setup=recipes_setup, tags=['querysets'])
+def recipe_get_queryset_filters(context):
+    params = {
+        'tags': ','.join(map(str, context['tag_ids'][:3])),
+        'ingredientes': ','.join(map(str, context['ingredient_ids'][:5])),
+    }
+    list(_viewset(context, params).get_queryset())
+
+
+def _recipe_payload(tags):
+    return {
+        'title': 'receta con muchas categorias',
+        'time_minutes': 30,
+        'price': '12.50',
+        'tags': [{'name': f'nueva {index}'} for index in range(tags)],
+        'ingredientes': [{'name': f'nuevo {index}'}
+                         for index in range(tags)],
+    }
+
+
+def _serializer_context(user):
+    request = Request(factory.post('/api/recipe/recipes/'))
+    request.user = user
+    return {'request': request}
+
+
+@benchmark('recipe_create_many_tags', sizes=(10, 100), setup=recipes_setup,
+           tags=['views'])
+def recipe_create_many_tags(context):
+    user = context['user']
+    serializer = serializers.RecipeSerializer(
+        data=_recipe_payload(50), context=_serializer_context(user)
+    )
+    serializer.is_valid(raise_exception=True)
+    recipe = serializer.save(user=user)
+    recipe.delete()
+
+
+@benchmark('recipe_update_many_tags', sizes=(10, 100), setup=recipes_setup,
+           tags=['views'])
+def recipe_update_many_tags(context):
+    user = context['user']
+    recipe = Recipe.objects.filter(user=user).first()
+    serializer = serializers.RecipeSerializer(
+        recipe, data={'tags': _recipe_payload(50)['tags']}, partial=True,
+        context=_serializer_context(user),
+    )
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+
+
+def _list_view(viewset, context, url, params):
+    request = factory.get(url, params)
+    force_authenticate(request, user=context['user'])
+    response = viewset.as_view({'get': 'list'})(request)
+    response.render()
+    return response
+
+
+@benchmark('tag_list_assigned_only', setup=vocabulary_setup, tags=['views'])
+def tag_list_assigned_only(context):
+    _list_view(views.TagViewSet, context, '/api/recipe/tags/',
+               {'assigned_only': 1})
+
+
+@benchmark('ingredient_list_assigned_only', setup=vocabulary_setup,
+           tags=['views'])
+def ingredient_list_assigned_only(context):
+    _list_view(views.IngredientViewSet, context, '/api/recipe/ingredients/',
+               {'assigned_only': 1})
+
+
+@benchmark('recipe_list_view', sizes=(10, 1000), setup=recipes_setup,
+           tags=['views'])
+def recipe_list_view(context):
+    _list_view(views.RecipeViewSet, context, '/api/recipe/recipes/', {})
+
+
+def pantry_setup(size):
+    """Recetas del usuario y una despensa con 60 de sus 200 ingredientes"""
+    context = recipes_setup(size)
+    context['pantry'] = context['ingredient_ids'][:60]
+    return context
+
+
+@benchmark('pantry_cookable', sizes=(1000, 10000, 100000),
+           setup=pantry_setup, tags=['querysets'])
+def pantry_cookable(context):
+    pantry.cookable(context['user'].pk, context['pantry'], max_missing=1)
+
+
+@benchmark('pantry_view', sizes=(1000, 100000), setup=pantry_setup,
+           tags=['views'])
+def pantry_view(context):
+    request = factory.get('/api/recipe/recipes/pantry/', {
+        'ingredientes': ','.join(map(str, context['pantry'])),
+        'max_missing': 1,
+    })
+    force_authenticate(request, user=context['user'])
+    response = views.RecipeViewSet.as_view({'get': 'pantry'})(request)
+    response.render()
+
+
+def changes_setup(size):
+    """Registro completo de `size` recetas y 20 recetas editadas despues"""
+    context = recipes_setup(size)
+    user = context['user']
+    changes.rebuild('default', [user.pk])
+    context['since'] = ChangeSequence.objects.get(user=user).last_seq
+    for recipe in Recipe.objects.filter(user=user).order_by('id')[:20]:
+        recipe.time_minutes += 1
+        recipe.save()
+    return context
+
+
+@benchmark('changes_since', sizes=(1000, 100000), setup=changes_setup,
+           tags=['views'])
+def changes_since(context):
+    request = factory.get('/api/recipe/changes/',
+                          {'since': context['since']})
+    force_authenticate(request, user=context['user'])
+    response = views.ChangesView.as_view()(request)
+    response.render()
+
+
+def token_setup(size):
+    user = fixtures.create_user()
+    return {'key': user.auth_token.key}
+
+
+@benchmark('token_auth', setup=token_setup, tags=['auth'])
+def token_auth(context):
+    request = factory.get('/api/recipe/recipes/',
+                          HTTP_AUTHORIZATION=f'Token {context["key"]}')
+    for _ in range(100):
+        TokenAuthentication().authenticate(Request(request))
+
+
+def encoding_setup(size):
+    """Lista de `size` recetas ya serializada, lista para codificar"""
+    context = recipes_setup(size)
+    context['data'] = serializers.RecipeSerializer(
+        _queryset(context), many=True
+    ).data
+    return context
+
+
+def encode_recipe_list(renderer, encoding, context):
+    """Codifica la lista y regresa los bytes que irian en la respuesta"""
+    body = renderer().render(context['data'])
+    if encoding:
+        body = compression.compress(body, encoding)
+    return {'bytes': len(body)}
+
+
+for _format, _renderer in RENDERERS.items():
+    for _encoding in [None, *compression.available_encodings()]:
+        benchmark(
+            f'recipe_list_{_format}' + (f'_{_encoding}' if _encoding else ''),
+            sizes=(10, 1000, 10000), setup=encoding_setup, tags=['encoding'],
+        )(partial(encode_recipe_list, _renderer, _encoding))
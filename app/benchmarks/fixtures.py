@@ -0,0 +1,83 @@
+"""
+Datos para los benchmarks creados con inserciones por lote
+"""
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authtoken.models import Token
+
+from core import pantry
+from core.models import Ingredient, Recipe, Tag
+
+PASSWORD_HASH = make_password('benchmark.1234')
+
+
+def create_user(email='bench@example.com'):
+    """Crea un usuario con token sin calcular el hash de su password"""
+    user = get_user_model().objects.create(email=email,
+                                           password=PASSWORD_HASH)
+    Token.objects.create(user=user)
+    return user
+
+
+def create_vocabulary(user, tags=50, ingredients=200):
+    """Crea las categorias e ingredientes del usuario"""
+    Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {index}') for index in range(tags)
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingrediente {index}')
+        for index in range(ingredients)
+    )
+    return (
+        list(Tag.objects.filter(user=user).values_list('id', flat=True)),
+        list(Ingredient.objects.filter(user=user)
+             .values_list('id', flat=True)),
+    )
+
+
+def create_recipes(user, count, tag_ids=(), ingredient_ids=(),
+                   tags_per_recipe=3, ingredients_per_recipe=5, seed=0,
+                   batch_size=2000):
+    """Crea recetas con sus relaciones llenando las tablas intermedias"""
+    rng = random.Random(seed)
+    tag_through = Recipe.tags.through
+    ingredient_through = Recipe.ingredientes.through
+    for start in range(0, count, batch_size):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                user=user,
+                title=f'receta {user.pk}-{index}',
+                description='descripcion de prueba',
+                time_minutes=rng.randint(5, 180),
+                price=Decimal(rng.randint(100, 9999)) / 100,
+                link='https://example.com/receta',
+            )
+            for index in range(start, min(start + batch_size, count))
+        )
+        if not recipes or recipes[0].pk is None:
+            recipes = list(
+                Recipe.objects.filter(user=user).order_by('-id')
+                [:len(recipes)]
+            )
+        tag_rows = []
+        ingredient_rows = []
+        for recipe in recipes:
+            for tag_id in rng.sample(list(tag_ids),
+                                     min(tags_per_recipe, len(tag_ids))):
+                tag_rows.append(tag_through(recipe_id=recipe.pk,
+                                            tag_id=tag_id))
+            for ingredient_id in rng.sample(
+                list(ingredient_ids),
+                min(ingredients_per_recipe, len(ingredient_ids))
+            ):
+                ingredient_rows.append(ingredient_through(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_id
+                ))
+        tag_through.objects.bulk_create(tag_rows)
+        ingredient_through.objects.bulk_create(ingredient_rows)
+        # Los inserts en lote no disparan las senales de los conteos
+        pantry.rebuild(DEFAULT_DB_ALIAS, [recipe.pk for recipe in recipes])
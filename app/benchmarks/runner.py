@@ -0,0 +1,129 @@
+"""
+Registro, medicion y comparacion de benchmarks
+"""
+import gc
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection, transaction
+
+from core.metrics import QueryCounter
+
+BENCHMARKS = {}
+
+
+class Benchmark:
+    """Caso de benchmark con su preparacion y tamanos"""
+
+    def __init__(self, name, func, setup=None, sizes=(None,), tags=()):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.sizes = tuple(sizes)
+        self.tags = set(tags)
+
+    def case_names(self, sizes=None):
+        for size in self.sizes:
+            if size is not None and sizes and size not in sizes:
+                continue
+            yield size, self.name if size is None else f'{self.name}[{size}]'
+
+
+def benchmark(name, sizes=(None,), setup=None, tags=()):
+    """Registra una funcion como caso de benchmark"""
+    def decorator(func):
+        BENCHMARKS[name] = Benchmark(name, func, setup, sizes, tags)
+        return func
+    return decorator
+
+
+def measure(func, context, repeat):
+    """
+    Mide tiempo, consultas y memoria pico de una funcion. Si la funcion
+    regresa un dict sus valores se agregan al resultado (p. ej. bytes).
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        extra = func(context)
+
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func(context)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(context)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        **(extra if isinstance(extra, dict) else {}),
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'repeat': repeat,
+        'queries': counter.count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+class _Rollback(Exception):
+    pass
+
+
+def run_benchmarks(names=None, sizes=None, repeat=5, tags=None,
+                   report=None):
+    """
+    Corre los benchmarks, cada tamano dentro de una transaccion que se
+    revierte al terminar para no dejar datos.
+    """
+    from benchmarks import cases  # noqa registra los casos
+
+    results = {}
+    for bench in BENCHMARKS.values():
+        if names and bench.name not in names:
+            continue
+        if tags and not bench.tags & set(tags):
+            continue
+        for size, case_name in bench.case_names(sizes):
+            try:
+                with transaction.atomic():
+                    context = bench.setup(size) if bench.setup else size
+                    results[case_name] = measure(bench.func, context, repeat)
+                    raise _Rollback
+            except _Rollback:
+                pass
+            if report:
+                report(case_name, results[case_name])
+    return results
+
+
+def compare_results(current, baseline, threshold):
+    """
+    Regresa las regresiones contra la corrida base: tiempo mediano que
+    crece mas del umbral o cualquier consulta adicional.
+    """
+    regressions = []
+    for name, result in current.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if previous['median_ms'] and \
+                result['median_ms'] > previous['median_ms'] * (1 + threshold):
+            change = result['median_ms'] / previous['median_ms'] - 1
+            regressions.append(
+                f'{name}: {previous["median_ms"]} ms -> '
+                f'{result["median_ms"]} ms (+{change:.0%})'
+            )
+        if result['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: {previous["queries"]} -> {result["queries"]} '
+                'consultas'
+            )
+    return regressions
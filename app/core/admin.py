@@ -1,9 +1,14 @@
 """Django admin custom"""
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
-from .models import User, Recipe, Tag, Ingredient
+from .models import User, Recipe, Tag, Ingredient, ImageBlob, \
+    RequestProfile, ShardAssignment
+from .profiling import ring_buffer
+from .sharding import use_shard, user_writes
 
 
 class UserAdmin(BaseUserAdmin):
@@ -48,7 +53,111 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class ShardListFilter(admin.SimpleListFilter):
+    """Elige el shard a listar, por defecto el primero"""
+    title = _('shard')
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.DATABASE_SHARDS]
+
+    def queryset(self, request, queryset):
+        shard = self.value()
+        if shard not in settings.DATABASE_SHARDS:
+            shard = settings.DATABASE_SHARDS[0]
+        return queryset.using(shard)
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+    Admin de los modelos repartidos por usuario: lista un shard a la vez y
+    busca el objeto a editar en cada shard. Al guardar, el router lo manda
+    al shard de su usuario.
+    """
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if settings.DATABASE_SHARDS:
+            return [ShardListFilter, *list_filter]
+        return list_filter
+
+    def save_model(self, request, obj, form, change):
+        with user_writes(obj.user_id):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with user_writes(obj.user_id):
+            super().delete_model(request, obj)
+
+    def get_object(self, request, object_id, from_field=None):
+        if not settings.DATABASE_SHARDS:
+            return super().get_object(request, object_id, from_field)
+        for alias in settings.DATABASE_SHARDS:
+            with use_shard(alias):
+                obj = super().get_object(request, object_id, from_field)
+            if obj is not None:
+                return obj
+        return None
+
+
+class ShardAssignmentAdmin(admin.ModelAdmin):
+    """Las asignaciones se cambian con move_user_shard"""
+    list_display = ['user', 'shard', 'moving', 'updated_at']
+    list_filter = ['shard', 'moving']
+    readonly_fields = ['user', 'shard', 'moving', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(User, UserAdmin)
-admin.site.register(Recipe)
-admin.site.register(Tag)
-admin.site.register(Ingredient)
+admin.site.register(Recipe, ShardedModelAdmin)
+admin.site.register(Tag, ShardedModelAdmin)
+admin.site.register(Ingredient, ShardedModelAdmin)
+admin.site.register(ImageBlob)
+admin.site.register(ShardAssignment, ShardAssignmentAdmin)
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Muestra los perfiles guardados en el ring buffer"""
+    list_display = ['created_at', 'method', 'path', 'view', 'status',
+                    'duration_ms', 'sql_count', 'sql_ms', 'sampled']
+    list_filter = ['view', 'sampled']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields] + \
+            ['report']
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.get_fields(request, obj)
+
+    @admin.display(description=_('Report'))
+    def report(self, obj):
+        """Renderiza las consultas, serializers y pstats del perfil"""
+        report = ring_buffer().load(obj.slot)
+        if report is None:
+            return '-'
+        queries = '\n'.join(
+            f'{query["ms"]:>9.3f} ms  {" <- ".join(query["stack"][:2])}'
+            f'\n    {query["sql"]}'
+            for query in report['sql']
+        )
+        serializers = '\n'.join(
+            f'{item["cumulative_ms"]:>9.3f} ms  {item["calls"]:>6}  '
+            f'{item["function"]}'
+            for item in report['serializers']
+        )
+        return format_html(
+            '<h3>SQL</h3><pre>{}</pre><h3>Serializers</h3><pre>{}</pre>'
+            '<h3>cProfile</h3><pre>{}</pre>',
+            queries, serializers, report['pstats']
+        )
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
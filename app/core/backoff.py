@@ -0,0 +1,16 @@
+"""
+Reintentos con backoff exponencial y jitter
+"""
+import random
+
+
+def backoff_delays(base=0.05, factor=2.0, maximum=2.0, jitter=0.5):
+    """
+    Genera esperas crecientes a partir de `base` segundos hasta `maximum`,
+    cada una reducida al azar hasta en `jitter` para que las replicas no
+    reintenten al mismo tiempo.
+    """
+    delay = base
+    while True:
+        yield delay * (1 - random.uniform(0, jitter))
+        delay = min(delay * factor, maximum)
@@ -0,0 +1,186 @@
+"""
+Registro de cambios por usuario para la sincronizacion incremental
+"""
+import contextvars
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.models import ChangeLogEntry, ChangeSequence, Ingredient, Recipe, \
+    Tag
+
+RECIPE = ChangeLogEntry.RECIPE
+TAG = ChangeLogEntry.TAG
+INGREDIENT = ChangeLogEntry.INGREDIENT
+KINDS = {RECIPE: Recipe, TAG: Tag, INGREDIENT: Ingredient}
+MODEL_KINDS = {model: kind for kind, model in KINDS.items()}
+
+
+class ChangesCompacted(APIException):
+    """La secuencia del cliente es anterior a la ultima compactacion"""
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Los cambios ya se compactaron, sincroniza desde cero'
+    default_code = 'changes_compacted'
+
+
+_pending = contextvars.ContextVar('changes_pending', default=None)
+# Usuarios que se estan borrando: sus objetos se van en cascada con el
+# registro y no deben crear entradas nuevas
+_deleting_users = contextvars.ContextVar('changes_deleting_users',
+                                         default=frozenset())
+
+
+def allocate(user_id, count, using):
+    """
+    Reserva `count` numeros de secuencia del usuario y regresa el ultimo.
+    El UPDATE bloquea el contador hasta confirmar: los cambios de un mismo
+    usuario se confirman en el orden de su secuencia.
+    """
+    sequences = ChangeSequence.objects.using(using).filter(user_id=user_id)
+    if not sequences.update(last_seq=F('last_seq') + count):
+        ChangeSequence.objects.using(using).get_or_create(user_id=user_id)
+        sequences.update(last_seq=F('last_seq') + count)
+    return sequences.values_list('last_seq', flat=True).get()
+
+
+def write(user_id, items, using):
+    """Guarda las entradas [(tipo, id, borrado)] con numeros consecutivos"""
+    if not items:
+        return
+    with transaction.atomic(using=using):
+        first = allocate(user_id, len(items), using) - len(items) + 1
+        ChangeLogEntry.objects.using(using).bulk_create([
+            ChangeLogEntry(user_id=user_id, seq=first + offset, kind=kind,
+                           object_id=object_id, deleted=deleted)
+            for offset, (kind, object_id, deleted) in enumerate(items)
+        ], batch_size=1000)
+
+
+def record(user_id, kind, object_ids, using, deleted=False):
+    """Registra el alta o cambio (o el borrado) de los objetos"""
+    if user_id is None or user_deleting(user_id):
+        return
+    object_ids = sorted(set(object_ids))
+    if not object_ids:
+        return
+    pending = _pending.get()
+    if pending is None:
+        write(user_id, [(kind, object_id, deleted)
+                        for object_id in object_ids], using)
+        return
+    changes = pending.setdefault((using, user_id), {})
+    for object_id in object_ids:
+        # Se conserva el ultimo estado y el orden de la primera aparicion
+        changes[kind, object_id] = deleted
+
+
+@contextmanager
+def batch(using):
+    """
+    Escribe los cambios del bloque al final y en su misma transaccion, con
+    una entrada por objeto y una sola reserva de secuencia por usuario.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = {}
+    with transaction.atomic(using=using):
+        token = _pending.set(pending)
+        try:
+            yield
+        finally:
+            _pending.reset(token)
+        for (alias, user_id), changes in pending.items():
+            write(user_id, [(kind, object_id, deleted) for
+                            (kind, object_id), deleted in changes.items()],
+                  alias)
+
+
+@contextmanager
+def deleting_users(user_ids):
+    """Marca a los usuarios como en borrado mientras dura el bloque"""
+    token = _deleting_users.set(_deleting_users.get() | set(user_ids))
+    try:
+        yield
+    finally:
+        _deleting_users.reset(token)
+
+
+def user_deleting(user_id):
+    """Si el borrado del usuario esta en curso"""
+    return user_id in _deleting_users.get()
+
+
+def since(user_id, seq, limit, using):
+    """
+    Entradas posteriores a `seq` en orden, hasta `limit`, y si hay mas.
+    Con `seq` 0 el registro equivale a una copia completa.
+    """
+    sequence = ChangeSequence.objects.using(using).filter(user_id=user_id) \
+        .values_list('compacted_seq', flat=True).first()
+    if seq and sequence is not None and seq < sequence:
+        raise ChangesCompacted
+    entries = list(
+        ChangeLogEntry.objects.using(using)
+        .filter(user_id=user_id, seq__gt=seq).order_by('seq')
+        .only('seq', 'kind', 'object_id', 'deleted')[:limit + 1]
+    )
+    return entries[:limit], len(entries) > limit
+
+
+def rebuild(using, user_ids=None):
+    """
+    Reemplaza el registro de los usuarios por una entrada por cada objeto
+    vivo. Los clientes con una secuencia anterior sincronizan desde cero.
+    Sin `user_ids` reconstruye todos los usuarios de la base.
+    """
+    if user_ids is None:
+        user_ids = set()
+        for model in KINDS.values():
+            user_ids.update(model.objects.using(using).order_by()
+                            .values_list('user_id', flat=True).distinct())
+    for user_id in sorted(user_ids):
+        with transaction.atomic(using=using):
+            ChangeLogEntry.objects.using(using).filter(user_id=user_id) \
+                ._raw_delete(using)
+            items = [
+                (kind, object_id, False)
+                for kind, model in KINDS.items()
+                for object_id in model.objects.using(using)
+                .filter(user_id=user_id).order_by('id')
+                .values_list('id', flat=True)
+            ]
+            write(user_id, items, using)
+            ChangeSequence.objects.using(using).filter(user_id=user_id) \
+                .update(compacted_seq=F('last_seq') - len(items))
+
+
+def compact(using, tombstone_seconds):
+    """
+    Borra las entradas que tienen una posterior del mismo objeto y los
+    tombstones mas viejos que `tombstone_seconds`. Regresa cuantas de cada
+    tipo se borraron.
+    """
+    entries = ChangeLogEntry.objects.using(using)
+    with transaction.atomic(using=using):
+        superseded = entries.filter(Exists(entries.filter(
+            user_id=OuterRef('user_id'), kind=OuterRef('kind'),
+            object_id=OuterRef('object_id'), seq__gt=OuterRef('seq'),
+        )))._raw_delete(using)
+
+        cutoff = timezone.now() - timedelta(seconds=tombstone_seconds)
+        old = entries.filter(deleted=True, created_at__lt=cutoff)
+        horizon = old.filter(user_id=OuterRef('user_id')).order_by() \
+            .values('user_id').annotate(seq=Max('seq')).values('seq')
+        ChangeSequence.objects.using(using).filter(
+            Exists(old.filter(user_id=OuterRef('user_id')))
+        ).update(compacted_seq=Greatest(F('compacted_seq'),
+                                        Subquery(horizon)))
+        tombstones = old._raw_delete(using)
+    return superseded, tombstones
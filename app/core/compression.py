@@ -0,0 +1,171 @@
+"""
+Compresion de las respuestas con gzip o brotli segun Accept-Encoding
+"""
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/msgpack',
+    'application/cbor',
+    'application/javascript',
+    'application/xml',
+    'application/vnd.oai.openapi',
+    'image/svg+xml',
+}
+
+
+def available_encodings():
+    """Codificaciones soportadas en orden de preferencia"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def accepted_encodings(header):
+    """Regresa {codificacion: q} del header Accept-Encoding"""
+    accepted = {}
+    for item in header.split(','):
+        name, *params = [part.strip() for part in item.split(';')]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.lower()] = quality
+    return accepted
+
+
+def choose_encoding(header):
+    """La codificacion preferida que acepta el cliente, o None"""
+    accepted = accepted_encodings(header)
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class GzipCompressor:
+    def __init__(self):
+        # wbits 31: deflate con encabezado y cola gzip
+        self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL,
+                                            zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(
+            quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def compressor(encoding):
+    return BrotliCompressor() if encoding == 'br' else GzipCompressor()
+
+
+def compress(data, encoding):
+    """Comprime un cuerpo completo"""
+    stream = compressor(encoding)
+    return stream.compress(data) + stream.finish()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Comprime un cuerpo en streaming. Cada parte se vacia al salir para que
+    el cliente la reciba sin esperar a la siguiente.
+    """
+    stream = compressor(encoding)
+    for chunk in chunks:
+        data = stream.compress(chunk) + stream.flush()
+        if data:
+            yield data
+    yield stream.finish()
+
+
+def is_compressible(response):
+    """Solo cuerpos de texto o datos que no vengan ya codificados"""
+    if response.has_header('Content-Encoding') or \
+            response.status_code in (204, 304) or response.status_code < 200:
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return content_type.startswith('text/') or \
+        content_type.endswith('+json') or content_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Comprime las respuestas con brotli (si esta instalado) o gzip. Los
+    cuerpos menores a COMPRESSION_MIN_SIZE se mandan tal cual; las
+    respuestas en streaming se comprimen por partes.
+    """
+
+    def __init__(self, get_response):
+        if not settings.COMPRESSION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING',
+                                                    ''))
+        if encoding is None:
+            return response
+
+        minimum = settings.COMPRESSION_MIN_SIZE
+        if response.streaming:
+            length = response.get('Content-Length')
+            if length and int(length) < minimum:
+                return response
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoding
+            )
+            del response['Content-Length']
+        else:
+            if len(response.content) < minimum:
+                return response
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # El cuerpo cambio: la ETag fuerte ya no le corresponde
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
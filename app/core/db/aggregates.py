@@ -0,0 +1,29 @@
+"""
+Agregados propios que funcionan en Postgres y en SQLite
+"""
+from django.db.models import Aggregate, TextField
+
+
+class IdList(Aggregate):
+    """
+    Junta los ids del grupo en una lista ordenada. Se concatena como texto
+    (GROUP_CONCAT en SQLite, STRING_AGG en Postgres) para no depender de
+    los arreglos de django.contrib.postgres.
+    """
+    function = 'GROUP_CONCAT'
+    name = 'IdList'
+    allow_distinct = True
+    output_field = TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, function='STRING_AGG',
+            template="%(function)s(%(distinct)sCAST(%(expressions)s AS text)"
+                     ", ',')",
+            **extra_context
+        )
+
+    def convert_value(self, value, expression, connection):
+        if not value:
+            return []
+        return sorted(int(item) for item in value.split(','))
@@ -0,0 +1,133 @@
+"""
+Backend de Postgres que reutiliza las conexiones desde un pool por proceso
+"""
+import functools
+import re
+
+import psycopg2.extras
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+from core.db.pool import PoolTimeout, close_pools, get_pool
+
+# Sentencias cuyo efecto dura mas que la transaccion: SET de sesion, tablas
+# temporales, prepared statements, LISTEN y locks consultivos de sesion
+SESSION_STATEMENT = re.compile(
+    r'^\s*(?:SET\s+(?!LOCAL\b|TRANSACTION\b|CONSTRAINTS\b)|RESET\b|'
+    r'CREATE\s+(?:(?:GLOBAL|LOCAL)\s+)?TEMP|PREPARE\b|LISTEN\b|DECLARE\b|'
+    r'LOAD\b)|\bpg_(?:try_)?advisory_lock|\bset_config\s*\(',
+    re.IGNORECASE,
+)
+
+
+def connect(params, isolation_level=None):
+    """
+    Abre una conexion como el backend de Postgres de Django, pero sin
+    depender de un DatabaseWrapper: el pool la comparten todos los hilos.
+    """
+    connection = base.Database.connect(**params)
+    if isolation_level is not None and \
+            isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection,
+                                           loads=lambda x: x)
+    return connection
+
+
+def reset_session(connection):
+    """
+    Deja la sesion como recien abierta antes de volver al pool: deshace la
+    transaccion pendiente y descarta SET, tablas temporales, prepared
+    statements y locks de sesion. Solo se llama si la sesion pudo cambiar.
+    """
+    if connection.info.transaction_status != \
+            extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    autocommit = connection.autocommit
+    # DISCARD ALL no puede correr dentro de un bloque de transaccion
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('DISCARD ALL')
+    finally:
+        connection.autocommit = autocommit
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Suelta las conexiones del pool antes de crear o borrar la db de tests"""
+
+    def _create_test_db(self, *args, **kwargs):
+        close_pools()
+        return super()._create_test_db(*args, **kwargs)
+
+    def _destroy_test_db(self, *args, **kwargs):
+        close_pools()
+        return super()._destroy_test_db(*args, **kwargs)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Igual al backend de Postgres, pero al cerrar la conexion la devuelve al
+    pool en lugar de terminar la sesion. Se configura con la llave POOL de
+    DATABASES: MAX_SIZE, TIMEOUT, MAX_LIFETIME y HEALTH_CHECK_AFTER.
+
+    La sesion se limpia al devolverla solo si quedo una transaccion abierta
+    o fallida o si corrio alguna sentencia de SESSION_STATEMENT; las demas
+    vuelven tal cual y la siguiente peticion no repite el SET TIME ZONE.
+    """
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session_dirty = False
+        self.execute_wrappers.append(self._track_session)
+
+    def _track_session(self, execute, sql, params, many, context):
+        """Marca la sesion si la sentencia dura mas que la transaccion"""
+        if not self._session_dirty and (
+                not isinstance(sql, str) or SESSION_STATEMENT.search(sql)):
+            self._session_dirty = True
+        return execute(sql, params, many, context)
+
+    @property
+    def pool(self):
+        settings_dict = self.settings_dict
+        key = (self.alias, settings_dict['HOST'], settings_dict['PORT'],
+               settings_dict['NAME'], settings_dict['USER'])
+        options = settings_dict.get('POOL', {})
+        return get_pool(
+            key,
+            functools.partial(
+                connect, self.get_connection_params(),
+                settings_dict['OPTIONS'].get('isolation_level'),
+            ),
+            alias=self.alias,
+            reset=reset_session,
+            max_size=options.get('MAX_SIZE', 4),
+            timeout=options.get('TIMEOUT', 5.0),
+            max_lifetime=options.get('MAX_LIFETIME', 1800.0),
+            health_check_after=options.get('HEALTH_CHECK_AFTER', 10.0),
+        )
+
+    def get_new_connection(self, conn_params):
+        self._pool = self.pool
+        try:
+            connection = self._pool.checkout()
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        self._session_dirty = False
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        broken = bool(self.connection.closed)
+        dirty = self._session_dirty or (
+            not broken and self.connection.info.transaction_status !=
+            extensions.TRANSACTION_STATUS_IDLE
+        )
+        self._session_dirty = False
+        self._pool.checkin(self.connection, broken=broken, dirty=dirty)
@@ -0,0 +1,212 @@
+"""
+Pool de conexiones por proceso para los backends de base de datos
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from core.metrics import DB_POOL_CONNECTIONS, DB_POOL_TIMEOUTS, DB_POOL_WAIT
+
+# Conexiones heredadas por un fork. No se cierran porque cerrar el socket
+# compartido terminaria la sesion del proceso padre; solo se conservan para
+# que el recolector de basura no las finalice.
+_inherited = []
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """No se libero ninguna conexion dentro del tiempo de espera"""
+
+
+class PooledConnection:
+    """Conexion cruda con sus marcas de tiempo"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+def ping(raw):
+    """Verifica que la conexion siga respondiendo"""
+    cursor = raw.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones crudas de DB-API.
+
+    Cada checkout reutiliza la conexion libre mas reciente, descartando las
+    que superaron `max_lifetime` y verificando con un ping las que llevan
+    mas de `health_check_after` segundos sin usarse. Si el pool esta lleno
+    se espera hasta `timeout` segundos a que se libere una. Al devolver una
+    sesion que pudo cambiar se llama a `reset` para limpiarla; si falla se
+    descarta.
+    """
+
+    def __init__(self, connect, alias='default', max_size=4, timeout=5.0,
+                 max_lifetime=1800.0, health_check_after=10.0, reset=None):
+        self.connect = connect
+        self.reset = reset
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._condition = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+
+    def _check_fork(self):
+        """Abandona las conexiones que vienen del proceso padre"""
+        if self.pid != os.getpid():
+            _inherited.extend(entry.raw for entry in self._idle)
+            _inherited.extend(entry.raw for entry in self._in_use.values())
+            self._reset()
+
+    def stats(self):
+        """Regresa el tamano del pool y cuantas conexiones estan libres"""
+        with self._condition:
+            self._check_fork()
+            return {'size': self._size, 'idle': len(self._idle),
+                    'in_use': len(self._in_use), 'max_size': self.max_size}
+
+    def checkout(self):
+        """Regresa una conexion sana, abriendo una nueva si hay lugar"""
+        started = time.monotonic()
+        while True:
+            entry = self._acquire(started)
+            if entry is None:
+                try:
+                    entry = PooledConnection(self.connect())
+                except BaseException:
+                    self._release_slot()
+                    raise
+                DB_POOL_CONNECTIONS.labels(self.alias, 'created').inc()
+            else:
+                reason = self._unhealthy_reason(entry)
+                if reason:
+                    self._discard(entry, reason)
+                    continue
+            with self._condition:
+                self._in_use[id(entry.raw)] = entry
+            DB_POOL_WAIT.labels(self.alias).observe(
+                time.monotonic() - started
+            )
+            return entry.raw
+
+    def _acquire(self, started):
+        """Toma una conexion libre o reserva lugar para una nueva"""
+        deadline = started + self.timeout
+        with self._condition:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    DB_POOL_TIMEOUTS.labels(self.alias).inc()
+                    raise PoolTimeout(
+                        f'No hay conexiones libres en el pool {self.alias} '
+                        f'despues de {self.timeout}s'
+                    )
+                self._condition.wait(remaining)
+
+    def _unhealthy_reason(self, entry):
+        now = time.monotonic()
+        if now - entry.created_at > self.max_lifetime:
+            return 'recycled'
+        if getattr(entry.raw, 'closed', False):
+            return 'unhealthy'
+        if now - entry.last_used > self.health_check_after:
+            try:
+                ping(entry.raw)
+            except Exception:
+                return 'unhealthy'
+        return None
+
+    def checkin(self, raw, broken=False, dirty=True):
+        """
+        Devuelve la conexion, descartandola si esta rota o vencida. Con
+        `dirty` en False la sesion quedo como se entrego y no se limpia.
+        """
+        with self._condition:
+            self._check_fork()
+            entry = self._in_use.pop(id(raw), None)
+        if entry is None:
+            # Se saco antes de un fork o de otro pool, no es nuestra.
+            return
+        if not broken and dirty and self.reset is not None:
+            try:
+                self.reset(raw)
+            except Exception:
+                broken = True
+        if broken:
+            self._discard(entry, 'broken')
+        elif time.monotonic() - entry.created_at > self.max_lifetime:
+            self._discard(entry, 'recycled')
+        else:
+            entry.last_used = time.monotonic()
+            with self._condition:
+                self._idle.append(entry)
+                self._condition.notify()
+
+    def _discard(self, entry, reason):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+        DB_POOL_CONNECTIONS.labels(self.alias, reason).inc()
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def close_idle(self):
+        """Cierra las conexiones libres, las que estan en uso siguen igual"""
+        with self._condition:
+            self._check_fork()
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._discard(entry, 'closed')
+
+
+def get_pool(key, connect, alias='default', **options):
+    """Regresa el pool del proceso para la base de datos `key`"""
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(connect, alias, **options)
+        return pool
+
+
+def close_pools():
+    """Cierra las conexiones libres de todos los pools"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Con os.fork el padre suelta sus conexiones libres antes de que el hijo
+    # las herede. uWSGI hace fork desde C, ahi lo cubre _check_fork.
+    os.register_at_fork(before=close_pools)
@@ -0,0 +1,98 @@
+"""
+Chequeos de salud para las sondas del orquestador
+"""
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+def check_database(connection):
+    """Mide la latencia de ida y vuelta a la base de datos"""
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return {'ok': True, 'latency_ms': (time.perf_counter() - started) * 1000}
+
+
+def check_pool(connection):
+    """
+    Regresa que tan ocupado esta el pool de conexiones del proceso. Sin el
+    backend con pool se mide contra max_connections del servidor.
+    """
+    pool = getattr(connection, 'pool', None)
+    if pool is not None:
+        stats = pool.stats()
+        # La conexion de la propia sonda no cuenta como carga
+        in_use = max(stats['in_use'] - (connection.connection is not None),
+                     0)
+        saturation = in_use / stats['max_size']
+        return {
+            'ok': saturation < settings.HEALTH_MAX_POOL_SATURATION,
+            'saturation': round(saturation, 3),
+            'in_use': in_use,
+            'idle': stats['idle'],
+            'max_size': stats['max_size'],
+        }
+    if connection.vendor != 'postgresql':
+        return {'ok': True, 'saturation': None}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT count(*), current_setting(%s)::int FROM pg_stat_activity',
+            ['max_connections']
+        )
+        used, maximum = cursor.fetchone()
+    saturation = used / maximum if maximum else 0
+    return {
+        'ok': saturation < settings.HEALTH_MAX_POOL_SATURATION,
+        'saturation': round(saturation, 3),
+        'connections': used,
+        'max_connections': maximum,
+    }
+
+
+def check_migrations(connection):
+    """Cuenta las migraciones pendientes de aplicar"""
+    executor = MigrationExecutor(connection)
+    targets = executor.loader.graph.leaf_nodes()
+    pending = executor.migration_plan(targets)
+    return {'ok': not pending, 'pending': len(pending)}
+
+
+def check_media():
+    """Verifica que el volumen de media acepte escrituras"""
+    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=settings.MEDIA_ROOT,
+                                     prefix='.readyz-'):
+        pass
+    return {'ok': True}
+
+
+CHECKS = [
+    ('database', check_database),
+    ('pool', check_pool),
+    ('migrations', check_migrations),
+]
+
+
+def readiness(using=DEFAULT_DB_ALIAS):
+    """Corre todos los chequeos y regresa (listo, detalle)"""
+    connection = connections[using]
+    results = {}
+    for name, check in CHECKS:
+        try:
+            results[name] = check(connection)
+        except Exception as exc:
+            results[name] = {'ok': False, 'error': str(exc)}
+            if name == 'database':
+                break
+    try:
+        results['media'] = check_media()
+    except OSError as exc:
+        results['media'] = {'ok': False, 'error': str(exc)}
+    ready = all(result['ok'] for result in results.values())
+    return ready, results
@@ -0,0 +1,339 @@
+"""
+Importacion en lote de recetas desde archivos CSV o JSONL
+"""
+import csv
+import io
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+
+from core import changes, pantry, sharding, similarity, stats
+from core.models import ImportJob, Ingredient, Recipe, Tag
+
+logger = logging.getLogger(__name__)
+
+# Separador de las listas de nombres en las columnas CSV
+LIST_SEPARATOR = ';'
+LOOKUP_CHUNK = 500
+
+
+class JobLost(Exception):
+    """Otro worker reclamo el trabajo por falta de latido"""
+
+
+class UserMovingError(Exception):
+    """Los datos del usuario se estan moviendo de shard"""
+
+
+class NamesField(serializers.ListField):
+    """Lista de nombres como lista JSON o texto separado por ';'"""
+    child = serializers.CharField(max_length=255)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [part.strip() for part in data.split(LIST_SEPARATOR)]
+        elif isinstance(data, list):
+            data = [item.get('name') if isinstance(item, dict) else item
+                    for item in data]
+        names = super().to_internal_value(
+            [name for name in data if name != '']
+        )
+        return list(dict.fromkeys(names))
+
+
+class RecipeRowSerializer(serializers.Serializer):
+    """Fila del archivo de importacion"""
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(allow_blank=True, required=False,
+                                        default='')
+    time_minutes = serializers.IntegerField(min_value=0)
+    price = serializers.DecimalField(max_digits=5, decimal_places=2)
+    link = serializers.CharField(max_length=255, allow_blank=True,
+                                 required=False, default='')
+    tags = NamesField(required=False, default=list)
+    ingredientes = NamesField(required=False, default=list)
+
+
+def detect_format(file_name):
+    """Formato por la extension del archivo, None si no se reconoce"""
+    name = file_name.lower()
+    if name.endswith('.csv'):
+        return ImportJob.CSV
+    if name.endswith(('.jsonl', '.ndjson')):
+        return ImportJob.JSONL
+    return None
+
+
+def read_rows(raw, file_format):
+    """
+    Itera (numero, fila) leyendo el archivo por partes. Las lineas JSON
+    invalidas se regresan como None para reportarlas como error de fila.
+    """
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == ImportJob.CSV:
+            yield from enumerate(csv.DictReader(text), start=1)
+            return
+        number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+    finally:
+        # El archivo lo cierra quien lo abrio
+        text.detach()
+
+
+def _chunks(values, size=LOOKUP_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def resolve_names(model, user_id, names, using):
+    """
+    Mapa nombre -> id de las categorias o ingredientes del usuario, creando
+    en lote los que no existen. Con nombres repetidos gana el id menor,
+    igual que el primero que encontraria get_or_create.
+    """
+    ids = {}
+    names = set(names)
+    manager = model.objects.using(using)
+
+    def lookup(chunk):
+        for pk, name in manager.filter(user_id=user_id, name__in=chunk) \
+                .order_by('-id').values_list('id', 'name'):
+            ids[name] = pk
+
+    for chunk in _chunks(names):
+        lookup(chunk)
+    missing = sorted(names - ids.keys())
+    if missing:
+        manager.bulk_create([model(user_id=user_id, name=name)
+                             for name in missing], batch_size=1000)
+        for chunk in _chunks(missing):
+            lookup(chunk)
+        changes.record(user_id, changes.MODEL_KINDS[model],
+                       [ids[name] for name in missing], using)
+    return ids
+
+
+def import_batch(user_id, rows, using):
+    """
+    Inserta las filas validas con consultas por conjunto: titulos
+    existentes, nombres de categorias e ingredientes, recetas y enlaces.
+    Regresa (ids de las recetas creadas, errores por fila).
+    """
+    errors = []
+    titles = set()
+    for chunk in _chunks({data['title'] for _, data in rows}):
+        titles.update(Recipe.objects.using(using).filter(title__in=chunk)
+                      .values_list('title', flat=True))
+    accepted = []
+    for number, data in rows:
+        if data['title'] in titles:
+            errors.append({'row': number, 'errors': {
+                'title': ['Ya existe una receta con este nombre']
+            }})
+            continue
+        titles.add(data['title'])
+        accepted.append(data)
+    if not accepted:
+        return [], errors
+
+    tag_ids = resolve_names(
+        Tag, user_id, {name for data in accepted for name in data['tags']},
+        using
+    )
+    ingredient_ids = resolve_names(
+        Ingredient, user_id,
+        {name for data in accepted for name in data['ingredientes']}, using
+    )
+    recipes = Recipe.objects.using(using).bulk_create([
+        Recipe(user_id=user_id, title=data['title'],
+               description=data['description'],
+               time_minutes=data['time_minutes'], price=data['price'],
+               link=data['link'])
+        for data in accepted
+    ], batch_size=1000)
+    recipe_ids = [recipe.pk for recipe in recipes]
+    if recipe_ids[0] is None:
+        # SQLite no regresa los ids del insert en lote; dentro de la
+        # transaccion nadie mas escribe y quedan consecutivos
+        recipe_ids = list(
+            Recipe.objects.using(using).filter(user_id=user_id)
+            .order_by('-id').values_list('id', flat=True)[:len(recipes)]
+        )[::-1]
+
+    tag_through = Recipe.tags.through
+    ingredient_through = Recipe.ingredientes.through
+    tag_through.objects.using(using).bulk_create([
+        tag_through(recipe_id=recipe_id, tag_id=tag_ids[name])
+        for recipe_id, data in zip(recipe_ids, accepted)
+        for name in data['tags']
+    ], batch_size=1000)
+    ingredient_through.objects.using(using).bulk_create([
+        ingredient_through(recipe_id=recipe_id,
+                           ingredient_id=ingredient_ids[name])
+        for recipe_id, data in zip(recipe_ids, accepted)
+        for name in data['ingredientes']
+    ], batch_size=1000)
+    # Los inserts en lote no disparan las senales
+    pantry.rebuild(using, recipe_ids)
+    similarity.update_recipes(recipe_ids, using)
+    changes.record(user_id, changes.RECIPE, recipe_ids, using)
+    return recipe_ids, errors
+
+
+def claim_job():
+    """
+    Toma el trabajo pendiente mas antiguo, o uno en proceso cuyo worker
+    dejo de dar latido. El UPDATE condicionado evita que dos workers tomen
+    el mismo trabajo.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.IMPORT_STALE_SECONDS)
+    candidates = ImportJob.objects.filter(
+        Q(status=ImportJob.PENDING) |
+        Q(status=ImportJob.RUNNING, heartbeat_at__lt=stale)
+    ).order_by('created_at', 'id').values_list('id', 'status',
+                                               'heartbeat_at')[:10]
+    for job_id, status, heartbeat in candidates:
+        claimed = ImportJob.objects.filter(
+            id=job_id, status=status, heartbeat_at=heartbeat
+        ).update(status=ImportJob.RUNNING, heartbeat_at=now,
+                 started_at=Coalesce('started_at', now))
+        if claimed:
+            return ImportJob.objects.get(id=job_id)
+    return None
+
+
+class JobRunner:
+    """Procesa un trabajo por lotes, cada lote en su transaccion"""
+
+    def __init__(self, job):
+        self.job = job
+        self.batch_size = settings.IMPORT_BATCH_SIZE
+        self.using = sharding.shard_for_user(job.user_id) or \
+            router.db_for_write(Recipe)
+
+    def run(self):
+        job = self.job
+        started = time.monotonic()
+        try:
+            self.check_owner()
+            with job.file.storage.open(job.file.name, 'rb') as stored:
+                self.process(stored.file)
+        except (UserMovingError, sharding.UserMoving):
+            self.save(status=ImportJob.PENDING, heartbeat_at=None)
+            return job
+        except JobLost:
+            logger.warning('Importacion %s tomada por otro worker', job.pk)
+            return job
+        except (UnicodeDecodeError, csv.Error, OSError) as exc:
+            self.finish(ImportJob.FAILED, f'Archivo invalido: {exc}')
+        except Exception as exc:
+            logger.exception('Fallo la importacion %s', job.pk)
+            self.finish(ImportJob.FAILED, str(exc))
+        else:
+            self.finish(ImportJob.DONE)
+            job.file.delete(save=False)
+        logger.info('Importacion %s: %s filas en %.1fs', job.pk,
+                    job.rows_processed, time.monotonic() - started)
+        return job
+
+    def check_owner(self):
+        if settings.DATABASE_SHARDS and \
+                sharding.assignment_for_user(self.job.user_id).moving:
+            raise UserMovingError
+
+    def process(self, raw):
+        skip = self.job.rows_processed
+        # Una sola instancia: crear un serializer por fila copia sus campos
+        serializer = RecipeRowSerializer()
+        batch, errors, count = [], [], 0
+        for number, row in read_rows(raw, self.job.format):
+            if number <= skip:
+                continue
+            count += 1
+            if row is None:
+                errors.append({'row': number,
+                               'errors': {'row': ['JSON invalido']}})
+            else:
+                try:
+                    batch.append((number, serializer.run_validation(row)))
+                except serializers.ValidationError as exc:
+                    errors.append({'row': number, 'errors': exc.detail})
+            if count >= self.batch_size:
+                self.flush(batch, errors, count, raw.tell())
+                batch, errors, count = [], [], 0
+        self.flush(batch, errors, count, raw.tell())
+
+    def flush(self, batch, errors, count, position):
+        """Guarda un lote y el avance del trabajo"""
+        if not count:
+            return
+        job = self.job
+        # El lock de escritura del usuario detiene un movimiento de shard
+        # hasta que el lote se confirme
+        with sharding.user_writes(job.user_id), \
+                transaction.atomic(using=self.using):
+            imported, duplicated = (
+                import_batch(job.user_id, batch, self.using) if batch
+                else ([], [])
+            )
+            errors = sorted(errors + duplicated, key=lambda e: e['row'])
+            room = settings.IMPORT_MAX_ERRORS - len(job.errors)
+            self.save(
+                rows_processed=job.rows_processed + count,
+                rows_imported=job.rows_imported + len(imported),
+                rows_failed=job.rows_failed + len(errors),
+                errors=job.errors + errors[:max(room, 0)],
+                bytes_processed=position,
+            )
+
+    def save(self, **fields):
+        """
+        Actualiza el trabajo solo si este worker sigue siendo el duenio
+        (su ultimo latido no cambio).
+        """
+        job = self.job
+        fields.setdefault('heartbeat_at', timezone.now())
+        updated = ImportJob.objects.filter(
+            id=job.pk, heartbeat_at=job.heartbeat_at
+        ).update(**fields)
+        if not updated:
+            raise JobLost
+        for name, value in fields.items():
+            setattr(job, name, value)
+
+    def finish(self, status, error=''):
+        now = timezone.now()
+        try:
+            self.save(status=status, error=error, finished_at=now,
+                      heartbeat_at=now)
+        except JobLost:
+            return
+        # Las estadisticas se reconstruyen una vez al final, no por lote
+        stats.rebuild(self.using, [self.job.user_id])
+
+
+def process_next():
+    """Procesa el siguiente trabajo, regresa None si no habia ninguno"""
+    job = claim_job()
+    if job is None:
+        return None
+    return JobRunner(job).run()
@@ -0,0 +1,87 @@
+"""
+Comando que corre los benchmarks de rendimiento
+"""
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from benchmarks.runner import compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    """Corre los benchmarks en una base de datos de pruebas"""
+    help = 'Mide tiempo, memoria y consultas de serializers, querysets y ' \
+           'vistas; compara contra una corrida base'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help='Benchmarks a correr (todos por defecto)')
+        parser.add_argument('--tag', action='append', dest='tags',
+                            help='Solo corre los benchmarks con esta etiqueta')
+        parser.add_argument('--sizes',
+                            help='Tamanos a correr separados por coma')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Archivo JSON de resultados')
+        parser.add_argument('--baseline',
+                            help='Resultados JSON contra los que comparar')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Aumento relativo tolerado (0.2 = 20%%)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reutiliza la base de datos de pruebas')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        sizes = None
+        if options['sizes']:
+            sizes = {int(size) for size in options['sizes'].split(',')}
+
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options['keepdb'],
+            aliases={'default'},
+        )
+        try:
+            self.stdout.write(f'Base de datos: {connection.vendor}')
+            results = run_benchmarks(
+                names=options['names'], sizes=sizes,
+                repeat=options['repeat'], tags=options['tags'],
+                report=self._report,
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0,
+                               keepdb=options['keepdb'])
+
+        document = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(document, output, indent=2, sort_keys=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                previous = json.load(baseline)['results']
+            regressions = compare_results(results, previous,
+                                          options['threshold'])
+            if regressions:
+                raise CommandError(
+                    'Regresiones de rendimiento:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('Sin regresiones'))
+
+    def _report(self, name, result):
+        line = f'{name:<45} {result["median_ms"]:>10.2f} ms  ' \
+            f'{result["queries"]:>6} consultas  ' \
+            f'{result["peak_kb"]:>10.1f} KiB'
+        if 'bytes' in result:
+            line += f'  {result["bytes"]:>10} bytes'
+        self.stdout.write(line)
@@ -0,0 +1,25 @@
+"""
+Comando que precalcula el schema OpenAPI
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import translation
+
+from core.schema import generate_schema, write_schema
+
+
+class Command(BaseCommand):
+    """Genera el schema una vez para que la api no lo regenere"""
+    help = 'Genera el schema OpenAPI y lo guarda en SCHEMA_CACHE_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--api-version', default=None)
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        if not settings.SCHEMA_CACHE_DIR:
+            raise CommandError('SCHEMA_CACHE_DIR no esta configurado')
+        language = translation.get_language()
+        schema = generate_schema(options['api_version'])
+        path = write_schema(schema, options['api_version'], language)
+        self.stdout.write(self.style.SUCCESS(f'Schema guardado en {path}'))
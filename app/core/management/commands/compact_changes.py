@@ -0,0 +1,52 @@
+"""
+Comando que compacta el registro de cambios de la sincronizacion
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+
+from core import changes
+
+
+class Command(BaseCommand):
+    """
+    Deja una entrada por objeto y borra los tombstones viejos. Se corre
+    periodicamente, con cron o con --interval.
+    """
+    help = 'Compacta el registro de cambios de recetas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tombstone-seconds', type=int,
+            default=settings.CHANGES_TOMBSTONE_SECONDS,
+            help='Antiguedad a partir de la cual se borran los tombstones'
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='Repite la compactacion cada tantos segundos'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        try:
+            while True:
+                close_old_connections()
+                self.compact(options['tombstone_seconds'])
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Compactacion detenida')
+
+    def compact(self, tombstone_seconds):
+        for using in settings.DATABASE_SHARDS or [DEFAULT_DB_ALIAS]:
+            started = time.monotonic()
+            superseded, tombstones = changes.compact(using,
+                                                     tombstone_seconds)
+            self.stdout.write(
+                f'{using}: {superseded} entradas reemplazadas, '
+                f'{tombstones} tombstones en '
+                f'{time.monotonic() - started:.2f}s'
+            )
@@ -0,0 +1,173 @@
+"""
+Comando que elimina las imagenes sin referencias del MEDIA_ROOT
+"""
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import ImageBlob, Recipe
+
+UPLOADS_DIR = os.path.join('uploads', 'recipe')
+
+
+def _key(name):
+    return tuple(name.split('/'))
+
+
+def iter_media_files(root, relative, after=None):
+    """
+    Recorre el directorio con os.scandir en orden estable.
+
+    Los directorios que quedan completos antes del checkpoint `after` no se
+    vuelven a abrir, asi que reanudar no cuesta un recorrido completo.
+    """
+    after_key = _key(after) if after else None
+    try:
+        with os.scandir(os.path.join(root, relative)) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        name = f'{relative}/{entry.name}'
+        key = _key(name)
+        if entry.is_dir(follow_symlinks=False):
+            if after_key and after_key[:len(key)] > key:
+                continue
+            inner_after = after if after_key and after_key[:len(key)] == key \
+                else None
+            yield from iter_media_files(root, name, inner_after)
+        elif entry.is_file(follow_symlinks=False):
+            if after_key and key <= after_key:
+                continue
+            yield name, entry
+
+
+class Command(BaseCommand):
+    """Comando que recolecta las imagenes huerfanas por lotes"""
+    help = 'Elimina imagenes de recetas que ya no tienen referencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Archivos revisados por consulta IN'
+        )
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Edad minima de un archivo para poder borrarlo'
+        )
+        parser.add_argument(
+            '--max-files', type=int, default=0,
+            help='Archivos a revisar en esta corrida (0 = todos)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.MEDIA_ROOT, '.gc_media.json'),
+            help='Archivo donde se guarda el avance para reanudar'
+        )
+        parser.add_argument('--reset', action='store_true',
+                            help='Ignora el checkpoint y empieza de cero')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo reporta lo que se borraria')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        checkpoint_path = options['checkpoint']
+        state = {'last': None, 'scanned': 0, 'deleted': 0, 'bytes': 0}
+        if not options['reset'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint:
+                state.update(json.load(checkpoint))
+            self.stdout.write(f'Reanudando despues de {state["last"]}')
+
+        cutoff = time.time() - options['grace_hours'] * 3600
+        stats = {'scanned': 0, 'referenced': 0, 'recent': 0,
+                 'deleted': 0, 'bytes': 0}
+        started = time.monotonic()
+        files = iter_media_files(settings.MEDIA_ROOT, UPLOADS_DIR,
+                                 state['last'])
+        finished = True
+        batch = []
+        for name, entry in files:
+            batch.append((name, entry))
+            if len(batch) >= options['batch_size']:
+                self._collect(batch, cutoff, stats, options['dry_run'])
+                state['last'] = batch[-1][0]
+                batch = []
+                if not options['dry_run']:
+                    self._save_checkpoint(checkpoint_path, state, stats)
+                if options['max_files'] and \
+                        stats['scanned'] >= options['max_files']:
+                    finished = False
+                    break
+        if batch:
+            self._collect(batch, cutoff, stats, options['dry_run'])
+
+        if not options['dry_run']:
+            if finished and os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+        self._report(stats, time.monotonic() - started, finished,
+                     options['dry_run'])
+
+    def _collect(self, batch, cutoff, stats, dry_run):
+        """Revisa un lote con una sola consulta y borra los huerfanos"""
+        names = [name for name, _ in batch]
+        referenced = set(
+            Recipe.objects.filter(image__in=names)
+            .values_list('image', flat=True)
+        )
+        referenced.update(
+            ImageBlob.objects.filter(name__in=names, ref_count__gt=0)
+            .values_list('name', flat=True)
+        )
+        deleted = []
+        for name, entry in batch:
+            stats['scanned'] += 1
+            if name in referenced:
+                stats['referenced'] += 1
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                stats['recent'] += 1
+                continue
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            deleted.append(name)
+            stats['deleted'] += 1
+            stats['bytes'] += stat.st_size
+        if deleted and not dry_run:
+            ImageBlob.objects.filter(name__in=deleted, ref_count=0).delete()
+
+    def _save_checkpoint(self, path, state, stats):
+        """Guarda el avance de forma atomica"""
+        data = dict(state)
+        data['scanned'] += stats['scanned']
+        data['deleted'] += stats['deleted']
+        data['bytes'] += stats['bytes']
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump(data, checkpoint)
+        os.replace(tmp_path, path)
+
+    def _report(self, stats, elapsed, finished, dry_run):
+        """Muestra el resumen y el throughput de la corrida"""
+        rate = stats['scanned'] / elapsed if elapsed else 0
+        verb = 'Se borrarian' if dry_run else 'Borrados'
+        self.stdout.write(
+            f'Revisados {stats["scanned"]} archivos en {elapsed:.2f}s '
+            f'({rate:.0f} archivos/s)'
+        )
+        self.stdout.write(
+            f'Con referencia: {stats["referenced"]}, '
+            f'dentro del periodo de gracia: {stats["recent"]}'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: {stats["deleted"]} archivos '
+            f'({stats["bytes"]} bytes)'
+        ))
+        if not finished:
+            self.stdout.write('Recorrido incompleto, se reanudara despues')
@@ -0,0 +1,337 @@
+"""
+Comando que genera un dataset sintetico para pruebas de carga
+"""
+import bisect
+import copy
+import csv
+import io
+import itertools
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, \
+    transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core import changes, pantry, sharding, stats
+from core.models import Ingredient, Recipe, ShardAssignment, Tag
+
+PASSWORD = 'loadtest.1234'
+TABLES = ('users', 'assignments', 'tags', 'ingredients', 'recipes',
+          'recipe_tags', 'recipe_ingredients')
+
+
+def data_aliases():
+    """Bases donde viven las recetas: los shards o default"""
+    return list(settings.DATABASE_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def user_alias(user_id):
+    """Base de los datos del usuario, el shard que le daria el anillo"""
+    if not settings.DATABASE_SHARDS:
+        return DEFAULT_DB_ALIAS
+    return sharding.ring().get(user_id)
+
+
+class ZipfSampler:
+    """Muestrea indices 0..n-1 con popularidad proporcional a 1/rank^s"""
+
+    def __init__(self, size, exponent):
+        self.size = size
+        weights = [1 / (rank ** exponent) for rank in range(1, size + 1)]
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def sample(self, rng, count):
+        """Regresa `count` indices distintos"""
+        count = min(count, self.size)
+        total = self.cumulative[-1]
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(bisect.bisect(self.cumulative, rng.random() * total))
+        return sorted(chosen)
+
+
+class Plan:
+    """Rangos de ids disjuntos para cada usuario generado"""
+
+    def __init__(self, options, bases):
+        self.options = options
+        self.bases = bases
+        self.per_user, self.remainder = divmod(options['recipes'],
+                                               options['users'])
+
+    def recipe_offset(self, index):
+        return index * self.per_user + min(index, self.remainder)
+
+    def recipe_count(self, index):
+        return self.per_user + (1 if index < self.remainder else 0)
+
+    def chunks(self, workers):
+        """Divide los usuarios en rangos contiguos por worker"""
+        users = self.options['users']
+        size = -(-users // workers)
+        return [(start, min(start + size, users))
+                for start in range(0, users, size)]
+
+
+class RowWriter:
+    """Escribe filas con COPY en Postgres o bulk_create en otros motores"""
+
+    def __init__(self, use_copy, batch_size):
+        self.use_copy = use_copy
+        self.batch_size = batch_size
+        self.counts = {}
+
+    def write(self, model, objects, alias, include_pk=True):
+        if not objects:
+            return
+        fields = [field for field in model._meta.concrete_fields
+                  if include_pk or not field.primary_key]
+        connection = connections[alias]
+        if self.use_copy and connection.vendor == 'postgresql':
+            self._copy(connection, model, objects, fields)
+        else:
+            model.objects.using(alias).bulk_create(
+                objects, batch_size=self.batch_size
+            )
+        label = model._meta.db_table
+        self.counts[label] = self.counts.get(label, 0) + len(objects)
+
+    def _copy(self, connection, model, objects, fields):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objects:
+            writer.writerow([
+                '\\N' if value is None else value
+                for value in (getattr(obj, field.attname) for field in fields)
+            ])
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote(model._meta.db_table)} ({columns}) '
+                "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+
+
+def build_user(plan, index, password_hash, rows):
+    """
+    Genera las filas de un usuario de forma determinista. El usuario va a
+    default y sus datos a su shard, con su asignacion y la copia del
+    usuario que piden las llaves foraneas.
+    """
+    options = plan.options
+    bases = plan.bases
+    rng = random.Random(f'{options["seed"]}:{index}')
+    user_id = bases['user'] + index
+    user = get_user_model()(
+        id=user_id,
+        email=f'load-{options["seed"]}-{index}@example.com',
+        name=f'Usuario {index}',
+        password=password_hash,
+    )
+    rows[DEFAULT_DB_ALIAS]['users'].append(user)
+    alias = user_alias(user_id)
+    writer_rows = rows[alias]
+    if alias != DEFAULT_DB_ALIAS:
+        rows[DEFAULT_DB_ALIAS]['assignments'].append(ShardAssignment(
+            user_id=user_id, shard=alias, updated_at=timezone.now()
+        ))
+        writer_rows['users'].append(copy.copy(user))
+
+    tag_base = bases['tag'] + index * options['tags']
+    ingredient_base = bases['ingredient'] + index * options['ingredients']
+    writer_rows['tags'].extend(
+        Tag(id=tag_base + rank, user_id=user_id, name=f'tag {rank}')
+        for rank in range(options['tags'])
+    )
+    writer_rows['ingredients'].extend(
+        Ingredient(id=ingredient_base + rank, user_id=user_id,
+                   name=f'ingrediente {rank}')
+        for rank in range(options['ingredients'])
+    )
+
+    recipe_base = bases['recipe'] + plan.recipe_offset(index)
+    tag_through = Recipe.tags.through
+    ingredient_through = Recipe.ingredientes.through
+    for offset in range(plan.recipe_count(index)):
+        recipe_id = recipe_base + offset
+        writer_rows['recipes'].append(Recipe(
+            id=recipe_id,
+            user_id=user_id,
+            title=f'Receta {recipe_id}',
+            description='',
+            time_minutes=int(rng.lognormvariate(3.4, 0.6)) + 1,
+            price=Decimal(rng.randint(50, 99999)) / 100,
+            link='',
+        ))
+        for rank in options['tag_sampler'].sample(
+                rng, options['tags_per_recipe']):
+            writer_rows['recipe_tags'].append(
+                tag_through(recipe_id=recipe_id, tag_id=tag_base + rank)
+            )
+        for rank in options['ingredient_sampler'].sample(
+                rng, options['ingredients_per_recipe']):
+            writer_rows['recipe_ingredients'].append(ingredient_through(
+                recipe_id=recipe_id, ingredient_id=ingredient_base + rank
+            ))
+
+
+def generate_range(plan, start, end, password_hash):
+    """Genera e inserta los usuarios [start, end) por lotes"""
+    writer = RowWriter(plan.options['copy'], plan.options['batch_size'])
+    chunk = plan.options['users_per_chunk']
+    aliases = [DEFAULT_DB_ALIAS] + [alias for alias in data_aliases()
+                                    if alias != DEFAULT_DB_ALIAS]
+    for chunk_start in range(start, end, chunk):
+        rows = {alias: {name: [] for name in TABLES} for alias in aliases}
+        for index in range(chunk_start, min(chunk_start + chunk, end)):
+            build_user(plan, index, password_hash, rows)
+        # Los usuarios entran antes a default que a su shard
+        for alias in aliases:
+            alias_rows = rows[alias]
+            with transaction.atomic(using=alias):
+                writer.write(get_user_model(), alias_rows['users'], alias)
+                writer.write(ShardAssignment, alias_rows['assignments'],
+                             alias)
+                writer.write(Tag, alias_rows['tags'], alias)
+                writer.write(Ingredient, alias_rows['ingredients'], alias)
+                writer.write(Recipe, alias_rows['recipes'], alias)
+                writer.write(Recipe.tags.through, alias_rows['recipe_tags'],
+                             alias, include_pk=False)
+                writer.write(Recipe.ingredientes.through,
+                             alias_rows['recipe_ingredients'], alias,
+                             include_pk=False)
+    return writer.counts
+
+
+def generate_in_worker(plan, start, end, password_hash):
+    """Corre un rango en un proceso hijo con conexiones propias"""
+    try:
+        return generate_range(plan, start, end, password_hash)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """Genera usuarios, recetas, categorias e ingredientes por lotes"""
+    help = 'Genera un dataset sintetico determinista para pruebas de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=100000,
+                            help='Total de recetas repartidas por usuario')
+        parser.add_argument('--tags', type=int, default=40,
+                            help='Categorias por usuario')
+        parser.add_argument('--ingredients', type=int, default=200,
+                            help='Ingredientes por usuario')
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Exponente de la distribucion de Zipf')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--users-per-chunk', type=int, default=200)
+        parser.add_argument('--no-copy', dest='copy', action='store_false',
+                            help='Usa bulk_create aun en Postgres')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        started = time.monotonic()
+        options['tag_sampler'] = ZipfSampler(options['tags'], options['zipf'])
+        options['ingredient_sampler'] = ZipfSampler(options['ingredients'],
+                                                    options['zipf'])
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write('SQLite no admite escrituras concurrentes, '
+                              'se usara un solo worker')
+            workers = 1
+
+        config = {key: options[key] for key in (
+            'users', 'recipes', 'tags', 'ingredients', 'tags_per_recipe',
+            'ingredients_per_recipe', 'seed', 'batch_size',
+            'users_per_chunk', 'copy', 'tag_sampler', 'ingredient_sampler',
+        )}
+        plan = Plan(config, self._id_bases())
+        # El hash se calcula una sola vez, con sal fija para que el dataset
+        # sea reproducible.
+        password_hash = make_password(PASSWORD, salt=f'seed{options["seed"]}')
+        ranges = plan.chunks(workers)
+
+        totals = {}
+        if workers == 1:
+            results = [generate_range(plan, start, end, password_hash)
+                       for start, end in ranges]
+        else:
+            # Los hijos abren sus propias conexiones, no se comparten tras el
+            # fork.
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                futures = [
+                    pool.submit(generate_in_worker, plan, start, end,
+                                password_hash)
+                    for start, end in ranges
+                ]
+                results = [future.result() for future in futures]
+        for counts in results:
+            for table, count in counts.items():
+                totals[table] = totals.get(table, 0) + count
+
+        self._reset_sequences()
+        # Los inserts en lote no disparan las senales de las estadisticas
+        for alias in data_aliases():
+            stats.rebuild(alias)
+            pantry.rebuild(alias)
+            changes.rebuild(alias)
+        elapsed = time.monotonic() - started
+        for table, count in totals.items():
+            self.stdout.write(f'{table:<30} {count:>12} filas')
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows} filas en {elapsed:.1f}s ({rows / elapsed:,.0f} filas/s) '
+            f'con {workers} worker(s)'
+        ))
+
+    def _id_bases(self):
+        """
+        Primer id libre de cada tabla, los workers parten de aqui. Los ids
+        de los datos son unicos entre todos los shards.
+        """
+        bases = {'user': self._max_id(get_user_model(),
+                                      [DEFAULT_DB_ALIAS]) + 1}
+        for key, model in (('tag', Tag), ('ingredient', Ingredient),
+                           ('recipe', Recipe)):
+            bases[key] = self._max_id(model, data_aliases()) + 1
+        return bases
+
+    def _max_id(self, model, aliases):
+        return max(model.objects.using(alias).aggregate(Max('id'))['id__max']
+                   or 0 for alias in aliases)
+
+    def _reset_sequences(self):
+        """
+        Ajusta las secuencias despues de insertar ids explicitos. Los shards
+        vuelven a su clase de ids modulo SHARD_ID_STRIDE.
+        """
+        models = [get_user_model()]
+        if not settings.DATABASE_SHARDS:
+            models += [Tag, Ingredient, Recipe]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        for alias in settings.DATABASE_SHARDS:
+            sharding.configure_sequences(alias)
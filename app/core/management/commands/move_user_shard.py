@@ -0,0 +1,167 @@
+"""
+Comando que mueve los datos de un usuario a otro shard sin detener la api
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from core.models import ChangeLogEntry, ChangeSequence, Ingredient, \
+    Recipe, RecipeIngredientCount, RecipeLSHBucket, RecipeSignature, \
+    RecipeStats, RecipeTimeBucket, ShardAssignment, Tag, TagUsage
+from core.sharding import assignment_for_user, configure_sequences, \
+    copy_user, ring, write_lock
+
+BATCH_SIZE = 1000
+
+
+def user_querysets(user_id, alias):
+    """Filas del usuario en el orden en que se deben copiar"""
+    return [
+        Tag.objects.using(alias).filter(user_id=user_id),
+        Ingredient.objects.using(alias).filter(user_id=user_id),
+        Recipe.objects.using(alias).filter(user_id=user_id),
+        Recipe.tags.through.objects.using(alias)
+        .filter(recipe__user_id=user_id),
+        Recipe.ingredientes.through.objects.using(alias)
+        .filter(recipe__user_id=user_id),
+        RecipeStats.objects.using(alias).filter(user_id=user_id),
+        RecipeTimeBucket.objects.using(alias).filter(user_id=user_id),
+        TagUsage.objects.using(alias).filter(user_id=user_id),
+        RecipeSignature.objects.using(alias).filter(user_id=user_id),
+        RecipeLSHBucket.objects.using(alias).filter(user_id=user_id),
+        RecipeIngredientCount.objects.using(alias).filter(user_id=user_id),
+        ChangeSequence.objects.using(alias).filter(user_id=user_id),
+        ChangeLogEntry.objects.using(alias).filter(user_id=user_id),
+    ]
+
+
+def copy_user_data(user, source, target):
+    """
+    Copia las filas conservando sus ids, regresa cuantas por tabla.
+
+    Los shards generan ids en clases disjuntas (configure_sequences), asi
+    que no chocan con los del destino. Si aun asi un id existe, por filas
+    creadas antes de configurar las secuencias, la transaccion se revierte
+    completa.
+    """
+    counts = {}
+    copy_user(user, target)
+    try:
+        with transaction.atomic(using=target):
+            for queryset in user_querysets(user.pk, source):
+                model = queryset.model
+                batch = []
+                count = 0
+                for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+                    batch.append(obj)
+                    if len(batch) >= BATCH_SIZE:
+                        model.objects.using(target).bulk_create(batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    model.objects.using(target).bulk_create(batch)
+                    count += len(batch)
+                counts[model._meta.db_table] = count
+            configure_sequences(target)
+    except IntegrityError as exc:
+        raise CommandError(f'Ids en conflicto en {target}: {exc}')
+    return counts
+
+
+def delete_user_data(user_id, alias):
+    """
+    Borra las filas del shard de origen. Se usa _raw_delete para no disparar
+    las senales de las recetas: sus imagenes siguen referenciadas desde el
+    shard nuevo.
+    """
+    with transaction.atomic(using=alias):
+        for queryset in reversed(user_querysets(user_id, alias)):
+            queryset._raw_delete(alias)
+
+
+class Command(BaseCommand):
+    """
+    Mueve un usuario en tres pasos: marca la asignacion como en movimiento
+    (la api sigue leyendo del origen y rechaza sus escrituras), copia las
+    filas al destino y cambia la asignacion. Al final borra el origen.
+
+    Marcar el movimiento toma exclusivo el lock de escritura del usuario:
+    espera a que terminen las escrituras que ya habian pasado la revision,
+    para que ninguna confirme en el origen despues de la copia.
+    """
+    help = 'Mueve recetas, categorias e ingredientes de un usuario de shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', nargs='?',
+                            help='Email o id del usuario a mover')
+        parser.add_argument('shard', nargs='?', help='Shard de destino')
+        parser.add_argument(
+            '--plan', action='store_true',
+            help='Lista los usuarios cuyo shard difiere del anillo actual'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        if not settings.DATABASE_SHARDS:
+            raise CommandError('No hay shards configurados')
+        if options['plan']:
+            return self.plan()
+        if not options['user'] or not options['shard']:
+            raise CommandError('Indica el usuario y el shard de destino')
+        target = options['shard']
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(f'{target} no es un shard configurado')
+
+        user = self.get_user(options['user'])
+        assignment = assignment_for_user(user.pk)
+        source = assignment.shard
+        if assignment.moving:
+            raise CommandError(f'{user} ya se esta moviendo')
+        if source == target:
+            raise CommandError(f'{user} ya esta en {target}')
+
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            write_lock(user.pk, exclusive=True)
+            self.set_assignment(user, source, moving=True)
+        try:
+            counts = copy_user_data(user, source, target)
+        except BaseException:
+            self.set_assignment(user, source, moving=False)
+            raise
+        self.set_assignment(user, target, moving=False)
+        delete_user_data(user.pk, source)
+
+        for table, count in counts.items():
+            self.stdout.write(f'{table:<30} {count:>8} filas')
+        self.stdout.write(self.style.SUCCESS(
+            f'{user} movido de {source} a {target}'
+        ))
+
+    def get_user(self, value):
+        users = get_user_model().objects.using(DEFAULT_DB_ALIAS)
+        lookup = {'pk': value} if value.isdigit() else {'email': value}
+        try:
+            return users.get(**lookup)
+        except users.model.DoesNotExist:
+            raise CommandError(f'No existe el usuario {value}')
+
+    def set_assignment(self, user, shard, moving):
+        ShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            user=user, defaults={'shard': shard, 'moving': moving}
+        )
+
+    def plan(self):
+        """Muestra los movimientos que dejarian a cada usuario en su nodo"""
+        current = ring()
+        assignments = ShardAssignment.objects.using(DEFAULT_DB_ALIAS) \
+            .order_by('user_id')
+        moves = 0
+        for assignment in assignments.iterator():
+            expected = current.get(assignment.user_id)
+            if expected != assignment.shard:
+                moves += 1
+                self.stdout.write(
+                    f'{assignment.user_id} {assignment.shard} -> {expected}'
+                )
+        self.stdout.write(f'{moves} usuario(s) por mover')
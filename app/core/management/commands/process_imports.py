@@ -0,0 +1,50 @@
+"""
+Worker que procesa las importaciones de recetas pendientes
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import imports
+from core.models import ImportJob
+
+
+class Command(BaseCommand):
+    """
+    Toma los trabajos de la tabla de importaciones, sin broker externo. Se
+    pueden correr varios workers: cada trabajo se reclama con un UPDATE
+    condicionado.
+    """
+    help = 'Procesa las importaciones de recetas en segundo plano'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Procesa los trabajos pendientes y termina'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2.0,
+            help='Segundos de espera cuando no hay trabajos'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        try:
+            while True:
+                close_old_connections()
+                job = imports.process_next()
+                # Un trabajo devuelto a pendiente espera a que su usuario
+                # termine de moverse de shard
+                if job is not None and job.status != ImportJob.PENDING:
+                    self.stdout.write(
+                        f'Importacion {job.pk}: {job.status}, '
+                        f'{job.rows_imported} recetas, '
+                        f'{job.rows_failed} filas con error'
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido')
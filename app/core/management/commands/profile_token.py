@@ -0,0 +1,29 @@
+"""
+Comando que genera un token para perfilar peticiones
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    """Firma un token para el header X-Profile"""
+    help = 'Genera un token para perfilar peticiones con el header X-Profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('staff_email',
+                            help='Email del staff que emite el token')
+        parser.add_argument('--user',
+                            help='Solo perfila las peticiones de este email')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        users = get_user_model().objects
+        try:
+            staff = users.get(email=options['staff_email'], is_staff=True)
+            user = users.get(email=options['user']) if options['user'] \
+                else None
+        except get_user_model().DoesNotExist:
+            raise CommandError('Usuario no encontrado o sin permisos de staff')
+        self.stdout.write(make_token(staff, user))
@@ -0,0 +1,59 @@
+"""
+Comando que resume el log de consultas lentas y repetidas
+"""
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Agrupa los eventos del log por origen y forma de la consulta"""
+    help = 'Resume el log de consultas lentas y repetidas por call-site'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.QUERY_LOG_FILE,
+                            help='Archivo JSONL del log de consultas')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Cantidad de grupos a mostrar por evento')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        if not options['file']:
+            raise CommandError('Indique --file o configure QUERY_LOG_FILE')
+        groups = {}
+        with open(options['file']) as log_file:
+            for line in log_file:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                key = (event.get('event'), event.get('callsite'),
+                       event.get('sql'))
+                group = groups.setdefault(key, {
+                    'events': 0, 'queries': 0, 'ms': 0.0, 'max_ms': 0.0,
+                    'views': set(),
+                })
+                group['events'] += 1
+                group['queries'] += event.get('count', 1)
+                group['ms'] += event.get('ms', 0)
+                group['max_ms'] = max(group['max_ms'], event.get('ms', 0))
+                group['views'].add(event.get('view'))
+
+        for event_name in ('slow_query', 'repeated_query'):
+            ranked = sorted(
+                ((key, group) for key, group in groups.items()
+                 if key[0] == event_name),
+                key=lambda item: -item[1]['ms'],
+            )[:options['top']]
+            self.stdout.write(self.style.MIGRATE_HEADING(event_name))
+            for (_, callsite, sql), group in ranked:
+                self.stdout.write(
+                    f'{group["ms"]:>12.1f} ms total  '
+                    f'{group["max_ms"]:>9.1f} ms max  '
+                    f'{group["events"]:>6} eventos  '
+                    f'{group["queries"]:>7} consultas  {callsite}'
+                )
+                views = ', '.join(sorted(map(str, group['views'])))
+                self.stdout.write(f'    vistas: {views}')
+                self.stdout.write(f'    {sql[:200]}')
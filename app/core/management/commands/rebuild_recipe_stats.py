@@ -0,0 +1,39 @@
+"""
+Comando que reconstruye las estadisticas de recetas desde cero
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core import stats
+from core.sharding import shard_for_user
+
+
+class Command(BaseCommand):
+    """Recalcula resumenes, histogramas y uso de categorias"""
+    help = 'Reconstruye las estadisticas de recetas de uno o todos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email del usuario a reconstruir')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        started = time.monotonic()
+        if options['user']:
+            try:
+                user = get_user_model().objects.using(DEFAULT_DB_ALIAS) \
+                    .get(email=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'No existe el usuario {options["user"]}')
+            using = shard_for_user(user.pk) or DEFAULT_DB_ALIAS
+            stats.rebuild(using, [user.pk])
+        else:
+            for using in settings.DATABASE_SHARDS or [DEFAULT_DB_ALIAS]:
+                stats.rebuild(using)
+        self.stdout.write(self.style.SUCCESS(
+            f'Estadisticas reconstruidas en '
+            f'{time.monotonic() - started:.2f}s'
+        ))
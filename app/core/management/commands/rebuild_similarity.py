@@ -0,0 +1,43 @@
+"""
+Comando que recalcula las firmas MinHash y el indice LSH
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from core import similarity
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Recalcula las firmas de todas las recetas por lotes vectorizados"""
+    help = 'Reconstruye las firmas e indice de recetas similares'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=similarity.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        started = time.monotonic()
+        total = 0
+        batch_size = options['batch_size']
+        for using in settings.DATABASE_SHARDS or [DEFAULT_DB_ALIAS]:
+            ids = Recipe.objects.using(using).order_by('id') \
+                .values_list('id', flat=True)
+            batch = []
+            for recipe_id in ids.iterator(chunk_size=batch_size):
+                batch.append(recipe_id)
+                if len(batch) >= batch_size:
+                    similarity.update_recipes(batch, using)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                similarity.update_recipes(batch, using)
+                total += len(batch)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} recetas indexadas en {elapsed:.2f}s'
+        ))
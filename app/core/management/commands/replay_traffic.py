@@ -0,0 +1,88 @@
+"""
+Comando que reproduce una grabacion de trafico contra una instancia local
+"""
+import asyncio
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from core.traffic import load_tokens, read_entries, replay, summarize
+
+
+class Command(BaseCommand):
+    """Reproduce el trafico grabado y reporta latencias por endpoint"""
+    help = 'Reproduce una grabacion de TrafficRecorderMiddleware con ' \
+           'concurrencia y multiplicador de tasa configurables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('recording', help='Archivo JSONL grabado')
+        parser.add_argument('--target', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--rate', type=float, default=1.0,
+                            help='Multiplicador de la tasa grabada')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--tokens',
+                            help='JSON con el token de cada bucket de usuario')
+        parser.add_argument('--tokens-from-db', action='store_true',
+                            help='Asigna a cada bucket un usuario existente')
+        parser.add_argument('--output', help='Guarda el resumen en JSON')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        try:
+            entries = read_entries(options['recording'])
+            tokens = load_tokens(options['tokens']) if options['tokens'] \
+                else {}
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        if options['tokens_from_db']:
+            tokens.update(self._tokens_from_db(entries))
+
+        self.stdout.write(
+            f'Reproduciendo {len(entries)} peticiones contra '
+            f'{options["target"]} (x{options["rate"]})'
+        )
+        started = time.monotonic()
+        results = asyncio.run(replay(
+            entries, options['target'], tokens,
+            concurrency=options['concurrency'], rate=options['rate'],
+            timeout=options['timeout'],
+        ))
+        elapsed = time.monotonic() - started
+        summary = summarize(results)
+
+        self.stdout.write(
+            f'{"endpoint":<45} {"n":>6} {"err":>6} {"p50":>9} '
+            f'{"p90":>9} {"p99":>9}'
+        )
+        for endpoint, data in summary.items():
+            self.stdout.write(
+                f'{endpoint:<45} {data["count"]:>6} '
+                f'{data["error_rate"]:>6.1%} {data["p50_ms"]:>9.1f} '
+                f'{data["p90_ms"]:>9.1f} {data["p99_ms"]:>9.1f}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(results)} peticiones en {elapsed:.1f}s '
+            f'({len(results) / elapsed if elapsed else 0:.0f} req/s)'
+        ))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(summary, output, indent=2)
+
+    def _tokens_from_db(self, entries):
+        """Asigna un usuario estable a cada bucket grabado"""
+        buckets = sorted({entry['a'] for entry in entries
+                          if entry['a'] is not None})
+        users = list(get_user_model().objects.order_by('id')
+                     [:max(len(buckets), 1)])
+        if not users:
+            return {}
+        tokens = {}
+        for position, bucket in enumerate(buckets):
+            user = users[position % len(users)]
+            token, _ = Token.objects.get_or_create(user=user)
+            tokens[str(bucket)] = token.key
+        return tokens
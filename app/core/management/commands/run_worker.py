@@ -0,0 +1,51 @@
+"""
+Worker que ejecuta las tareas de la cola en la base de datos
+"""
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from prometheus_client import start_http_server
+
+from core.tasks import Worker
+
+
+class Command(BaseCommand):
+    """
+    Ejecuta las tareas diferidas sin broker externo. Se pueden correr
+    varios workers a la vez; al recibir SIGTERM terminan las tareas en
+    curso antes de salir.
+    """
+    help = 'Ejecuta las tareas en segundo plano'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Tareas que se ejecutan a la vez, una por hilo'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Ejecuta las tareas listas y termina'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Segundos de espera cuando no hay tareas'
+        )
+        parser.add_argument(
+            '--metrics-port', type=int,
+            help='Expone las metricas de las tareas en este puerto'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency debe ser al menos 1')
+        if options['metrics_port']:
+            start_http_server(options['metrics_port'])
+        worker = Worker(options['concurrency'], options['interval'])
+        signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+        try:
+            processed = worker.run(once=options['once'])
+        except KeyboardInterrupt:
+            worker.stop()
+            processed = worker.processed
+        self.stdout.write(f'Worker detenido, {processed} tareas ejecutadas')
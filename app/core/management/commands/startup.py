@@ -0,0 +1,141 @@
+"""
+Comando que prepara el contenedor antes de levantar uWSGI
+"""
+import hashlib
+import os
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.utils import OperationalError
+from psycopg2 import OperationalError as Psycopg2Error
+
+from core.backoff import backoff_delays
+
+STATIC_MANIFEST = '.collectstatic.sha256'
+
+
+def static_sources_hash():
+    """Hash de las rutas, tamanos y mtimes de los estaticos a recolectar"""
+    digest = hashlib.sha256(settings.STATICFILES_STORAGE.encode())
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list([]):
+            stat = os.stat(storage.path(path))
+            entries.append(f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}')
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+    return digest.hexdigest()
+
+
+def pending_migrations(connection):
+    """Regresa el plan de migraciones pendientes"""
+    executor = MigrationExecutor(connection)
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+@contextmanager
+def migration_lock(connection):
+    """Lock consultivo para que una sola replica migre a la vez"""
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    key = zlib.crc32(f'{settings.DATABASES[connection.alias]["NAME"]}'
+                     ':migrate'.encode())
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s)', [key])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+
+
+class Command(BaseCommand):
+    """Espera la db, recolecta estaticos y migra solo si hace falta"""
+    help = 'Prepara el arranque del contenedor y reporta el tiempo por fase'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db-timeout', type=float, default=60,
+                            help='Segundos maximos esperando la db')
+        parser.add_argument('--force', action='store_true',
+                            help='Corre collectstatic y migrate siempre')
+
+    def handle(self, *args, **options):
+        """Entrypoint para los comandos"""
+        self.force = options['force']
+        timings = []
+        for name, phase in (
+            ('wait_for_db', lambda: self.wait_for_db(options['db_timeout'])),
+            ('collectstatic', self.collectstatic),
+            ('migrate', self.migrate),
+        ):
+            started = time.monotonic()
+            result = phase()
+            timings.append((name, time.monotonic() - started, result))
+
+        for name, elapsed, result in timings:
+            self.stdout.write(
+                f'{name:<15} {elapsed * 1000:>9.1f} ms  {result}'
+            )
+        total = sum(elapsed for _, elapsed, _ in timings)
+        self.stdout.write(self.style.SUCCESS(
+            f'Arranque listo en {total * 1000:.1f} ms'
+        ))
+
+    def wait_for_db(self, timeout):
+        """Espera la db con backoff exponencial sub-segundo y jitter"""
+        deadline = time.monotonic() + timeout
+        attempts = 0
+        for delay in backoff_delays():
+            attempts += 1
+            try:
+                self.check(databases=[DEFAULT_DB_ALIAS])
+                return f'{attempts} intento(s)'
+            except (Psycopg2Error, OperationalError):
+                if time.monotonic() + delay > deadline:
+                    raise CommandError('Base de datos no disponible')
+                time.sleep(delay)
+
+    def collectstatic(self):
+        """Recolecta estaticos solo si cambiaron desde la ultima vez"""
+        manifest = os.path.join(settings.STATIC_ROOT, STATIC_MANIFEST)
+        current = static_sources_hash()
+        if not self.force and os.path.exists(manifest):
+            with open(manifest) as manifest_file:
+                if manifest_file.read().strip() == current:
+                    return 'sin cambios, omitido'
+        call_command('collectstatic', interactive=False, verbosity=0)
+        os.makedirs(settings.STATIC_ROOT, exist_ok=True)
+        with open(manifest, 'w') as manifest_file:
+            manifest_file.write(current)
+        return 'recolectado'
+
+    def migrate(self):
+        """Migra la base principal y cada shard de recetas"""
+        aliases = [DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS]
+        results = [self.migrate_database(alias) for alias in aliases]
+        if len(results) == 1:
+            return results[0]
+        return ', '.join(f'{alias}: {result}'
+                         for alias, result in zip(aliases, results))
+
+    def migrate_database(self, alias):
+        """Migra bajo un lock consultivo si el plan no esta vacio"""
+        connection = connections[alias]
+        if not self.force and not pending_migrations(connection):
+            return 'sin migraciones pendientes'
+        with migration_lock(connection):
+            # Otra replica pudo migrar mientras esperabamos el lock.
+            plan = pending_migrations(connection)
+            if not plan and not self.force:
+                return 'aplicadas por otra replica'
+            call_command('migrate', database=alias, interactive=False,
+                         verbosity=0)
+        return f'{len(plan)} migracion(es) aplicada(s)'
@@ -7,6 +7,8 @@ from django.core.management.base import BaseCommand
 from django.db.utils import OperationalError
 from psycopg2 import OperationalError as Psycopg2Error
 
+from core.backoff import backoff_delays
+
 
 class Command(BaseCommand):
     """Comando que espera que la db este disponible"""
@@ -14,13 +16,15 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         """Entrypoint para los comandos"""
         self.stdout.write('Esperando base de datos....')
+        delays = backoff_delays()
         db_up = False
         while db_up is False:
             try:
                 self.check(databases=['default'])
                 db_up = True
             except (Psycopg2Error, OperationalError):
-                self.stdout.write('Base de datos no disponible,'
-                                  'esperando un segundo')
-                time.sleep(1)
+                delay = next(delays)
+                self.stdout.write('Base de datos no disponible, '
+                                  f'reintentando en {delay:.2f}s')
+                time.sleep(delay)
         self.stdout.write(self.style.SUCCESS('Base de datos disponible'))
@@ -0,0 +1,165 @@
+"""
+Metricas de las peticiones en formato Prometheus
+"""
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, \
+    CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+from core import stack
+
+LATENCY_BUCKETS = (
+    .005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+stack.ignore(__file__)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Tiempo de respuesta por vista',
+    ['view', 'method', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Consultas SQL ejecutadas por peticion',
+    ['view', 'status'],
+    buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds',
+    'Tiempo en SQL por peticion',
+    ['view', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'Tamano del cuerpo de la respuesta',
+    ['view', 'status'],
+    buckets=SIZE_BUCKETS,
+)
+DB_POOL_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Espera para obtener una conexion del pool',
+    ['alias'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter(
+    'db_pool_timeouts',
+    'Peticiones que no obtuvieron conexion a tiempo',
+    ['alias'],
+)
+DB_POOL_CONNECTIONS = Counter(
+    'db_pool_connections',
+    'Conexiones abiertas y descartadas por el pool',
+    ['alias', 'event'],
+)
+
+
+TASKS_PROCESSED = Counter(
+    'background_tasks',
+    'Tareas de la cola procesadas por resultado',
+    ['task', 'result'],
+)
+TASK_DURATION = Histogram(
+    'background_task_duration_seconds',
+    'Tiempo de ejecucion de cada tarea',
+    ['task'],
+    buckets=LATENCY_BUCKETS + (30.0, 60.0, 300.0),
+)
+TASK_QUEUE_WAIT = Histogram(
+    'background_task_queue_wait_seconds',
+    'Tiempo desde que la tarea pudo correr hasta que un worker la tomo',
+    ['task'],
+    buckets=LATENCY_BUCKETS + (30.0, 60.0, 300.0),
+)
+
+
+class QueryCounter:
+    """Execute wrapper que cuenta las consultas y su duracion"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def view_name(request):
+    """Regresa el nombre de la url resuelta, acotado para las etiquetas"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or '<unnamed>'
+
+
+def response_size(response):
+    """Regresa el tamano de la respuesta sin consumir un streaming"""
+    if response.streaming:
+        length = response.get('Content-Length')
+        return int(length) if length else None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """Mide latencia, consultas SQL y tamano de respuesta por vista"""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as scope:
+            for connection in connections.all():
+                scope.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        view = view_name(request)
+        status = str(response.status_code)
+        REQUEST_LATENCY.labels(view, request.method, status).observe(elapsed)
+        REQUEST_QUERIES.labels(view, status).observe(counter.count)
+        REQUEST_DB_TIME.labels(view, status).observe(counter.duration)
+        size = response_size(response)
+        if size is not None:
+            RESPONSE_SIZE.labels(view, status).observe(size)
+        return response
+
+
+def metrics_registry():
+    """
+    Regresa el registro a exportar.
+
+    Con PROMETHEUS_MULTIPROC_DIR cada worker de uWSGI escribe sus valores en
+    archivos mmap y aqui se suman los de todos los procesos.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """Exporta las metricas en el formato de texto de Prometheus"""
+    return HttpResponse(
+        generate_latest(metrics_registry()),
+        content_type=CONTENT_TYPE_LATEST,
+    )
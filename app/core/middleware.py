@@ -0,0 +1,50 @@
+"""
+Middlewares del core
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from core import health
+
+
+class HealthCheckMiddleware:
+    """
+    Responde las sondas de liveness y readiness sin pasar por el resto del
+    stack (sesiones, CSRF, auth). Debe ser el primero en MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.liveness_path = settings.HEALTH_LIVENESS_PATH
+        self.readiness_path = settings.HEALTH_READINESS_PATH
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+
+    def __call__(self, request):
+        path = request.path_info
+        if path == self.liveness_path:
+            return HttpResponse('ok', content_type='text/plain')
+        if path == self.readiness_path:
+            return self.readiness()
+        return self.get_response(request)
+
+    def readiness(self):
+        """Regresa el resultado cacheado para no saturar la base de datos"""
+        max_age = settings.HEALTH_READINESS_CACHE_SECONDS
+        with self._lock:
+            age = time.monotonic() - self._checked_at
+            if self._result is None or age >= max_age:
+                self._result = health.readiness()
+                self._checked_at = time.monotonic()
+                age = 0.0
+            ready, checks = self._result
+        response = JsonResponse(
+            {'ready': ready, 'age_seconds': round(age, 3), 'checks': checks},
+            status=200 if ready else 503,
+        )
+        response['Cache-Control'] = 'no-store'
+        return response
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_counts(apps, schema_editor):
+    """Cuenta los ingredientes de las recetas existentes"""
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeIngredientCount = apps.get_model('core', 'RecipeIngredientCount')
+    using = schema_editor.connection.alias
+    rows = Recipe.ingredientes.through.objects.using(using) \
+        .values('recipe_id', 'recipe__user_id') \
+        .annotate(total=Count('id')).order_by()
+    RecipeIngredientCount.objects.using(using).bulk_create([
+        RecipeIngredientCount(recipe_id=row['recipe_id'],
+                              user_id=row['recipe__user_id'],
+                              total=row['total'])
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeIngredientCount',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.recipe')),
+                ('total', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredientcount',
+            index=models.Index(fields=['user', 'total'], name='core_ingredientcount_user'),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
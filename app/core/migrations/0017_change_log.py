@@ -0,0 +1,74 @@
+# Generated by Django 3.2.25 on 2026-10-19 11:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_change_log(apps, schema_editor):
+    """Una entrada por cada objeto existente para la primera sincronizacion"""
+    ChangeLogEntry = apps.get_model('core', 'ChangeLogEntry')
+    ChangeSequence = apps.get_model('core', 'ChangeSequence')
+    using = schema_editor.connection.alias
+    kinds = [
+        ('recipe', apps.get_model('core', 'Recipe')),
+        ('tag', apps.get_model('core', 'Tag')),
+        ('ingredient', apps.get_model('core', 'Ingredient')),
+    ]
+    last = {}
+    batch = []
+    for kind, model in kinds:
+        rows = model.objects.using(using).order_by('user_id', 'id') \
+            .values_list('user_id', 'id')
+        for user_id, object_id in rows.iterator():
+            last[user_id] = last.get(user_id, 0) + 1
+            batch.append(ChangeLogEntry(user_id=user_id, seq=last[user_id],
+                                        kind=kind, object_id=object_id))
+            if len(batch) >= 1000:
+                ChangeLogEntry.objects.using(using).bulk_create(batch)
+                batch = []
+    ChangeLogEntry.objects.using(using).bulk_create(batch)
+    ChangeSequence.objects.using(using).bulk_create([
+        ChangeSequence(user_id=user_id, last_seq=seq)
+        for user_id, seq in last.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('last_seq', models.BigIntegerField(default=0)),
+                ('compacted_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('recipe', 'Receta'), ('tag', 'Categoria'), ('ingredient', 'Ingrediente')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['user', 'kind', 'object_id', 'seq'], name='core_changelog_object'),
+        ),
+        migrations.AddConstraint(
+            model_name='changelogentry',
+            constraint=models.UniqueConstraint(fields=('user', 'seq'), name='core_changelog_user_seq'),
+        ),
+        migrations.RunPython(fill_change_log, migrations.RunPython.noop),
+    ]
@@ -8,7 +8,10 @@ import uuid
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, \
     PermissionsMixin, BaseUserManager
-from django.db import models  # noqa
+from django.db import models, router, transaction  # noqa
+from django.utils import timezone
+
+from core.storage import import_file_storage, recipe_image_storage
 
 
 def recipe_image_file_path(instance, file_name):
@@ -18,7 +21,23 @@ def recipe_image_file_path(instance, file_name):
     return os.path.join('uploads', 'recipe', filename)
 
 
-class UserManager(BaseUserManager):
+def import_file_path(instance, file_name):
+    """Genera el path del archivo a importar"""
+    ext = os.path.splitext(file_name)[1].lower()
+    return os.path.join('imports', f'{uuid.uuid4()}{ext}')
+
+
+class UserQuerySet(models.QuerySet):
+    """Consultas de usuarios"""
+
+    def delete(self):
+        """Borra a los usuarios marcados como en borrado"""
+        from core import changes
+        with changes.deleting_users(self.values_list('pk', flat=True)):
+            return super().delete()
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     """Manejador de usuarios"""
 
     def create_user(self, email, password=None, **kwargs):
@@ -50,8 +69,30 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+    def delete(self, *args, **kwargs):
+        """Sus objetos se borran en cascada sin registrar cada cambio"""
+        from core import changes
+        with changes.deleting_users([self.pk]):
+            return super().delete(*args, **kwargs)
+
+
+class SyncedModel(models.Model):
+    """
+    Guarda la fila y lo que actualizan sus senales post_save (registro de
+    cambios, estadisticas) en una sola transaccion.
+    """
 
-class Recipe(models.Model):
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or \
+            router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class Recipe(SyncedModel):
     """Modelo de la receta"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -64,13 +105,26 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
     ingredientes = models.ManyToManyField('Ingredient')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage
+    )
+
+    class Meta:
+        # Rangos y orden por precio o tiempo con paginacion por llave
+        indexes = [
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='core_recipe_user_time'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='core_recipe_user_price'),
+        ]
 
     def __str__(self):
         return self.title
 
 
-class Tag(models.Model):
+class Tag(SyncedModel):
     """Tag para filtar recetas"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
@@ -81,7 +135,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(SyncedModel):
     """Modelo para los ingredientes"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
@@ -90,3 +144,322 @@ class Ingredient(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ImageBlob(models.Model):
+    """Imagen guardada una sola vez por su contenido"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class RequestProfile(models.Model):
+    """Indice de los perfiles de peticiones guardados en disco"""
+    slot = models.PositiveIntegerField(unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    view = models.CharField(max_length=255)
+    status = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL
+    )
+    sampled = models.BooleanField(default=False)
+    duration_ms = models.FloatField()
+    sql_count = models.IntegerField()
+    sql_ms = models.FloatField()
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
+
+
+class ShardAssignment(models.Model):
+    """Shard donde viven las recetas, categorias e ingredientes del usuario"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    shard = models.CharField(max_length=64)
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.shard}'
+
+
+class RecipeStats(models.Model):
+    """Resumen de las recetas del usuario, se mantiene por senales"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    recipe_count = models.IntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=14, decimal_places=2,
+                                    default=0)
+    price_min = models.DecimalField(max_digits=5, decimal_places=2,
+                                    null=True)
+    price_max = models.DecimalField(max_digits=5, decimal_places=2,
+                                    null=True)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_count}'
+
+
+class RecipeTimeBucket(models.Model):
+    """Cubeta del histograma de time_minutes del usuario"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    bucket = models.PositiveSmallIntegerField()
+    recipe_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('user', 'bucket')]
+
+    def __str__(self):
+        return f'{self.user_id}[{self.bucket}]: {self.recipe_count}'
+
+
+class TagUsage(models.Model):
+    """Cuantas recetas usan cada categoria"""
+    tag = models.OneToOneField(
+        Tag,
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    recipe_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-recipe_count'],
+                         name='core_tagusage_user_top'),
+        ]
+
+    def __str__(self):
+        return f'{self.tag_id}: {self.recipe_count}'
+
+
+class RecipeSignature(models.Model):
+    """Firma MinHash de las categorias e ingredientes de la receta"""
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return str(self.recipe_id)
+
+
+class RecipeLSHBucket(models.Model):
+    """Cubeta LSH de una banda de la firma de la receta"""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'band', 'bucket'],
+                         name='core_lsh_lookup'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}[{self.band}]'
+
+
+class RecipeIngredientCount(models.Model):
+    """Cuantos ingredientes tiene la receta, para la consulta de despensa"""
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'total'],
+                         name='core_ingredientcount_user'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.total}'
+
+
+class ChangeSequence(models.Model):
+    """Contador del registro de cambios del usuario"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    last_seq = models.BigIntegerField(default=0)
+    # Hasta aqui se borraron tombstones: un cliente con una secuencia menor
+    # debe sincronizar desde cero
+    compacted_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.last_seq}'
+
+
+class ChangeLogEntry(models.Model):
+    """Alta, cambio o borrado de un objeto del usuario"""
+    RECIPE = 'recipe'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    KIND_CHOICES = [
+        (RECIPE, 'Receta'),
+        (TAG, 'Categoria'),
+        (INGREDIENT, 'Ingrediente'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'seq'],
+                                    name='core_changelog_user_seq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'kind', 'object_id', 'seq'],
+                         name='core_changelog_object'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}#{self.seq} {self.kind} {self.object_id}'
+
+
+class ImportJob(models.Model):
+    """Importacion de recetas desde un archivo, la procesa process_imports"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (RUNNING, 'En proceso'),
+        (DONE, 'Terminada'),
+        (FAILED, 'Fallida'),
+    ]
+    CSV = 'csv'
+    JSONL = 'jsonl'
+    FORMAT_CHOICES = [(CSV, 'CSV'), (JSONL, 'JSON Lines')]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    file = models.FileField(upload_to=import_file_path,
+                            storage=import_file_storage)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING)
+    size = models.BigIntegerField(default=0)
+    bytes_processed = models.BigIntegerField(default=0)
+    # Tambien es el punto de reanudacion si el worker se detiene
+    rows_processed = models.IntegerField(default=0)
+    rows_imported = models.IntegerField(default=0)
+    rows_failed = models.IntegerField(default=0)
+    errors = models.JSONField(default=list)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'],
+                         name='core_importjob_queue'),
+        ]
+
+    def __str__(self):
+        return f'{self.pk} {self.status}'
+
+    @property
+    def progress(self):
+        """Fraccion del archivo leida"""
+        if self.status == self.DONE:
+            return 1.0
+        return round(self.bytes_processed / self.size, 4) if self.size \
+            else 0.0
+
+    @property
+    def rows_per_second(self):
+        """Filas procesadas por segundo desde que inicio"""
+        end = self.finished_at or self.heartbeat_at
+        if not self.started_at or not end or end <= self.started_at:
+            return None
+        return round(self.rows_processed /
+                     (end - self.started_at).total_seconds(), 1)
+
+
+class BackgroundTask(models.Model):
+    """Tarea diferida en la cola de la base de datos, la corre run_worker"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'En cola'),
+        (RUNNING, 'En proceso'),
+        (FAILED, 'Fallida'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Visibilidad: pasado este momento otro worker puede reclamarla
+    locked_until = models.DateTimeField(null=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='core_backgroundtask_queue'),
+        ]
+
+    def __str__(self):
+        return f'{self.pk} {self.name} {self.status}'
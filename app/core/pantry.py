@@ -0,0 +1,122 @@
+"""
+Recetas que se pueden preparar con los ingredientes que tiene el usuario
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from core.models import Ingredient, Recipe, RecipeIngredientCount
+
+MAX_INGREDIENTS = 500
+MAX_MISSING = 10
+BATCH_SIZE = 5000
+
+
+def change_counts(recipe_ids, delta, using):
+    """Suma `delta` ingredientes a cada receta"""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    counts = RecipeIngredientCount.objects.using(using)
+    existing = set(counts.filter(recipe_id__in=recipe_ids)
+                   .values_list('recipe_id', flat=True))
+    missing = [recipe_id for recipe_id in recipe_ids
+               if recipe_id not in existing]
+    if missing:
+        counts.bulk_create([
+            RecipeIngredientCount(recipe_id=recipe_id, user_id=user_id)
+            for recipe_id, user_id in Recipe.objects.using(using)
+            .filter(id__in=missing).values_list('id', 'user_id')
+        ], ignore_conflicts=True)
+    counts.filter(recipe_id__in=recipe_ids).update(total=F('total') + delta)
+
+
+def clear_counts(recipe_ids, using):
+    """Las recetas se quedaron sin ingredientes"""
+    RecipeIngredientCount.objects.using(using) \
+        .filter(recipe_id__in=list(recipe_ids)).update(total=0)
+
+
+def rebuild(using, recipe_ids=None):
+    """
+    Recalcula los conteos desde la tabla intermedia con una consulta
+    agrupada. Sin `recipe_ids` reconstruye todas las recetas de la base.
+    """
+    if recipe_ids is None:
+        with transaction.atomic(using=using):
+            RecipeIngredientCount.objects.using(using).all().delete()
+            _insert_counts(Recipe.ingredientes.through.objects.using(using),
+                           using)
+        return
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        with transaction.atomic(using=using):
+            RecipeIngredientCount.objects.using(using) \
+                .filter(recipe_id__in=batch).delete()
+            _insert_counts(Recipe.ingredientes.through.objects.using(using)
+                           .filter(recipe_id__in=batch), using)
+
+
+def _insert_counts(links, using):
+    rows = links.values('recipe_id', 'recipe__user_id') \
+        .annotate(total=Count('id')).order_by()
+    RecipeIngredientCount.objects.using(using).bulk_create([
+        RecipeIngredientCount(recipe_id=row['recipe_id'],
+                              user_id=row['recipe__user_id'],
+                              total=row['total'])
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+def cookable(user_id, ingredient_ids, max_missing=0, limit=20, using=None):
+    """
+    Regresa [(recipe_id, faltantes)] de las recetas del usuario a las que
+    les faltan a lo sumo `max_missing` ingredientes, las que menos faltan
+    primero.
+
+    Solo se agrupan los enlaces de los ingredientes de la despensa: lo que
+    falta es el total de la receta menos los que si se tienen. Las recetas
+    sin ningun ingrediente de la despensa solo califican si tienen a lo sumo
+    `max_missing` y se buscan aparte por el indice de conteos.
+    """
+    # Los ingredientes son del usuario y solo sus recetas los enlazan, asi
+    # el filtro por usuario no necesita unir la tabla de recetas.
+    ingredient_ids = list(
+        Ingredient.objects.db_manager(using)
+        .filter(user_id=user_id, id__in=list(ingredient_ids))
+        .values_list('id', flat=True)
+    )
+    links = Recipe.ingredientes.through.objects.db_manager(using) \
+        .filter(ingredient_id__in=ingredient_ids)
+    covered = links \
+        .values('recipe_id', total=F('recipe__recipeingredientcount__total')) \
+        .annotate(have=Count('id')) \
+        .annotate(missing=F('total') - F('have')) \
+        .filter(missing__lte=max_missing) \
+        .order_by('missing', '-have', 'recipe_id')[:limit]
+    ranked = [(row['missing'], -row['have'], row['recipe_id'])
+              for row in covered]
+    if max_missing > 0:
+        ranked += [
+            (total, 0, recipe_id) for recipe_id, total in
+            RecipeIngredientCount.objects.db_manager(using)
+            .filter(user_id=user_id, total__gt=0, total__lte=max_missing)
+            .exclude(recipe_id__in=links.values('recipe_id'))
+            .order_by('total', 'recipe_id')
+            .values_list('recipe_id', 'total')[:limit]
+        ]
+    ranked.sort()
+    return [(recipe_id, missing) for missing, _, recipe_id in ranked[:limit]]
+
+
+def missing_ingredients(recipe_ids, ingredient_ids, using=None):
+    """Ingredientes que no estan en la despensa, por receta"""
+    missing = {recipe_id: [] for recipe_id in recipe_ids}
+    rows = Recipe.ingredientes.through.objects.db_manager(using) \
+        .filter(recipe_id__in=list(missing)) \
+        .exclude(ingredient_id__in=list(ingredient_ids)) \
+        .order_by('recipe_id', 'ingredient_id') \
+        .values_list('recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in rows:
+        missing[recipe_id].append(ingredient_id)
+    return missing
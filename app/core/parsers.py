@@ -0,0 +1,29 @@
+"""
+Parsers binarios de la api: MessagePack y CBOR
+"""
+import cbor2
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class MessagePackParser(BaseParser):
+    """Lee cuerpos application/msgpack"""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f'MessagePack invalido: {exc}')
+
+
+class CBORParser(BaseParser):
+    """Lee cuerpos application/cbor"""
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except (cbor2.CBORDecodeError, ValueError, EOFError) as exc:
+            raise ParseError(f'CBOR invalido: {exc}')
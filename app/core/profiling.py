@@ -0,0 +1,229 @@
+"""
+Perfilado bajo demanda de peticiones individuales
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import stack
+from core.metrics import view_name
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+TOKEN_SALT = 'core.profiling'
+
+stack.ignore(__file__)
+
+
+def make_token(issued_by, user=None):
+    """Firma un token de perfilado, opcionalmente limitado a un usuario"""
+    return signing.dumps(
+        {'by': issued_by.pk, 'user': user.pk if user else None},
+        salt=TOKEN_SALT,
+    )
+
+
+def read_token(token):
+    """Regresa el contenido de un token valido o None"""
+    try:
+        return signing.loads(
+            token, salt=TOKEN_SALT,
+            max_age=settings.PROFILING_TOKEN_MAX_AGE,
+        )
+    except signing.BadSignature:
+        return None
+
+
+def token_user_id(request):
+    """
+    Usuario del header Authorization. Se resuelve antes de la vista, donde
+    DRF autentica, para no perfilar peticiones de otro usuario.
+    """
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0].pk if result else None
+
+
+class SQLRecorder:
+    """Execute wrapper que guarda cada consulta con su duracion y origen"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+                'alias': context['connection'].alias,
+                'stack': stack.application_frames(),
+            })
+
+
+def serializer_breakdown(stats, limit=15):
+    """Agrupa el tiempo acumulado de las funciones de los serializers"""
+    base = os.path.join(str(settings.BASE_DIR), '')
+    totals = {}
+    for (filename, _, function), values in stats.stats.items():
+        if not filename.endswith('serializers.py'):
+            continue
+        if filename.startswith(base):
+            filename = filename[len(base):]
+        elif 'rest_framework' in filename:
+            filename = 'rest_framework/serializers.py'
+        key = f'{filename}:{function}'
+        calls, cumulative = totals.get(key, (0, 0.0))
+        totals[key] = (calls + values[1], cumulative + values[3])
+    ranked = sorted(totals.items(), key=lambda item: -item[1][1])[:limit]
+    return [
+        {'function': key, 'calls': calls, 'cumulative_ms': round(ct * 1000, 3)}
+        for key, (calls, ct) in ranked
+    ]
+
+
+class ProfileRingBuffer:
+    """Guarda los perfiles en un numero fijo de ranuras en disco"""
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+
+    def path(self, slot, ext):
+        return os.path.join(self.directory, f'slot-{slot}.{ext}')
+
+    def next_slot(self):
+        """Regresa una ranura libre o la del perfil mas viejo"""
+        from core.models import RequestProfile
+
+        # Se busca el hueco por numero: al borrar perfiles desde el admin
+        # el conteo ya no coincide con las ranuras ocupadas
+        used = set(RequestProfile.objects.values_list('slot', flat=True))
+        for slot in range(self.size):
+            if slot not in used:
+                return slot
+        oldest = RequestProfile.objects.order_by('created_at', 'id').first()
+        return oldest.slot
+
+    def _write(self, path, write):
+        tmp_path = f'{path}.tmp'
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def store(self, profile, report, summary):
+        """Escribe el perfil y actualiza su registro en la base de datos"""
+        from core.models import RequestProfile
+
+        os.makedirs(self.directory, exist_ok=True)
+        slot = self.next_slot()
+
+        def write_report(path):
+            with open(path, 'w') as report_file:
+                json.dump(report, report_file)
+
+        self._write(self.path(slot, 'prof'), profile.dump_stats)
+        self._write(self.path(slot, 'json'), write_report)
+        RequestProfile.objects.update_or_create(slot=slot, defaults=summary)
+        return slot
+
+    def load(self, slot):
+        """Lee el reporte guardado en una ranura"""
+        try:
+            with open(self.path(slot, 'json')) as report_file:
+                return json.load(report_file)
+        except FileNotFoundError:
+            return None
+
+
+def ring_buffer():
+    return ProfileRingBuffer(settings.PROFILING_DIR,
+                             settings.PROFILING_RING_SIZE)
+
+
+class ProfilingMiddleware:
+    """
+    Perfila las peticiones con un token firmado en el header X-Profile o
+    una fraccion muestreada del trafico. Deshabilitado no se instala.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = None
+        header = request.META.get(PROFILE_HEADER)
+        if header:
+            token = read_token(header)
+        if token and token.get('user') and \
+                token['user'] != token_user_id(request):
+            # Limitado a otro usuario: la peticion pasa sin perfilar
+            token = None
+        sampled = token is None and \
+            random.random() < settings.PROFILING_SAMPLE_RATE
+        if token is None and not sampled:
+            return self.get_response(request)
+        return self.profile(request, token, sampled)
+
+    def profile(self, request, token, sampled):
+        """Corre la peticion bajo cProfile y guarda el resultado"""
+        recorder = SQLRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack_context:
+            for connection in connections.all():
+                stack_context.enter_context(
+                    connection.execute_wrapper(recorder)
+                )
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        user = getattr(request, 'user', None)
+        user_id = user.pk if user is not None and user.is_authenticated \
+            else None
+
+        stats = pstats.Stats(profiler)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output) \
+            .sort_stats('cumulative').print_stats(40)
+        sql_ms = sum(query['ms'] for query in recorder.queries)
+        report = {
+            'sql': recorder.queries,
+            'serializers': serializer_breakdown(stats),
+            'pstats': output.getvalue(),
+        }
+        summary = {
+            'created_at': timezone.now(),
+            'method': request.method,
+            'path': request.path[:255],
+            'view': view_name(request)[:255],
+            'status': response.status_code,
+            'user_id': user_id,
+            'sampled': sampled,
+            'duration_ms': round(duration * 1000, 3),
+            'sql_count': len(recorder.queries),
+            'sql_ms': round(sql_ms, 3),
+        }
+        ring_buffer().store(profiler, report, summary)
+        return response
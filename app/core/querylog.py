@@ -0,0 +1,108 @@
+"""
+Log de consultas lentas y deteccion de consultas repetidas (N+1)
+"""
+import json
+import logging
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core import stack
+from core.metrics import view_name
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+VALUES_LIST = re.compile(r'VALUES (\([^)]*\))(?:, \([^)]*\))+', re.IGNORECASE)
+NUMBER = re.compile(r'\b\d+\b')
+
+stack.ignore(__file__)
+
+
+def sql_shape(sql):
+    """Normaliza la consulta para agrupar las que solo cambian en valores"""
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = VALUES_LIST.sub(r'VALUES \1, ...', sql)
+    return NUMBER.sub('?', sql)
+
+
+def log_event(event, **data):
+    """Escribe un evento estructurado en una linea JSON"""
+    logger.info(json.dumps(dict(event=event, **data), default=str))
+
+
+class QueryLogger:
+    """Execute wrapper que registra consultas lentas y cuenta las formas"""
+
+    def __init__(self, request):
+        self.request = request
+        self.threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.record(sql, elapsed, context['connection'].alias)
+
+    def record(self, sql, elapsed, alias):
+        shape = sql_shape(sql)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            frames = stack.application_frames(limit=3)
+            entry = self.shapes[shape] = [0, 0.0, frames]
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed >= self.threshold:
+            frames = stack.application_frames(limit=3)
+            log_event(
+                'slow_query',
+                view=view_name(self.request),
+                method=self.request.method,
+                alias=alias,
+                ms=round(elapsed, 3),
+                callsite=frames[0] if frames else None,
+                stack=frames,
+                sql=shape,
+            )
+
+    def report_repeated(self):
+        """Registra las formas que se repitieron en la misma peticion"""
+        for shape, (count, total, frames) in self.shapes.items():
+            if count >= settings.N_PLUS_ONE_THRESHOLD:
+                log_event(
+                    'repeated_query',
+                    view=view_name(self.request),
+                    method=self.request.method,
+                    count=count,
+                    ms=round(total, 3),
+                    callsite=frames[0] if frames else None,
+                    stack=frames,
+                    sql=shape,
+                )
+
+
+class QueryLogMiddleware:
+    """Instala el QueryLogger durante cada peticion"""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_LOG_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_logger = QueryLogger(request)
+        with ExitStack() as stack_context:
+            for connection in connections.all():
+                stack_context.enter_context(
+                    connection.execute_wrapper(query_logger)
+                )
+            response = self.get_response(request)
+        query_logger.report_repeated()
+        return response
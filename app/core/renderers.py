@@ -0,0 +1,44 @@
+"""
+Renderers binarios de la api: MessagePack y CBOR
+"""
+import cbor2
+import msgpack
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_json_encoder = JSONEncoder()
+
+
+def _default(value):
+    """Convierte fechas, decimales y uuids igual que la salida JSON"""
+    return _json_encoder.default(value)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Responde en MessagePack si el cliente lo pide en Accept"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class CBORRenderer(BaseRenderer):
+    """Responde en CBOR (RFC 8949) si el cliente lo pide en Accept"""
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return cbor2.dumps(
+            data, default=lambda encoder, value: encoder.encode(
+                _default(value)
+            )
+        )
@@ -0,0 +1,149 @@
+"""
+Ruteo de lecturas a replicas con lectura de las propias escrituras
+"""
+import contextvars
+import hashlib
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+_lag_lock = threading.Lock()
+_lag_checked = {}
+
+
+def replica_lag(alias):
+    """Segundos de retraso de la replica respecto al primario"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT CASE WHEN pg_last_wal_receive_lsn() = '
+            'pg_last_wal_replay_lsn() THEN 0 ELSE EXTRACT(EPOCH FROM '
+            'now() - pg_last_xact_replay_timestamp()) END'
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def healthy_replicas():
+    """
+    Regresa las replicas con retraso aceptable.
+
+    El retraso de cada replica se revisa a lo sumo cada
+    REPLICA_LAG_CHECK_SECONDS por proceso; una replica que no responde
+    cuenta como atrasada hasta la siguiente revision.
+    """
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        with _lag_lock:
+            checked = _lag_checked.get(alias)
+        if checked is None or \
+                now - checked[0] > settings.REPLICA_LAG_CHECK_SECONDS:
+            try:
+                ok = replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS
+            except DatabaseError:
+                ok = False
+            checked = (now, ok)
+            with _lag_lock:
+                _lag_checked[alias] = checked
+        if checked[1]:
+            healthy.append(alias)
+    return healthy
+
+
+def reset_lag_checks():
+    """Olvida las revisiones de retraso guardadas"""
+    with _lag_lock:
+        _lag_checked.clear()
+
+
+class ReplicaRouter:
+    """
+    Manda las lecturas a la replica que eligio ReplicaMiddleware para la
+    peticion y todo lo demas al primario. Fuera de una peticion (comandos,
+    workers) las lecturas tambien van al primario.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def pin_key(request):
+    """Llave de cache del cliente segun su token o su sesion"""
+    credential = request.META.get('HTTP_AUTHORIZATION') or \
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    digest = hashlib.sha256(credential.encode()).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+class ReplicaMiddleware:
+    """
+    Elige la base de datos de lectura de cada peticion.
+
+    Los metodos seguros leen de una replica sana. Despues de una escritura
+    el cliente queda fijado al primario por REPLICA_PIN_SECONDS para leer
+    lo que acaba de escribir, marcado con una cookie o en el cache segun
+    REPLICA_PIN_STORE.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        alias = DEFAULT_DB_ALIAS
+        if request.method in SAFE_METHODS and not self.is_pinned(request):
+            replicas = healthy_replicas()
+            if replicas:
+                alias = random.choice(replicas)
+        token = _read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            self.pin(request, response)
+        return response
+
+    def is_pinned(self, request):
+        if settings.REPLICA_PIN_STORE == 'cache':
+            key = pin_key(request)
+            return key is not None and cache.get(key) is not None
+        try:
+            until = float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE))
+        except (TypeError, ValueError):
+            return False
+        return until > time.time()
+
+    def pin(self, request, response):
+        seconds = settings.REPLICA_PIN_SECONDS
+        if settings.REPLICA_PIN_STORE == 'cache':
+            key = pin_key(request)
+            if key is not None:
+                cache.set(key, 1, seconds)
+            return
+        response.set_cookie(
+            settings.REPLICA_PIN_COOKIE, str(time.time() + seconds),
+            max_age=seconds, httponly=True, samesite='Lax',
+        )
@@ -0,0 +1,142 @@
+"""
+Schema OpenAPI precalculado y servido con ETag
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import drf_spectacular
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.http import parse_etags
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+
+_lock = threading.Lock()
+_schemas = {}
+_rendered = {}
+
+
+def generate_schema(api_version=None):
+    """Genera el schema introspectando todas las vistas"""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(
+        api_version=api_version
+    )
+    return json.loads(json.dumps(
+        generator.get_schema(request=None, public=True), default=str
+    ))
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """
+    Hash del codigo de la aplicacion (vistas, serializers, urls,
+    migraciones) y de la version de drf-spectacular. Un archivo generado
+    con otro codigo no se reutiliza.
+    """
+    digest = hashlib.sha256(drf_spectacular.__version__.encode())
+    for root, dirs, files in os.walk(settings.BASE_DIR):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+            with open(path, 'rb') as source:
+                digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def cache_path(api_version, language):
+    """Ruta en disco del schema de una version e idioma"""
+    if not settings.SCHEMA_CACHE_DIR:
+        return None
+    return os.path.join(
+        settings.SCHEMA_CACHE_DIR,
+        f'schema-{code_version()}-{api_version or "default"}-'
+        f'{language or "default"}.json'
+    )
+
+
+def write_schema(schema, api_version=None, language=None):
+    """Guarda el schema en disco de forma atomica"""
+    path = cache_path(api_version, language)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as schema_file:
+        json.dump(schema, schema_file, sort_keys=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_schema(api_version=None):
+    """
+    Regresa el schema desde memoria, o desde disco, o generandolo una sola
+    vez por proceso.
+    """
+    language = translation.get_language()
+    key = (api_version, language)
+    schema = _schemas.get(key)
+    if schema is not None:
+        return schema
+    with _lock:
+        schema = _schemas.get(key)
+        if schema is not None:
+            return schema
+        path = cache_path(api_version, language)
+        if path and os.path.exists(path):
+            with open(path) as schema_file:
+                schema = json.load(schema_file)
+        else:
+            schema = generate_schema(api_version)
+            if path:
+                try:
+                    write_schema(schema, api_version, language)
+                except OSError:
+                    pass
+        _schemas[key] = schema
+        return schema
+
+
+def clear_cache():
+    """Descarta los schemas cacheados en memoria"""
+    with _lock:
+        _schemas.clear()
+        _rendered.clear()
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """SpectacularAPIView que no regenera el schema en cada peticion"""
+
+    def _get_schema_response(self, request):
+        api_version = self.api_version or request.version
+        renderer = request.accepted_renderer
+        key = (api_version, translation.get_language(), renderer.media_type)
+        rendered = _rendered.get(key)
+        if rendered is None:
+            content = renderer.render(
+                get_schema(api_version),
+                renderer_context=self.get_renderer_context(),
+            )
+            etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+            rendered = _rendered[key] = (content, etag)
+        content, etag = rendered
+
+        # Comparacion debil: la compresion puede marcar la ETag como W/
+        if_none_match = [
+            tag[2:] if tag.startswith('W/') else tag
+            for tag in parse_etags(request.headers.get('If-None-Match', ''))
+        ]
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponse(status=304)
+        else:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f'{content_type}; charset={renderer.charset}'
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,258 @@
+"""
+Particion de los datos de recetas por usuario entre varias bases de datos
+"""
+import bisect
+import contextvars
+import copy
+import hashlib
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, \
+    transaction
+from django.db.models.fields import AutoFieldMixin
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Los usuarios, tokens y asignaciones viven en default; estas tablas se
+# reparten por usuario.
+SHARDED_MODELS = {
+    'core.recipe', 'core.tag', 'core.ingredient',
+    'core.recipe_tags', 'core.recipe_ingredientes',
+    'core.recipestats', 'core.recipetimebucket', 'core.tagusage',
+    'core.recipesignature', 'core.recipelshbucket',
+    'core.recipeingredientcount', 'core.changesequence',
+    'core.changelogentry',
+}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Primer entero de las llaves de los locks consultivos de escritura
+WRITE_LOCK_CLASS = 0x53484152
+
+_current_shard = contextvars.ContextVar('current_shard', default=None)
+_rings = {}
+
+
+class HashRing:
+    """Anillo de hash consistente con nodos virtuales por shard"""
+
+    def __init__(self, nodes, vnodes=64):
+        points = sorted(
+            (self.hash(f'{node}:{index}'), node)
+            for node in nodes for index in range(vnodes)
+        )
+        self.keys = [key for key, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def hash(value):
+        return int.from_bytes(
+            hashlib.md5(str(value).encode()).digest()[:8], 'big'
+        )
+
+    def get(self, key):
+        """Regresa el nodo responsable de la llave"""
+        index = bisect.bisect(self.keys, self.hash(key)) % len(self.keys)
+        return self.nodes[index]
+
+
+def ring():
+    """Regresa el anillo de los shards configurados"""
+    shards = tuple(settings.DATABASE_SHARDS)
+    if shards not in _rings:
+        _rings[shards] = HashRing(shards, settings.SHARD_VNODES)
+    return _rings[shards]
+
+
+def copy_user(user, alias):
+    """
+    Copia la fila del usuario al shard para que las llaves foraneas de sus
+    recetas sean validas. La copia solo se usa para la integridad, la
+    fuente de verdad sigue siendo default.
+    """
+    User = get_user_model()
+    if User.objects.using(alias).filter(pk=user.pk).exists():
+        return
+    shard_user = copy.copy(user)
+    try:
+        with transaction.atomic(using=alias):
+            shard_user.save(using=alias, force_insert=True)
+    except IntegrityError:
+        pass
+
+
+def next_sequence_value(max_id, offset, stride):
+    """Menor id mayor que `max_id` que le toca al shard (id % stride)"""
+    return max_id + 1 + (offset - max_id - 1) % stride
+
+
+def configure_sequences(alias):
+    """
+    Hace que cada shard genere ids de su propia clase modulo
+    SHARD_ID_STRIDE: el shard N usa N, N + stride, ... Asi move_user_shard
+    copia las filas con sus ids sin chocar con las del destino. Solo en
+    Postgres; se corre despues de cada migrate del shard.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return
+    stride = settings.SHARD_ID_STRIDE
+    if len(settings.DATABASE_SHARDS) >= stride:
+        raise ValueError(f'SHARD_ID_STRIDE ({stride}) debe ser mayor que el '
+                         f'numero de shards')
+    offset = settings.DATABASE_SHARDS.index(alias) + 1
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for label in sorted(SHARDED_MODELS):
+            model = apps.get_model(label)
+            pk = model._meta.pk
+            if not isinstance(pk, AutoFieldMixin):
+                continue
+            table = model._meta.db_table
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)',
+                           [table, pk.column])
+            sequence = cursor.fetchone()[0]
+            if sequence is None:
+                continue
+            cursor.execute(f'SELECT COALESCE(MAX({quote(pk.column)}), 0) '
+                           f'FROM {quote(table)}')
+            start = next_sequence_value(cursor.fetchone()[0], offset, stride)
+            cursor.execute(f'ALTER SEQUENCE {sequence} INCREMENT BY %s',
+                           [stride])
+            cursor.execute('SELECT setval(%s, %s, false)', [sequence, start])
+
+
+def write_lock(user_id, exclusive=False):
+    """
+    Lock consultivo de escritura del usuario en default hasta el fin de la
+    transaccion. Las escrituras lo toman compartido y move_user_shard
+    exclusivo: marcar el movimiento espera a las escrituras en curso.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor != 'postgresql':
+        return
+    function = 'pg_advisory_xact_lock' if exclusive \
+        else 'pg_advisory_xact_lock_shared'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(%s, %s)',
+                       [WRITE_LOCK_CLASS, user_id % 2 ** 31])
+
+
+@contextmanager
+def user_writes(user_id):
+    """
+    Bloque que escribe datos repartidos del usuario fuera de la api. Falla
+    con UserMoving si se estan moviendo; sin shards no hace nada.
+    """
+    if not settings.DATABASE_SHARDS:
+        yield
+        return
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        write_lock(user_id)
+        if assignment_for_user(user_id).moving:
+            raise UserMoving
+        yield
+
+
+def assignment_for_user(user_id):
+    """
+    Regresa la asignacion del usuario, creandola con el anillo la primera
+    vez. Una vez creada no cambia aunque se agreguen shards, los datos solo
+    se mueven con move_user_shard.
+    """
+    from core.models import ShardAssignment
+
+    assignment = ShardAssignment.objects.using(DEFAULT_DB_ALIAS) \
+        .filter(user_id=user_id).first()
+    if assignment is not None:
+        return assignment
+    user = get_user_model().objects.using(DEFAULT_DB_ALIAS).get(pk=user_id)
+    shard = ring().get(user_id)
+    copy_user(user, shard)
+    assignment, _ = ShardAssignment.objects.using(DEFAULT_DB_ALIAS) \
+        .get_or_create(user_id=user_id, defaults={'shard': shard})
+    return assignment
+
+
+def shard_for_user(user_id):
+    """Alias del shard del usuario, None si no hay shards configurados"""
+    if not settings.DATABASE_SHARDS or user_id is None:
+        return None
+    return assignment_for_user(user_id).shard
+
+
+@contextmanager
+def use_shard(alias):
+    """Manda las consultas de los modelos repartidos al shard indicado"""
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+class ShardRouter:
+    """
+    Resuelve la base de los modelos repartidos: primero el shard activo de
+    la peticion, luego el del usuario duenio de la instancia. Los demas
+    modelos quedan para el siguiente router.
+    """
+
+    def _db(self, model, **hints):
+        if not settings.DATABASE_SHARDS or \
+                model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        current = _current_shard.get()
+        if current is not None:
+            return current
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db in settings.DATABASE_SHARDS:
+            return instance._state.db
+        return shard_for_user(getattr(instance, 'user_id', None))
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class UserMoving(APIException):
+    """Los datos del usuario se estan moviendo de shard"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Tus datos se estan moviendo, intenta de nuevo en breve'
+    default_code = 'user_moving'
+
+
+class ShardedViewMixin:
+    """
+    Activa el shard del usuario autenticado durante la peticion. Mientras
+    sus datos se mueven las lecturas siguen y las escrituras se rechazan;
+    las escrituras en curso tienen el lock de escritura del usuario hasta
+    terminar.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _current_shard.set(None)
+        try:
+            if settings.DATABASE_SHARDS and \
+                    request.method not in SAFE_METHODS:
+                with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                    return super().dispatch(request, *args, **kwargs)
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _current_shard.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not settings.DATABASE_SHARDS:
+            return
+        if request.method not in SAFE_METHODS:
+            write_lock(request.user.pk)
+        assignment = assignment_for_user(request.user.pk)
+        if assignment.moving and request.method not in SAFE_METHODS:
+            raise UserMoving
+        _current_shard.set(assignment.shard)
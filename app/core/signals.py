@@ -0,0 +1,280 @@
+"""
+Signals del core
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_init, \
+    post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from core import changes, pantry, sharding, similarity, stats
+from core.models import Ingredient, Recipe, RecipeIngredientCount, Tag, \
+    User
+from core.storage import release_blob, retain_blob
+
+_links_removed = contextvars.ContextVar('links_removed', default=False)
+
+
+@contextmanager
+def links_removed():
+    """
+    Los elementos que se borran dentro del bloque ya no tienen enlaces: las
+    operaciones en lote los quitaron antes, y los handlers no los buscan.
+    """
+    token = _links_removed.set(True)
+    try:
+        yield
+    finally:
+        _links_removed.reset(token)
+
+
+def linked_recipe_ids(through, field, instance, using):
+    # Al borrar al usuario sus recetas se van con el en la misma cascada
+    if _links_removed.get() or changes.user_deleting(instance.user_id):
+        return []
+    return list(through.objects.using(using).filter(**{field: instance.pk})
+                .values_list('recipe_id', flat=True))
+
+
+@receiver(post_init, sender=Recipe)
+def remember_recipe_image(sender, instance, **kwargs):
+    """Guarda el nombre de la imagen cargada para detectar cambios"""
+    if 'image' in instance.__dict__:
+        instance._original_image = str(instance.__dict__['image'] or '')
+    else:
+        instance._original_image = None
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_image_references(sender, instance, **kwargs):
+    """Actualiza las referencias a los blobs cuando cambia la imagen"""
+    if instance._original_image is None or 'image' not in instance.__dict__:
+        return
+    current = instance.image.name or ''
+    original = instance._original_image
+    if current != original:
+        retain_blob(current, instance.image.storage)
+        release_blob(original)
+    instance._original_image = current
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    """Libera la referencia al blob de la receta eliminada"""
+    if 'image' in instance.__dict__:
+        release_blob(instance.image.name or '')
+
+
+@receiver(post_init, sender=Recipe)
+def remember_recipe_stats(sender, instance, **kwargs):
+    """Guarda precio y tiempo cargados para actualizar las estadisticas"""
+    values = instance.__dict__
+    if 'price' in values and 'time_minutes' in values:
+        instance._original_stats = (values['price'], values['time_minutes'])
+    else:
+        instance._original_stats = None
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_stats(sender, instance, created, using, **kwargs):
+    """Aplica el cambio de la receta al resumen del usuario"""
+    current = (instance.price, instance.time_minutes)
+    if created:
+        stats.add_recipe(instance.user_id, *current, using)
+    elif instance._original_stats is None:
+        # Se cargo con campos diferidos, no se conoce el valor anterior
+        stats.rebuild(using, [instance.user_id])
+    elif instance._original_stats != current:
+        stats.remove_recipe(instance.user_id, *instance._original_stats,
+                            using)
+        stats.add_recipe(instance.user_id, *current, using)
+    instance._original_stats = current
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_deleted_recipe_tags(sender, instance, using, **kwargs):
+    """Las filas intermedias se borran sin m2m_changed, se guardan antes"""
+    if changes.user_deleting(instance.user_id):
+        return
+    instance._deleted_tag_ids = list(
+        Recipe.tags.through.objects.using(using)
+        .filter(recipe_id=instance.pk).values_list('tag_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_stats(sender, instance, using, **kwargs):
+    """Quita la receta eliminada del resumen y del uso de categorias"""
+    # El resumen y el uso de las categorias del usuario se borran con el
+    if changes.user_deleting(instance.user_id):
+        return
+    original = instance._original_stats or \
+        (instance.price, instance.time_minutes)
+    stats.remove_recipe(instance.user_id, *original, using)
+    stats.change_tag_usage(getattr(instance, '_deleted_tag_ids', []), -1,
+                           using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tag_usage(sender, instance, action, reverse, pk_set, using,
+                     **kwargs):
+    """Mantiene el conteo de recetas por categoria"""
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_count = instance.recipe_set.count()
+        else:
+            instance._cleared_tag_ids = list(
+                instance.tags.values_list('id', flat=True)
+            )
+    elif action == 'post_clear':
+        if reverse:
+            stats.change_tag_usage([instance.pk], -instance._cleared_count,
+                                   using)
+        else:
+            stats.change_tag_usage(instance._cleared_tag_ids, -1, using)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        delta = 1 if action == 'post_add' else -1
+        if reverse:
+            stats.change_tag_usage([instance.pk], delta * len(pk_set), using)
+        else:
+            stats.change_tag_usage(pk_set, delta, using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredientes.through)
+def update_recipe_signature(sender, instance, action, reverse, pk_set,
+                            using, **kwargs):
+    """Recalcula la firma MinHash de las recetas cuyos enlaces cambiaron"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            similarity.recipe_changed(instance.pk, using)
+        return
+    if action == 'pre_clear':
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        recipe_ids = instance._cleared_recipe_ids
+    elif action in ('post_add', 'post_remove'):
+        recipe_ids = pk_set or ()
+    else:
+        return
+    if action != 'pre_clear':
+        for recipe_id in recipe_ids:
+            similarity.recipe_changed(recipe_id, using)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredientes.through)
+def update_ingredient_counts(sender, instance, action, reverse, pk_set,
+                             using, **kwargs):
+    """Mantiene el conteo de ingredientes por receta"""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_pantry_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        if reverse:
+            pantry.change_counts(instance._cleared_pantry_ids, -1, using)
+        else:
+            pantry.clear_counts([instance.pk], using)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        delta = 1 if action == 'post_add' else -1
+        if reverse:
+            pantry.change_counts(pk_set, delta, using)
+        else:
+            pantry.change_counts([instance.pk], delta * len(pk_set), using)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_recipes(sender, instance, using, **kwargs):
+    """Los enlaces del ingrediente se borran en cascada sin m2m_changed"""
+    instance._linked_recipe_ids = linked_recipe_ids(
+        Recipe.ingredientes.through, 'ingredient_id', instance, using
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def recount_ingredient_recipes(sender, instance, using, **kwargs):
+    """Descuenta el ingrediente borrado de sus recetas y las recalcula"""
+    # Sin crear filas: si se borra el usuario sus recetas van detras
+    RecipeIngredientCount.objects.using(using).filter(
+        recipe_id__in=getattr(instance, '_linked_recipe_ids', [])
+    ).update(total=F('total') - 1)
+    similarity.schedule_update(getattr(instance, '_linked_recipe_ids', []),
+                               using)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_recipes(sender, instance, using, **kwargs):
+    """Los enlaces de la categoria se borran en cascada sin m2m_changed"""
+    instance._linked_recipe_ids = linked_recipe_ids(
+        Recipe.tags.through, 'tag_id', instance, using
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_tag_recipes(sender, instance, using, **kwargs):
+    """Las firmas de las recetas ya no incluyen la categoria borrada"""
+    similarity.schedule_update(getattr(instance, '_linked_recipe_ids', []),
+                               using)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def record_saved_object(sender, instance, using, **kwargs):
+    """Registra el alta o el cambio para la sincronizacion"""
+    changes.record(instance.user_id, changes.MODEL_KINDS[sender],
+                   [instance.pk], using)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_deleted_object(sender, instance, using, **kwargs):
+    """Registra el tombstone y las recetas que perdieron el enlace"""
+    changes.record(instance.user_id, changes.MODEL_KINDS[sender],
+                   [instance.pk], using, deleted=True)
+    changes.record(instance.user_id, changes.RECIPE,
+                   getattr(instance, '_linked_recipe_ids', []), using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredientes.through)
+def record_recipe_links(sender, instance, action, reverse, pk_set, using,
+                        **kwargs):
+    """Las recetas cuyos enlaces cambiaron se registran como cambiadas"""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_change_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        recipe_ids = instance._cleared_change_ids if reverse \
+            else [instance.pk]
+        changes.record(instance.user_id, changes.RECIPE, recipe_ids, using)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        recipe_ids = pk_set if reverse else [instance.pk]
+        changes.record(instance.user_id, changes.RECIPE, recipe_ids, using)
+
+
+@receiver(post_delete, sender=User)
+def delete_shard_users(sender, instance, using, **kwargs):
+    """
+    Borrar al usuario en default borra sus copias en los shards y con ellas
+    sus recetas, categorias e ingredientes.
+    """
+    if using != DEFAULT_DB_ALIAS:
+        return
+    for alias in settings.DATABASE_SHARDS:
+        User.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def configure_shard_sequences(sender, using, **kwargs):
+    """Los shards generan ids en rangos disjuntos"""
+    if sender.label == 'core' and using in settings.DATABASE_SHARDS:
+        sharding.configure_sequences(using)
@@ -0,0 +1,184 @@
+"""
+Recetas similares con firmas MinHash e indice LSH por bandas
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from core import tasks
+from core.models import Recipe, RecipeLSHBucket, RecipeSignature
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Primo menor a 2**32: a * x + b cabe en un uint64 sin desbordar
+PRIME = np.uint64(4294967291)
+BATCH_SIZE = 5000
+
+_random = np.random.RandomState(20220617)
+_A = _random.randint(1, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_B = _random.randint(0, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_BAND_MIX = _random.randint(1, 2 ** 62, size=ROWS).astype(np.uint64) | \
+    np.uint64(1)
+
+_deferred = contextvars.ContextVar('similarity_deferred', default=None)
+
+
+def signatures(recipe_ids, recipe_tokens):
+    """
+    Calcula las firmas de varias recetas a la vez.
+
+    `recipe_ids` y `recipe_tokens` son arreglos paralelos ordenados por
+    receta; regresa los ids distintos y una matriz (recetas, NUM_PERM).
+    """
+    recipe_ids = np.asarray(recipe_ids)
+    if not len(recipe_ids):
+        return recipe_ids, np.empty((0, NUM_PERM), dtype=np.uint32)
+    hashes = (recipe_tokens[:, None] * _A[None, :] + _B[None, :]) % PRIME
+    starts = np.flatnonzero(
+        np.r_[True, recipe_ids[1:] != recipe_ids[:-1]]
+    )
+    return recipe_ids[starts], \
+        np.minimum.reduceat(hashes, starts, axis=0).astype(np.uint32)
+
+
+def band_keys(matrix):
+    """Llave de 63 bits de cada banda, matriz (recetas, BANDS)"""
+    bands = matrix.astype(np.uint64).reshape(len(matrix), BANDS, ROWS)
+    with np.errstate(over='ignore'):
+        mixed = (bands * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+        mixed ^= mixed >> np.uint64(29)
+    return (mixed & np.uint64(2 ** 63 - 1)).astype(np.int64)
+
+
+def similarity(signature, others):
+    """Jaccard estimado: fraccion de posiciones iguales"""
+    return (others == signature[None, :]).mean(axis=1)
+
+
+def decode(data):
+    return np.frombuffer(bytes(data), dtype='<u4')
+
+
+def recipe_tokens(recipe_ids, using):
+    """Lee los enlaces de las recetas como arreglos ordenados por receta"""
+    pairs = [
+        (recipe_id, tag_id * 2) for recipe_id, tag_id in
+        Recipe.tags.through.objects.using(using)
+        .filter(recipe_id__in=recipe_ids)
+        .values_list('recipe_id', 'tag_id')
+    ] + [
+        (recipe_id, ingredient_id * 2 + 1) for recipe_id, ingredient_id in
+        Recipe.ingredientes.through.objects.using(using)
+        .filter(recipe_id__in=recipe_ids)
+        .values_list('recipe_id', 'ingredient_id')
+    ]
+    if not pairs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64)
+    array = np.array(pairs, dtype=np.int64)
+    array = array[np.argsort(array[:, 0], kind='stable')]
+    return array[:, 0], array[:, 1].astype(np.uint64) % PRIME
+
+
+def update_recipes(recipe_ids, using):
+    """Recalcula firma y cubetas de las recetas con consultas por lote"""
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        _update_batch(recipe_ids[start:start + BATCH_SIZE], using)
+
+
+def _update_batch(recipe_ids, using):
+    owners = dict(Recipe.objects.using(using).filter(id__in=recipe_ids)
+                  .values_list('id', 'user_id'))
+    ids, matrix = signatures(*recipe_tokens(list(owners), using))
+    keys = band_keys(matrix)
+    with transaction.atomic(using=using):
+        RecipeLSHBucket.objects.using(using) \
+            .filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.using(using) \
+            .filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.using(using).bulk_create([
+            RecipeSignature(recipe_id=recipe_id, user_id=owners[recipe_id],
+                            signature=row.astype('<u4').tobytes())
+            for recipe_id, row in zip(ids.tolist(), matrix)
+        ], batch_size=1000)
+        RecipeLSHBucket.objects.using(using).bulk_create([
+            RecipeLSHBucket(recipe_id=recipe_id, user_id=owners[recipe_id],
+                            band=band, bucket=key)
+            for recipe_id, row in zip(ids.tolist(), keys.tolist())
+            for band, key in enumerate(row)
+        ], batch_size=1000)
+
+
+@tasks.task('similarity.update_recipes', timeout=600)
+def update_recipes_task(recipe_ids, using):
+    update_recipes(recipe_ids, using)
+
+
+def schedule_update(recipe_ids, using):
+    """Recalcula las recetas en el worker cuando la cola esta activa"""
+    if recipe_ids:
+        update_recipes_task.delay(recipe_ids=sorted(recipe_ids), using=using,
+                                  after_commit=using)
+
+
+def recipe_changed(recipe_id, using):
+    """Actualiza la receta ahora o al salir de `deferred`"""
+    pending = _deferred.get()
+    if pending is not None:
+        pending.setdefault(using, set()).add(recipe_id)
+    else:
+        schedule_update([recipe_id], using)
+
+
+@contextmanager
+def deferred():
+    """
+    Junta los cambios de enlaces del bloque y recalcula cada receta una sola
+    vez al final, en lugar de una vez por categoria agregada.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    pending = {}
+    token = _deferred.set(pending)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+    for using, recipe_ids in pending.items():
+        schedule_update(recipe_ids, using)
+
+
+def similar_recipes(recipe, limit=10):
+    """
+    Regresa [(recipe_id, similitud)] de las recetas del mismo usuario que
+    comparten al menos una cubeta LSH, ordenadas por Jaccard estimado.
+    """
+    using = recipe._state.db
+    own = RecipeSignature.objects.using(using) \
+        .filter(recipe_id=recipe.pk).values_list('signature', flat=True) \
+        .first()
+    if own is None:
+        return []
+    signature = decode(own)
+    keys = band_keys(signature[None, :])[0].tolist()
+    candidates = RecipeLSHBucket.objects.using(using).filter(
+        reduce(or_, (Q(band=band, bucket=key)
+                     for band, key in enumerate(keys))),
+        user_id=recipe.user_id,
+    ).exclude(recipe_id=recipe.pk).values('recipe_id').distinct()
+    rows = list(RecipeSignature.objects.using(using)
+                .filter(recipe_id__in=candidates)
+                .values_list('recipe_id', 'signature'))
+    if not rows:
+        return []
+    scores = similarity(signature,
+                        np.stack([decode(data) for _, data in rows]))
+    order = np.argsort(-scores, kind='stable')[:limit]
+    return [(rows[index][0], float(scores[index])) for index in order]
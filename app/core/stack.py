@@ -0,0 +1,37 @@
+"""
+Utilidades para ubicar el codigo de la aplicacion que origina una llamada
+"""
+import os
+import sys
+
+from django.conf import settings
+
+IGNORED_FILES = set()
+
+
+def ignore(filename):
+    """Excluye un modulo de instrumentacion de los frames reportados"""
+    IGNORED_FILES.add(os.path.abspath(filename))
+
+
+def application_frames(limit=5):
+    """
+    Regresa los frames del proyecto desde el mas interno, por ejemplo
+    'recipe/serializers.py:_get_or_create_tags'. Ignora las dependencias y
+    los modulos de instrumentacion.
+    """
+    base = os.path.join(str(settings.BASE_DIR), '')
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < limit:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base) and 'site-packages' not in filename \
+                and filename not in IGNORED_FILES:
+            frames.append(
+                f'{filename[len(base):]}:{frame.f_code.co_name}'
+            )
+        frame = frame.f_back
+    return frames
+
+
+ignore(__file__)
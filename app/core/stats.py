@@ -0,0 +1,202 @@
+"""
+Estadisticas de recetas por usuario mantenidas de forma incremental
+"""
+import bisect
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Min, Q, \
+    Sum, Value, When
+
+from core.models import Recipe, RecipeStats, RecipeTimeBucket, Tag, \
+    TagUsage
+
+# Limite superior (inclusive) de cada cubeta de time_minutes; la ultima
+# cubeta junta todo lo que supera el ultimo limite.
+TIME_BUCKETS = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240)
+TOP_TAGS = 10
+
+
+def time_bucket(minutes):
+    """Indice de la cubeta de time_minutes"""
+    return bisect.bisect_left(TIME_BUCKETS, minutes)
+
+
+def bucket_expression(field='time_minutes'):
+    """Calcula la cubeta en la base de datos para la reconstruccion"""
+    return Case(
+        *[When(**{f'{field}__lte': limit}, then=Value(index))
+          for index, limit in enumerate(TIME_BUCKETS)],
+        default=Value(len(TIME_BUCKETS)),
+        output_field=IntegerField(),
+    )
+
+
+def refresh_price_bounds(user_id, using):
+    """Recalcula el minimo y el maximo cuando se quito uno de ellos"""
+    bounds = Recipe.objects.using(using).filter(user_id=user_id) \
+        .aggregate(low=Min('price'), high=Max('price'))
+    RecipeStats.objects.using(using).filter(user_id=user_id).update(
+        price_min=bounds['low'], price_max=bounds['high']
+    )
+
+
+def as_price(price):
+    """
+    El precio como Decimal de dos decimales. La receta conserva el valor
+    que se le asigno (float, str) hasta recargarse de la base.
+    """
+    return Decimal(str(price)).quantize(Decimal('0.01'))
+
+
+def add_recipe(user_id, price, minutes, using):
+    """Suma una receta al resumen y a su cubeta"""
+    price = as_price(price)
+    RecipeStats.objects.using(using).get_or_create(user_id=user_id)
+    RecipeStats.objects.using(using).filter(user_id=user_id).update(
+        recipe_count=F('recipe_count') + 1,
+        price_sum=F('price_sum') + price,
+        price_min=Case(
+            When(Q(price_min__isnull=True) | Q(price_min__gt=price),
+                 then=Value(price)),
+            default=F('price_min'),
+        ),
+        price_max=Case(
+            When(Q(price_max__isnull=True) | Q(price_max__lt=price),
+                 then=Value(price)),
+            default=F('price_max'),
+        ),
+    )
+    bucket = time_bucket(minutes)
+    RecipeTimeBucket.objects.using(using).get_or_create(
+        user_id=user_id, bucket=bucket
+    )
+    RecipeTimeBucket.objects.using(using).filter(
+        user_id=user_id, bucket=bucket
+    ).update(recipe_count=F('recipe_count') + 1)
+
+
+def remove_recipe(user_id, price, minutes, using):
+    """Resta una receta; si era el minimo o el maximo se recalculan"""
+    price = as_price(price)
+    stats = RecipeStats.objects.using(using).filter(user_id=user_id)
+    stats.update(
+        recipe_count=F('recipe_count') - 1,
+        price_sum=F('price_sum') - price,
+    )
+    if stats.filter(Q(price_min=price) | Q(price_max=price)).exists():
+        refresh_price_bounds(user_id, using)
+    RecipeTimeBucket.objects.using(using).filter(
+        user_id=user_id, bucket=time_bucket(minutes)
+    ).update(recipe_count=F('recipe_count') - 1)
+
+
+def change_tag_usage(tag_ids, delta, using):
+    """Suma `delta` recetas a cada categoria"""
+    tag_ids = list(tag_ids)
+    if not tag_ids:
+        return
+    existing = set(TagUsage.objects.using(using).filter(tag_id__in=tag_ids)
+                   .values_list('tag_id', flat=True))
+    missing = [tag_id for tag_id in tag_ids if tag_id not in existing]
+    # Al restar no se crean filas: si se borra el usuario su uso de
+    # categorias ya se borro en cascada
+    if missing and delta > 0:
+        TagUsage.objects.using(using).bulk_create([
+            TagUsage(tag_id=tag_id, user_id=user_id)
+            for tag_id, user_id in Tag.objects.using(using)
+            .filter(id__in=missing).values_list('id', 'user_id')
+        ], ignore_conflicts=True)
+    TagUsage.objects.using(using).filter(tag_id__in=tag_ids).update(
+        recipe_count=F('recipe_count') + delta
+    )
+
+
+def refresh_tag_usage(tag_ids, using):
+    """Recalcula el uso de las categorias desde la tabla intermedia"""
+    tag_ids = list(tag_ids)
+    TagUsage.objects.using(using).filter(tag_id__in=tag_ids).delete()
+    counts = Recipe.tags.through.objects.using(using) \
+        .filter(tag_id__in=tag_ids).values('tag_id', 'tag__user_id') \
+        .annotate(recipes=Count('recipe_id'))
+    TagUsage.objects.using(using).bulk_create([
+        TagUsage(tag_id=row['tag_id'], user_id=row['tag__user_id'],
+                 recipe_count=row['recipes'])
+        for row in counts
+    ])
+
+
+def rebuild(using, user_ids=None):
+    """
+    Reconstruye los resumenes con tres consultas agrupadas. Sin `user_ids`
+    reconstruye todos los usuarios de la base.
+    """
+    recipes = Recipe.objects.using(using)
+    through = Recipe.tags.through.objects.using(using)
+    stats = RecipeStats.objects.using(using)
+    buckets = RecipeTimeBucket.objects.using(using)
+    usage = TagUsage.objects.using(using)
+    if user_ids is not None:
+        recipes = recipes.filter(user_id__in=user_ids)
+        through = through.filter(tag__user_id__in=user_ids)
+        stats = stats.filter(user_id__in=user_ids)
+        buckets = buckets.filter(user_id__in=user_ids)
+        usage = usage.filter(user_id__in=user_ids)
+
+    with transaction.atomic(using=using):
+        stats.delete()
+        buckets.delete()
+        usage.delete()
+        RecipeStats.objects.using(using).bulk_create([
+            RecipeStats(user_id=row['user_id'],
+                        recipe_count=row['recipes'],
+                        price_sum=row['total'], price_min=row['low'],
+                        price_max=row['high'])
+            for row in recipes.values('user_id').annotate(
+                recipes=Count('id'), total=Sum('price'),
+                low=Min('price'), high=Max('price'),
+            ).order_by()
+        ], batch_size=1000)
+        RecipeTimeBucket.objects.using(using).bulk_create([
+            RecipeTimeBucket(user_id=row['user_id'], bucket=row['bucket'],
+                             recipe_count=row['recipes'])
+            for row in recipes.annotate(bucket=bucket_expression())
+            .values('user_id', 'bucket').annotate(recipes=Count('id'))
+            .order_by()
+        ], batch_size=1000)
+        TagUsage.objects.using(using).bulk_create([
+            TagUsage(tag_id=row['tag_id'], user_id=row['tag__user_id'],
+                     recipe_count=row['recipes'])
+            for row in through.values('tag_id', 'tag__user_id')
+            .annotate(recipes=Count('recipe_id')).order_by()
+        ], batch_size=1000)
+
+
+def user_stats(user_id, using=None):
+    """Regresa el resumen del usuario con un numero fijo de consultas"""
+    stats = RecipeStats.objects.db_manager(using) \
+        .filter(user_id=user_id).first()
+    counts = dict(
+        RecipeTimeBucket.objects.db_manager(using)
+        .filter(user_id=user_id).values_list('bucket', 'recipe_count')
+    )
+    top_tags = TagUsage.objects.db_manager(using) \
+        .filter(user_id=user_id, recipe_count__gt=0) \
+        .order_by('-recipe_count', 'tag_id') \
+        .values('tag_id', 'tag__name', 'recipe_count')[:TOP_TAGS]
+    count = stats.recipe_count if stats else 0
+    return {
+        'recipe_count': count,
+        'price_avg': round(stats.price_sum / count, 2) if count else None,
+        'price_min': stats.price_min if count else None,
+        'price_max': stats.price_max if count else None,
+        'time_minutes_histogram': [
+            {'le': limit, 'count': counts.get(index, 0)}
+            for index, limit in enumerate(TIME_BUCKETS + (None,))
+        ],
+        'top_tags': [
+            {'id': row['tag_id'], 'name': row['tag__name'],
+             'recipe_count': row['recipe_count']}
+            for row in top_tags
+        ],
+    }
@@ -0,0 +1,127 @@
+"""
+Almacenamiento de imagenes direccionado por contenido
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+
+CONTENT_ADDRESSED_NAME = re.compile(
+    r'^(?P<prefix>.+/)?(?P<fanout>[0-9a-f]{2})/(?P<digest>[0-9a-f]{64})'
+    r'(?P<ext>\.[A-Za-z0-9]+)?$'
+)
+
+
+def is_content_addressed(name):
+    """Indica si el nombre pertenece a un blob direccionado por contenido"""
+    return bool(name) and CONTENT_ADDRESSED_NAME.match(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Guarda cada archivo una sola vez bajo el digest sha256 de su contenido.
+
+    El digest se calcula mientras el archivo se escribe a un temporal en el
+    mismo volumen, asi que la subida se recorre una sola vez. Si el blob ya
+    existe el temporal se descarta y se reutiliza el nombre existente.
+    """
+    hash_algorithm = 'sha256'
+
+    def get_available_name(self, name, max_length=None):
+        """El nombre final depende del contenido, no hay colisiones"""
+        return name
+
+    def blob_name(self, directory, digest, ext):
+        """Regresa la ruta del blob con un nivel de fan-out por digest"""
+        return os.path.join(directory, digest[:2], f'{digest}{ext.lower()}')
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        ext = os.path.splitext(name)[1]
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.new(self.hash_algorithm)
+        fd, tmp_path = tempfile.mkstemp(dir=full_directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp_file.write(chunk)
+
+            blob_name = self.blob_name(directory, digest.hexdigest(), ext)
+            full_path = self.path(blob_name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if os.path.exists(full_path):
+                # Refresca el mtime para que el recolector respete el periodo
+                # de gracia de un blob que se vuelve a usar.
+                os.utime(full_path)
+                os.remove(tmp_path)
+            else:
+                os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_name.replace('\\', '/')
+
+
+def recipe_image_storage():
+    """Regresa el storage configurado para las imagenes de recetas"""
+    if settings.RECIPE_IMAGE_STORAGE == 'content':
+        return ContentAddressedStorage()
+    return FileSystemStorage()
+
+
+class ImportFileStorage(FileSystemStorage):
+    """Archivos de importacion en IMPORT_DIR, leido en cada acceso"""
+
+    @property
+    def base_location(self):
+        return settings.IMPORT_DIR
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def import_file_storage():
+    """Regresa el storage de los archivos de importacion"""
+    return ImportFileStorage()
+
+
+def retain_blob(name, storage):
+    """Suma una referencia al blob, registrandolo si es nuevo"""
+    from core.models import ImageBlob
+
+    if not is_content_addressed(name):
+        return
+    blob, created = ImageBlob.objects.get_or_create(
+        name=name,
+        defaults={'size': storage.size(name) if storage.exists(name) else 0},
+    )
+    ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release_blob(name):
+    """
+    Resta una referencia al blob.
+
+    Los blobs sin referencias no se borran aqui: una subida concurrente del
+    mismo contenido podria estar reutilizandolos, asi que se conservan con
+    cero referencias hasta que gc_media los recolecte.
+    """
+    from core.models import ImageBlob
+
+    if not is_content_addressed(name):
+        return
+    ImageBlob.objects.filter(name=name, ref_count__gt=0).update(
+        ref_count=F('ref_count') - 1
+    )
@@ -0,0 +1,224 @@
+"""
+Cola de tareas en segundo plano guardada en la base de datos
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, \
+    router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.metrics import TASK_DURATION, TASK_QUEUE_WAIT, TASKS_PROCESSED
+from core.models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_TIMEOUT = 300
+
+TASKS = {}
+
+
+class TaskSpec:
+    """Funcion registrada como tarea y su politica de reintentos"""
+
+    def __init__(self, name, func, max_attempts, timeout):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=DEFAULT_TIMEOUT):
+    """
+    Registra la funcion como tarea. `func.delay(**kwargs)` la encola; los
+    argumentos deben poder guardarse como JSON y la funcion debe tolerar
+    correr mas de una vez.
+    """
+    def decorator(func):
+        TASKS[name] = TaskSpec(name, func, max_attempts, timeout)
+        func.delay = partial(delay, name)
+        return func
+    return decorator
+
+
+def delay(name, after_commit=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Encola la tarea cuando confirme la transaccion de `after_commit`, para
+    que el worker vea los datos que la originaron. Sin cola se ejecuta en
+    el momento.
+    """
+    if not settings.TASK_QUEUE_ENABLED:
+        TASKS[name].func(**kwargs)
+        return
+    transaction.on_commit(partial(enqueue, name, kwargs), using=after_commit)
+
+
+def enqueue(name, kwargs, run_at=None):
+    """Guarda la tarea en la cola"""
+    return BackgroundTask.objects.create(
+        name=name, kwargs=kwargs, run_at=run_at or timezone.now()
+    )
+
+
+def backoff(attempts):
+    """Espera exponencial con variacion aleatoria antes del reintento"""
+    wait = min(settings.TASK_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+               settings.TASK_RETRY_MAX_SECONDS)
+    return wait / 2 + random.uniform(0, wait / 2)
+
+
+def _take(queryset, name, worker_id, now):
+    spec = TASKS.get(name)
+    timeout = spec.timeout if spec else DEFAULT_TIMEOUT
+    return queryset.update(
+        status=BackgroundTask.RUNNING,
+        locked_by=worker_id,
+        locked_until=now + timedelta(seconds=timeout),
+        attempts=F('attempts') + 1,
+    )
+
+
+def claim(worker_id, limit=1):
+    """
+    Toma hasta `limit` tareas listas, o en proceso cuyo tiempo de
+    visibilidad ya vencio. En Postgres las filas se bloquean con SKIP
+    LOCKED y los workers no se esperan entre si; en SQLite cada tarea se
+    toma con un UPDATE condicionado.
+    """
+    now = timezone.now()
+    using = router.db_for_write(BackgroundTask)
+    tasks = BackgroundTask.objects.using(using)
+    ready = tasks.filter(
+        Q(status=BackgroundTask.QUEUED, run_at__lte=now) |
+        Q(status=BackgroundTask.RUNNING, locked_until__lt=now)
+    ).order_by('run_at', 'id')
+    claimed = []
+    if connections[using].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=using):
+            for task_id, name in ready.select_for_update(skip_locked=True) \
+                    .values_list('id', 'name')[:limit]:
+                _take(tasks.filter(id=task_id), name, worker_id, now)
+                claimed.append(task_id)
+    else:
+        candidates = ready.values_list('id', 'name', 'status',
+                                       'locked_until')[:limit + 10]
+        for task_id, name, status, locked_until in candidates:
+            if _take(tasks.filter(id=task_id, status=status,
+                                  locked_until=locked_until),
+                     name, worker_id, now):
+                claimed.append(task_id)
+                if len(claimed) == limit:
+                    break
+    return list(tasks.filter(id__in=claimed).order_by('run_at', 'id'))
+
+
+def execute(task, worker_id):
+    """
+    Ejecuta una tarea reclamada. Si termina bien se borra; si falla vuelve
+    a la cola con espera o queda como fallida al agotar sus intentos. Solo
+    se escribe el resultado si ningun otro worker la reclamo.
+    """
+    spec = TASKS.get(task.name)
+    TASK_QUEUE_WAIT.labels(task.name).observe(
+        max((timezone.now() - task.run_at).total_seconds(), 0)
+    )
+    owned = BackgroundTask.objects.using(task._state.db).filter(
+        id=task.pk, locked_by=worker_id, attempts=task.attempts
+    )
+    started = time.perf_counter()
+    try:
+        if spec is None:
+            raise LookupError(f'Tarea desconocida: {task.name}')
+        if task.attempts > spec.max_attempts:
+            raise TimeoutError('Se agoto el tiempo de visibilidad')
+        spec.func(**task.kwargs)
+    except Exception as exc:
+        error = ''.join(traceback.format_exception_only(type(exc), exc))
+        now = timezone.now()
+        if spec is not None and task.attempts < spec.max_attempts:
+            result = 'retry'
+            owned.update(status=BackgroundTask.QUEUED, locked_by='',
+                         locked_until=None, last_error=error,
+                         run_at=now + timedelta(
+                             seconds=backoff(task.attempts)))
+        else:
+            result = 'failed'
+            owned.update(status=BackgroundTask.FAILED, locked_by='',
+                         locked_until=None, last_error=error,
+                         finished_at=now)
+        logger.warning('Tarea %s %s (%s): %s', task.pk, task.name, result,
+                       error.strip())
+    else:
+        result = 'success'
+        owned.delete()
+    TASK_DURATION.labels(task.name).observe(time.perf_counter() - started)
+    TASKS_PROCESSED.labels(task.name, result).inc()
+    return result
+
+
+class Worker:
+    """Corre las tareas de la cola con `concurrency` hilos"""
+
+    def __init__(self, concurrency=1, interval=1.0):
+        self.id = f'{socket.gethostname()}:{os.getpid()}:' \
+                  f'{uuid.uuid4().hex[:8]}'
+        self.concurrency = concurrency
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """Termina despues de las tareas en curso"""
+        self.stopping.set()
+
+    def work(self, once=False):
+        """Ciclo de un hilo: reclama y ejecuta de una tarea a la vez"""
+        while not self.stopping.is_set():
+            close_old_connections()
+            tasks = claim(self.id)
+            if tasks:
+                execute(tasks[0], self.id)
+                with self._lock:
+                    self.processed += 1
+                continue
+            if once:
+                break
+            self.stopping.wait(self.interval)
+
+    def _thread(self, once):
+        try:
+            self.work(once)
+        except Exception:
+            logger.exception('El hilo del worker %s se detuvo', self.id)
+        finally:
+            connections.close_all()
+
+    def run(self, once=False):
+        """Corre hasta `stop`, o hasta vaciar la cola con `once`"""
+        if self.concurrency == 1:
+            self.work(once)
+            return self.processed
+        threads = [
+            threading.Thread(target=self._thread, args=(once,), daemon=True,
+                             name=f'task-worker-{number}')
+            for number in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # Con timeout el hilo principal sigue atendiendo las senales
+            while thread.is_alive():
+                thread.join(0.5)
+        return self.processed
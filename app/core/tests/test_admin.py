@@ -3,10 +3,15 @@ Tests para el admin web de django
 """
 from django.contrib.auth import get_user_model
 from django.test import Client
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 
+# Las plantillas se renderizan sin haber corrido collectstatic
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.'
+                        'StaticFilesStorage'
+)
 class AdminSiteTest(TestCase):
     """Tests para el admin"""
 
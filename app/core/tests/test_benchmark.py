@@ -0,0 +1,46 @@
+"""
+Tests para la suite de benchmarks
+"""
+from django.test import SimpleTestCase, TestCase
+
+from benchmarks.runner import compare_results, run_benchmarks
+from core.models import Recipe
+
+
+class BenchmarkRunnerTests(TestCase):
+    """Tests del runner de benchmarks"""
+
+    def test_run_benchmarks_reports_queries(self):
+        """Cada caso reporta tiempo, consultas y memoria sin dejar datos"""
+        results = run_benchmarks(names=['recipe_serializer'], sizes={10},
+                                 repeat=1)
+
+        result = results['recipe_serializer[10]']
+        self.assertEqual(result['queries'], 21)
+        self.assertGreater(result['median_ms'], 0)
+        self.assertGreater(result['peak_kb'], 0)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class CompareResultsTests(SimpleTestCase):
+    """Tests de la comparacion contra una corrida base"""
+
+    def test_regressions_over_threshold(self):
+        """Se reportan los casos mas lentos que el umbral o con mas SQL"""
+        baseline = {
+            'a': {'median_ms': 10.0, 'queries': 2},
+            'b': {'median_ms': 10.0, 'queries': 2},
+            'c': {'median_ms': 10.0, 'queries': 2},
+        }
+        current = {
+            'a': {'median_ms': 11.0, 'queries': 2},
+            'b': {'median_ms': 13.0, 'queries': 2},
+            'c': {'median_ms': 10.0, 'queries': 3},
+            'd': {'median_ms': 99.0, 'queries': 9},
+        }
+
+        regressions = compare_results(current, baseline, threshold=0.2)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('b:'))
+        self.assertTrue(regressions[1].startswith('c:'))
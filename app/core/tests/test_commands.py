@@ -1,13 +1,25 @@
 """
 Test comandos custom de django
 """
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from psycopg2 import OperationalError as Psycopg2Error
 
+from core.management.commands.generate_data import ZipfSampler
+from core.models import Recipe, Tag
+
 
 @patch("core.management.commands.wait_for_db.Command.check")
 class CommandTest(SimpleTestCase):
@@ -27,3 +39,166 @@ class CommandTest(SimpleTestCase):
         call_command('wait_for_db')
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class GcMediaCommandTests(TestCase):
+    """Test del recolector de imagenes huerfanas"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = get_user_model().objects.create_user(
+            email='admin@example.com', password='admin.1234'
+        )
+
+    def _create_file(self, name, age_hours=48):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as media_file:
+            media_file.write(b'imagen')
+        mtime = time.time() - age_hours * 3600
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_gc_media_deletes_only_old_orphans(self):
+        """Solo se borran los archivos sin referencia fuera del periodo"""
+        referenced = self._create_file('uploads/recipe/a.jpg')
+        orphan = self._create_file('uploads/recipe/b.jpg')
+        recent = self._create_file('uploads/recipe/c.jpg', age_hours=1)
+        Recipe.objects.create(
+            user=self.user, title='Receta', time_minutes=5,
+            price=Decimal('5.5'), image='uploads/recipe/a.jpg'
+        )
+
+        call_command('gc_media', '--dry-run', stdout=StringIO())
+        self.assertTrue(os.path.exists(orphan))
+
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(os.path.exists(referenced))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_gc_media_resumes_from_checkpoint(self):
+        """El recorrido se reanuda desde el ultimo lote procesado"""
+        for index in range(4):
+            self._create_file(f'uploads/recipe/{index:02x}/{index}.jpg')
+        checkpoint = os.path.join(self.media_root, 'gc.json')
+
+        call_command('gc_media', '--batch-size=2', '--max-files=2',
+                     f'--checkpoint={checkpoint}', stdout=StringIO())
+        with open(checkpoint) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        self.assertEqual(state['last'], 'uploads/recipe/01/1.jpg')
+        self.assertEqual(state['deleted'], 2)
+
+        out = StringIO()
+        call_command('gc_media', '--batch-size=2',
+                     f'--checkpoint={checkpoint}', stdout=out)
+        self.assertIn('Revisados 2 archivos', out.getvalue())
+        self.assertFalse(os.path.exists(checkpoint))
+        self.assertEqual(
+            os.listdir(os.path.join(self.media_root, 'uploads/recipe/03')),
+            []
+        )
+
+
+class GenerateDataCommandTests(TestCase):
+    """Test del generador de datos sinteticos"""
+
+    def _generate(self, seed=1):
+        call_command('generate_data', '--users=3', '--recipes=10',
+                     '--tags=5', '--ingredients=8', '--tags-per-recipe=2',
+                     '--ingredients-per-recipe=3', f'--seed={seed}',
+                     stdout=StringIO())
+
+    def test_generate_data_counts(self):
+        """Se generan los usuarios, recetas y relaciones pedidas"""
+        self._generate()
+
+        user_model = get_user_model()
+        self.assertEqual(user_model.objects.count(), 3)
+        self.assertEqual(Recipe.objects.count(), 10)
+        self.assertEqual(Tag.objects.count(), 15)
+        self.assertEqual(Recipe.tags.through.objects.count(), 20)
+        self.assertEqual(Recipe.ingredientes.through.objects.count(), 30)
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                set(recipe.tags.values_list('user', flat=True)),
+                {recipe.user_id}
+            )
+        user = user_model.objects.first()
+        self.assertTrue(user.check_password('loadtest.1234'))
+
+    def test_generate_data_is_deterministic(self):
+        """La misma semilla genera las mismas relaciones"""
+        def snapshot():
+            return list(
+                Recipe.objects.order_by('id')
+                .values_list('time_minutes', 'price', 'tags__name')
+            )
+
+        self._generate()
+        first = snapshot()
+        Recipe.objects.all().delete()
+        get_user_model().objects.all().delete()
+        self._generate()
+
+        self.assertEqual(snapshot(), first)
+        Recipe.objects.create(
+            user=get_user_model().objects.first(), title='Nueva',
+            time_minutes=5, price=Decimal('1.00')
+        )
+
+    def test_zipf_sampler_is_skewed(self):
+        """Los primeros rangos son los mas populares"""
+        sampler = ZipfSampler(50, 1.1)
+        rng = random.Random(0)
+        counts = [0] * 50
+        for _ in range(2000):
+            for index in sampler.sample(rng, 1):
+                counts[index] += 1
+
+        self.assertGreater(counts[0], counts[10])
+        self.assertGreater(counts[10], counts[49])
+
+
+@patch('core.management.commands.startup.call_command')
+class StartupCommandTests(TestCase):
+    """Test del comando de arranque"""
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        override = override_settings(STATIC_ROOT=self.static_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_startup_skips_unchanged_phases(self, patched_call):
+        """Sin cambios no se corre collectstatic ni migrate"""
+        call_command('startup', stdout=StringIO())
+        patched_call.assert_called_once()
+        patched_call.reset_mock()
+
+        out = StringIO()
+        call_command('startup', stdout=out)
+
+        patched_call.assert_not_called()
+        self.assertIn('sin cambios, omitido', out.getvalue())
+        self.assertIn('sin migraciones pendientes', out.getvalue())
+
+    @patch('time.sleep')
+    @patch('core.management.commands.startup.Command.check')
+    def test_startup_waits_with_backoff(self, patched_check, patched_sleep,
+                                        patched_call):
+        """Los reintentos empiezan por debajo del segundo y crecen"""
+        patched_check.side_effect = [OperationalError] * 4 + [True]
+        call_command('startup', stdout=StringIO())
+
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 4)
+        self.assertLess(delays[0], 0.1)
+        self.assertLess(max(delays), 1)
+        self.assertLess(delays[0], delays[-1])
@@ -0,0 +1,131 @@
+"""
+Tests para la compresion de las respuestas
+"""
+import gzip
+import json
+import unittest
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import compression
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BODY = json.dumps([{'title': 'Sopa de tortilla', 'time_minutes': 20}] * 100)
+
+
+class EncodingNegotiationTests(SimpleTestCase):
+    """Tests de la lectura de Accept-Encoding"""
+
+    def test_accepted_encodings_parses_quality(self):
+        """Lee las codificaciones con su calidad"""
+        self.assertEqual(
+            compression.accepted_encodings('gzip;q=0.5, BR, identity;q=x'),
+            {'gzip': 0.5, 'br': 1.0, 'identity': 0.0}
+        )
+
+    def test_choose_encoding(self):
+        """Elige la de mayor calidad entre las soportadas"""
+        self.assertEqual(compression.choose_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(compression.choose_encoding('deflate'))
+        self.assertIsNone(compression.choose_encoding('gzip;q=0'))
+        self.assertIsNone(compression.choose_encoding(''))
+
+    @unittest.skipUnless(brotli, 'brotli no esta instalado')
+    def test_brotli_preferred(self):
+        """Con la misma calidad prefiere brotli"""
+        self.assertEqual(compression.choose_encoding('gzip, br'), 'br')
+        self.assertEqual(compression.choose_encoding('*'), 'br')
+        self.assertEqual(compression.choose_encoding('br;q=0.1, gzip'),
+                         'gzip')
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Tests del middleware de compresion"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def run_request(self, response, accept='gzip'):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept)
+        middleware = compression.CompressionMiddleware(lambda _: response)
+        return middleware(request)
+
+    def json_response(self, body=BODY, **kwargs):
+        return HttpResponse(body, content_type='application/json',
+                            **kwargs)
+
+    def test_gzip_large_response(self):
+        """Comprime con gzip una respuesta grande"""
+        res = self.run_request(self.json_response())
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertEqual(res['Content-Length'], str(len(res.content)))
+        self.assertEqual(gzip.decompress(res.content).decode(), BODY)
+
+    @unittest.skipUnless(brotli, 'brotli no esta instalado')
+    def test_brotli_response(self):
+        """Usa brotli cuando el cliente lo acepta"""
+        res = self.run_request(self.json_response(), accept='gzip, br')
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(res.content).decode(), BODY)
+
+    def test_small_response_not_compressed(self):
+        """Los cuerpos menores al minimo se mandan tal cual"""
+        res = self.run_request(self.json_response('{"id": 1}'))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertEqual(res.content, b'{"id": 1}')
+
+    def test_client_without_support(self):
+        """Sin una codificacion aceptada la respuesta no cambia"""
+        res = self.run_request(self.json_response(), accept='identity')
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content.decode(), BODY)
+
+    def test_skips_non_compressible(self):
+        """No toca imagenes ni cuerpos ya codificados"""
+        image = HttpResponse(b'\x89PNG' * 100, content_type='image/png')
+        encoded = self.json_response()
+        encoded['Content-Encoding'] = 'gzip'
+
+        for response in (image, encoded):
+            res = self.run_request(response)
+            self.assertFalse(res.has_header('Vary'))
+        self.assertFalse(image.has_header('Content-Encoding'))
+
+    def test_strong_etag_weakened(self):
+        """La ETag fuerte pasa a debil al cambiar el cuerpo"""
+        res = self.run_request(self.json_response(headers={'ETag': '"abc"'}))
+
+        self.assertEqual(res['ETag'], 'W/"abc"')
+
+    def test_streaming_response(self):
+        """Las respuestas en streaming se comprimen por partes"""
+        chunks = [BODY[:500].encode(), BODY[500:].encode()]
+        response = StreamingHttpResponse(iter(chunks),
+                                         content_type='application/json')
+
+        res = self.run_request(response)
+        parts = list(res.streaming_content)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(gzip.decompress(b''.join(parts)).decode(), BODY)
+
+    @override_settings(COMPRESSION_ENABLED=False)
+    def test_disabled(self):
+        """Con la compresion apagada el middleware no se usa"""
+        with self.assertRaises(MiddlewareNotUsed):
+            compression.CompressionMiddleware(lambda _: None)
@@ -0,0 +1,222 @@
+"""
+Tests para el pool de conexiones
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from psycopg2 import extensions
+
+from core.db import pool as pool_module
+from core.db.backends.postgresql.base import DatabaseWrapper, reset_session
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Tests del pool usando sqlite como base de datos de prueba"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.opened = []
+
+    def connect(self):
+        raw = sqlite3.connect(self.path, check_same_thread=False)
+        self.opened.append(raw)
+        return raw
+
+    def make_pool(self, **options):
+        options.setdefault('max_size', 2)
+        return ConnectionPool(self.connect, alias='test', **options)
+
+    def test_connection_is_reused(self):
+        """Una conexion devuelta se vuelve a entregar sin abrir otra"""
+        pool = self.make_pool()
+        raw = pool.checkout()
+        pool.checkin(raw)
+
+        self.assertIs(pool.checkout(), raw)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_pool_is_bounded(self):
+        """Con el pool lleno se espera y luego se reporta el timeout"""
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.checkout()
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(len(self.opened), 1)
+
+    def test_waiter_gets_released_connection(self):
+        """Quien espera recibe la conexion que se libera"""
+        pool = self.make_pool(max_size=1, timeout=2)
+        raw = pool.checkout()
+        timer = threading.Timer(0.05, pool.checkin, [raw])
+        timer.start()
+
+        self.assertIs(pool.checkout(), raw)
+        timer.join()
+
+    def test_max_lifetime_recycles(self):
+        """Las conexiones vencidas se cierran y se reemplazan"""
+        pool = self.make_pool(max_lifetime=0)
+        raw = pool.checkout()
+        pool.checkin(raw)
+
+        new = pool.checkout()
+
+        self.assertIsNot(new, raw)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_unhealthy_connection_is_replaced(self):
+        """Una conexion que falla el ping se descarta en el checkout"""
+        pool = self.make_pool(health_check_after=0)
+        raw = pool.checkout()
+        pool.checkin(raw)
+        raw.close()
+
+        new = pool.checkout()
+
+        self.assertIsNot(new, raw)
+        new.execute('SELECT 1')
+
+    def test_broken_connection_frees_slot(self):
+        """Devolver una conexion rota libera su lugar en el pool"""
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        raw = pool.checkout()
+        pool.checkin(raw, broken=True)
+
+        self.assertIsNot(pool.checkout(), raw)
+
+    def test_checkin_resets_session(self):
+        """Al devolverla se limpia la sesion; si falla se descarta"""
+        reset = []
+        pool = self.make_pool(reset=reset.append)
+        raw = pool.checkout()
+        pool.checkin(raw)
+
+        self.assertEqual(reset, [raw])
+        self.assertIs(pool.checkout(), raw)
+
+        pool = self.make_pool(max_size=1, reset=lambda raw: 1 / 0)
+        raw = pool.checkout()
+        pool.checkin(raw)
+
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertIsNot(pool.checkout(), raw)
+
+    def test_fork_abandons_inherited_connections(self):
+        """Tras un fork no se reutiliza ni se cierra lo heredado"""
+        pool = self.make_pool()
+        raw = pool.checkout()
+        pool.checkin(raw)
+
+        with patch('core.db.pool.os.getpid', return_value=pool.pid + 1):
+            new = pool.checkout()
+
+        self.assertIsNot(new, raw)
+        self.assertIn(raw, pool_module._inherited)
+        raw.execute('SELECT 1')
+        pool_module._inherited.remove(raw)
+
+
+class PooledCheckinTests(SimpleTestCase):
+    """Tests de la devolucion al pool del backend con una conexion falsa"""
+
+    def setUp(self):
+        self.raw = MagicMock(closed=0, autocommit=True)
+        self.raw.info.transaction_status = \
+            extensions.TRANSACTION_STATUS_IDLE
+        self.pool = ConnectionPool(lambda: self.raw, alias='test',
+                                   reset=reset_session)
+        self.wrapper = DatabaseWrapper({
+            'NAME': 'test', 'USER': '', 'PASSWORD': '', 'HOST': '',
+            'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None,
+            'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+        }, alias='pooled')
+        self.wrapper._pool = self.pool
+        self.wrapper.connection = self.pool.checkout()
+
+    def run_and_close(self, sql):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute(sql)
+        self.wrapper.close()
+        self.assertIs(self.pool.checkout(), self.raw)
+
+    def discarded(self):
+        cursor = self.raw.cursor.return_value.__enter__.return_value
+        return [call.args[0] for call in cursor.execute.call_args_list
+                if call.args[0] == 'DISCARD ALL']
+
+    def test_clean_session_is_not_reset(self):
+        """Una sesion sin cambios vuelve al pool sin otra consulta"""
+        self.run_and_close('SELECT 1')
+
+        self.assertEqual(self.discarded(), [])
+        self.raw.rollback.assert_not_called()
+
+    def test_session_statement_resets(self):
+        """Un SET de sesion se descarta al devolver la conexion"""
+        self.run_and_close("SET application_name = 'fuga'")
+
+        self.assertEqual(self.discarded(), ['DISCARD ALL'])
+
+    def test_failed_transaction_resets(self):
+        """Una transaccion fallida se deshace antes de volver al pool"""
+        self.raw.info.transaction_status = \
+            extensions.TRANSACTION_STATUS_INERROR
+
+        self.run_and_close('SELECT 1')
+
+        self.raw.rollback.assert_called_once_with()
+        self.assertEqual(self.discarded(), ['DISCARD ALL'])
+
+    def test_checkin_without_reset(self):
+        """Con dirty en False el pool no llama a reset"""
+        reset = []
+        pool = ConnectionPool(lambda: self.raw, reset=reset.append)
+
+        pool.checkin(pool.checkout(), dirty=False)
+
+        self.assertEqual(reset, [])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql',
+                     'El backend con pool requiere Postgres')
+class PooledBackendTests(TransactionTestCase):
+    """
+    Tests del backend de Postgres con pool. Devolver la conexion deshace
+    la transaccion, por eso no corren dentro de la de TestCase.
+    """
+
+    def test_close_returns_connection_to_pool(self):
+        """Cerrar la conexion de Django la devuelve abierta al pool"""
+        connection.ensure_connection()
+        raw = connection.connection
+        connection._pool.checkin(raw)
+        connection.connection = None
+
+        connection.ensure_connection()
+
+        self.assertIs(connection.connection, raw)
+
+    def test_session_state_does_not_leak(self):
+        """Lo que una peticion cambia en la sesion no llega a la siguiente"""
+        connection.ensure_connection()
+        raw = connection.connection
+        with connection.cursor() as cursor:
+            cursor.execute("SET application_name = 'fuga'")
+        connection.close()
+
+        connection.ensure_connection()
+
+        self.assertIs(connection.connection, raw)
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW application_name')
+            self.assertNotEqual(cursor.fetchone()[0], 'fuga')
@@ -1,12 +1,19 @@
 """
 Tests para chckear la salud del servidor
 """
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
 
-from django.test import SimpleTestCase
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core import health
+
 
 class HealthServerTests(SimpleTestCase):
     """Test para probar si el server funciona"""
@@ -17,3 +24,73 @@ class HealthServerTests(SimpleTestCase):
         url = reverse('check-health')
         res = client.get(url)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_liveness_skips_middleware(self):
+        """La sonda de liveness no pasa por el resto de middlewares"""
+        with patch('django.contrib.sessions.middleware.'
+                   'SessionMiddleware.process_request') as session:
+            res = self.client.get('/healthz', HTTP_HOST='10.0.0.1')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, b'ok')
+        session.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir(),
+                   HEALTH_READINESS_CACHE_SECONDS=60)
+class ReadinessTests(TestCase):
+    """Test para la sonda de readiness"""
+
+    def test_readiness_reports_checks(self):
+        """La sonda revisa la base de datos, migraciones y media"""
+        res = self.client.get('/readyz')
+        data = res.json()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(data['ready'])
+        self.assertIn('latency_ms', data['checks']['database'])
+        self.assertEqual(data['checks']['migrations']['pending'], 0)
+        self.assertTrue(data['checks']['media']['ok'])
+
+    def test_readiness_is_cached(self):
+        """Las sondas seguidas reutilizan el ultimo resultado"""
+        self.client.get('/readyz')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/readyz')
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(HEALTH_READINESS_CACHE_SECONDS=0)
+    def test_readiness_fails_without_media_volume(self):
+        """Sin volumen de media escribible la sonda regresa 503"""
+        with patch('core.health.check_media', side_effect=OSError('ro')):
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(res.json()['checks']['media']['ok'])
+
+
+class PoolCheckTests(SimpleTestCase):
+    """Test de la saturacion del pool de conexiones"""
+
+    def pooled_connection(self, in_use, max_size=4):
+        stats = {'size': in_use, 'idle': 0, 'in_use': in_use,
+                 'max_size': max_size}
+        return SimpleNamespace(vendor='postgresql', connection=object(),
+                               pool=SimpleNamespace(stats=lambda: stats))
+
+    def test_pool_saturation_from_pool_counters(self):
+        """Con el backend con pool se usan sus contadores"""
+        result = health.check_pool(self.pooled_connection(3))
+
+        self.assertTrue(result['ok'])
+        self.assertEqual((result['in_use'], result['saturation']), (2, 0.5))
+
+    @override_settings(HEALTH_MAX_POOL_SATURATION=0.9)
+    def test_saturated_pool_not_ready(self):
+        """Un pool sin conexiones libres no esta listo"""
+        result = health.check_pool(self.pooled_connection(5))
+
+        self.assertFalse(result['ok'])
+        self.assertEqual(result['saturation'], 1.0)
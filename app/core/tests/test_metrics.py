@@ -0,0 +1,46 @@
+"""
+Tests para las metricas de las peticiones
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+class MetricsTests(TestCase):
+    """Tests del middleware y el endpoint de metricas"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='admin@example.com', password='admin.1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_metrics_labeled_by_view_and_status(self):
+        """Las metricas se etiquetan por nombre de url y status"""
+        self.client.get(reverse('recipe:recipe-list'))
+        res = self.client.get(reverse('metrics'))
+        body = res.content.decode()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",'
+            'status="200",view="recipe:recipe-list"}',
+            body
+        )
+        self.assertIn(
+            'http_request_db_queries_count{status="200",'
+            'view="recipe:recipe-list"}',
+            body
+        )
+        self.assertIn('http_response_size_bytes_bucket', body)
+
+    def test_unresolved_urls_share_one_label(self):
+        """Las urls que no existen no crean etiquetas nuevas"""
+        self.client.get('/no-existe/123')
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('view="<unresolved>"', body)
+        self.assertNotIn('no-existe', body)
@@ -0,0 +1,119 @@
+"""
+Tests para el perfilado de peticiones
+"""
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core.models import RequestProfile
+from core.profiling import make_token
+
+RECIPE_URL = reverse('recipe:recipe-list')
+STATIC_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+
+class ProfilingTests(TestCase):
+    """Tests del middleware de perfilado"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_SAMPLE_RATE=0,
+            PROFILING_DIR=self.directory,
+            PROFILING_RING_SIZE=2,
+            # El admin se renderiza sin haber corrido collectstatic
+            STATICFILES_STORAGE=STATIC_STORAGE,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        users = get_user_model().objects
+        self.staff = users.create_superuser('staff@example.com', 'admin.1234')
+        self.user = users.create_user(email='user@example.com',
+                                      password='admin.1234')
+        token = Token.objects.create(user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    def test_request_without_token_not_profiled(self):
+        """Sin token ni muestreo no se guarda nada"""
+        res = self.client.get(RECIPE_URL, **self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_signed_header_profiles_request(self):
+        """Un token firmado guarda el perfil con sql y serializers"""
+        header = make_token(self.staff, self.user)
+        res = self.client.get(RECIPE_URL, HTTP_X_PROFILE=header, **self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.view, 'recipe:recipe-list')
+        self.assertEqual(profile.user, self.user)
+        self.assertGreater(profile.sql_count, 0)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, f'slot-{profile.slot}.prof')
+        ))
+
+        self.client.force_login(self.staff)
+        url = reverse('admin:core_requestprofile_change', args=[profile.id])
+        res = self.client.get(url)
+        self.assertContains(res, 'rest_framework/serializers.py')
+
+    def test_token_for_other_user_not_profiled(self):
+        """Un token limitado a otro usuario no activa el perfilado"""
+        header = make_token(self.staff, self.staff)
+        with patch('core.profiling.cProfile.Profile') as profile:
+            res = self.client.get(RECIPE_URL, HTTP_X_PROFILE=header,
+                                  **self.auth)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        profile.assert_not_called()
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_tampered_token_ignored(self):
+        """Un token alterado no activa el perfilado"""
+        header = make_token(self.staff) + 'x'
+        self.client.get(RECIPE_URL, HTTP_X_PROFILE=header, **self.auth)
+
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_ring_buffer_is_bounded(self):
+        """El ring buffer reutiliza las ranuras mas viejas"""
+        header = make_token(self.staff)
+        for _ in range(3):
+            self.client.get(RECIPE_URL, HTTP_X_PROFILE=header, **self.auth)
+
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+    def test_deleted_profile_frees_its_slot(self):
+        """Borrar un perfil libera su ranura sin pisar las ocupadas"""
+        header = make_token(self.staff)
+        for _ in range(2):
+            self.client.get(RECIPE_URL, HTTP_X_PROFILE=header, **self.auth)
+        RequestProfile.objects.get(slot=0).delete()
+        kept = RequestProfile.objects.get(slot=1)
+
+        self.client.get(RECIPE_URL, HTTP_X_PROFILE=header, **self.auth)
+
+        self.assertEqual(
+            sorted(RequestProfile.objects.values_list('slot', flat=True)),
+            [0, 1]
+        )
+        self.assertTrue(RequestProfile.objects.filter(id=kept.id).exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_profiled(self):
+        """El muestreo perfila sin necesidad de token"""
+        self.client.get(RECIPE_URL, **self.auth)
+
+        self.assertTrue(RequestProfile.objects.get().sampled)
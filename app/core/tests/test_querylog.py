@@ -0,0 +1,94 @@
+"""
+Tests para el log de consultas lentas y repetidas
+"""
+import json
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.querylog import sql_shape
+
+
+class SqlShapeTests(SimpleTestCase):
+    """Tests de la normalizacion de consultas"""
+
+    def test_in_lists_collapsed(self):
+        """Las listas IN de distinto tamano tienen la misma forma"""
+        self.assertEqual(
+            sql_shape('SELECT 1 FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            sql_shape('SELECT 1 FROM t WHERE id IN (%s) LIMIT 5'),
+        )
+
+
+@override_settings(N_PLUS_ONE_THRESHOLD=5)
+class QueryLogMiddlewareTests(TestCase):
+    """Tests del middleware de log de consultas"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='admin@example.com', password='admin.1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _events(self, logs, event):
+        records = [json.loads(message.split(':', 2)[2])
+                   for message in logs.output]
+        return [record for record in records if record['event'] == event]
+
+    def test_repeated_queries_flagged_with_callsite(self):
+        """Los get_or_create en ciclo se reportan como N+1"""
+        payload = {
+            'title': 'Receta',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': [{'name': f'tag {index}'} for index in range(6)],
+        }
+        with self.assertLogs('core.querylog', 'INFO') as logs:
+            self.client.post(reverse('recipe:recipe-list'), payload,
+                             format='json')
+
+        repeated = self._events(logs, 'repeated_query')
+        callsites = {record['callsite'] for record in repeated}
+        self.assertIn('recipe/serializers.py:_get_or_create_tags', callsites)
+        self.assertTrue(all(record['count'] >= 5 for record in repeated))
+        self.assertEqual(repeated[0]['view'], 'recipe:recipe-list')
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_logged(self):
+        """Las consultas sobre el umbral se registran con la vista"""
+        with self.assertLogs('core.querylog', 'INFO') as logs:
+            self.client.get(reverse('recipe:recipe-list'))
+
+        slow = self._events(logs, 'slow_query')
+        self.assertTrue(slow)
+        self.assertEqual(slow[0]['view'], 'recipe:recipe-list')
+        self.assertIn('ms', slow[0])
+
+
+class QueryLogSummaryTests(SimpleTestCase):
+    """Tests del comando de resumen"""
+
+    def test_summary_groups_by_callsite(self):
+        """El resumen agrupa los eventos por call-site"""
+        event = {
+            'event': 'repeated_query', 'view': 'recipe:recipe-list',
+            'count': 12, 'ms': 3.5, 'sql': 'SELECT ...',
+            'callsite': 'recipe/serializers.py:_get_or_create_tags',
+        }
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as log_file:
+            log_file.write(json.dumps(event) + '\n')
+            log_file.write(json.dumps(event) + '\n')
+            log_file.flush()
+            out = StringIO()
+            call_command('querylog_summary', f'--file={log_file.name}',
+                         stdout=out)
+
+        self.assertIn('2 eventos', out.getvalue())
+        self.assertIn('24 consultas', out.getvalue())
+        self.assertIn('_get_or_create_tags', out.getvalue())
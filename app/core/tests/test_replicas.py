@@ -0,0 +1,136 @@
+"""
+Tests para el ruteo de lecturas a replicas
+"""
+import time
+import unittest
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, \
+    override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import replicas
+from core.models import Recipe
+
+ME_URL = reverse('user:me')
+REPLICA = settings.DATABASE_REPLICAS[0] \
+    if settings.DATABASE_REPLICAS else None
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_STORE='cookie')
+class ReplicaMiddlewareTests(SimpleTestCase):
+    """Tests de la eleccion de la base de lectura por peticion"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.chosen = []
+        replicas.reset_lag_checks()
+        self.addCleanup(replicas.reset_lag_checks)
+        patcher = patch('core.replicas.replica_lag', return_value=0.0)
+        self.replica_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_response(self, request):
+        self.chosen.append(replicas.ReplicaRouter().db_for_read(Recipe))
+        return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+    def run_request(self, request):
+        middleware = replicas.ReplicaMiddleware(self.get_response)
+        return middleware(request)
+
+    def test_safe_methods_read_from_replica(self):
+        """Un GET lee de la replica y el primario fuera de una peticion"""
+        self.run_request(self.factory.get('/'))
+
+        self.assertEqual(self.chosen, ['replica'])
+        self.assertIsNone(replicas.ReplicaRouter().db_for_read(Recipe))
+
+    def test_write_pins_to_primary(self):
+        """Despues de escribir, las lecturas van al primario"""
+        res = self.run_request(self.factory.post('/'))
+        self.assertIn(settings.REPLICA_PIN_COOKIE, res.cookies)
+
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = \
+            res.cookies[settings.REPLICA_PIN_COOKIE].value
+        self.run_request(request)
+
+        self.assertEqual(self.chosen, ['default', 'default'])
+
+    def test_expired_pin_reads_from_replica(self):
+        """Una marca vencida ya no fija al primario"""
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = str(time.time() - 1)
+
+        self.run_request(request)
+
+        self.assertEqual(self.chosen, ['replica'])
+
+    @override_settings(REPLICA_PIN_STORE='cache')
+    def test_cache_pin_by_credential(self):
+        """Con el cache la marca se guarda por token del cliente"""
+        self.run_request(self.factory.post('/', HTTP_AUTHORIZATION='Token a'))
+        self.run_request(self.factory.get('/', HTTP_AUTHORIZATION='Token a'))
+        self.run_request(self.factory.get('/', HTTP_AUTHORIZATION='Token b'))
+
+        self.assertEqual(self.chosen, ['default', 'default', 'replica'])
+
+    @override_settings(REPLICA_MAX_LAG_SECONDS=1)
+    def test_lagging_replica_falls_back(self):
+        """Una replica atrasada o caida no recibe lecturas"""
+        self.replica_lag.return_value = 30.0
+        self.run_request(self.factory.get('/'))
+
+        replicas.reset_lag_checks()
+        self.replica_lag.side_effect = OperationalError
+        self.run_request(self.factory.get('/'))
+
+        self.assertEqual(self.chosen, ['default', 'default'])
+
+    def test_lag_check_is_cached(self):
+        """El retraso se revisa una vez por intervalo, no por peticion"""
+        self.run_request(self.factory.get('/'))
+        self.run_request(self.factory.get('/'))
+
+        self.assertEqual(self.replica_lag.call_count, 1)
+
+
+@unittest.skipUnless(
+    REPLICA and 'MIRROR' not in settings.DATABASES[REPLICA].get('TEST', {}),
+    'Requiere una replica con su propia base, '
+    'ver app.replica_test_settings'
+)
+class ReplicaRoutingTests(TestCase):
+    """Tests con dos bases reales haciendo de primario y replica"""
+    databases = set(settings.DATABASES)
+
+    def setUp(self):
+        replicas.reset_lag_checks()
+        # Los usuarios y tokens no se reparten en shards: se leen de la
+        # replica aunque haya shards configurados
+        for alias, name in (('default', 'Primario'), (REPLICA, 'Replica')):
+            user = get_user_model().objects.db_manager(alias).create(
+                id=1, email='user@example.com', name=name
+            )
+            Token.objects.using(alias).create(key='a' * 40, user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + 'a' * 40)
+
+    def test_reads_replica_until_client_writes(self):
+        """Lee de la replica y tras escribir lee lo propio del primario"""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data['name'], 'Replica')
+
+        self.client.patch(ME_URL, {'name': 'Nuevo'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'Nuevo')
+        self.assertEqual(
+            get_user_model().objects.using(REPLICA).get().name, 'Replica'
+        )
@@ -0,0 +1,100 @@
+"""
+Tests para el schema OpenAPI precalculado
+"""
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class CachedSchemaTests(TestCase):
+    """Tests de la vista del schema cacheado"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cache_dir = tempfile.mkdtemp()
+        override = override_settings(SCHEMA_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        schema.clear_cache()
+        self.addCleanup(schema.clear_cache)
+
+    def test_cached_schema_matches_live_generation(self):
+        """El schema servido es igual al de la vista de drf-spectacular"""
+        request = RequestFactory().get(SCHEMA_URL, {'format': 'json'})
+        live = SpectacularAPIView.as_view()(request).render()
+
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(res.content), json.loads(live.content))
+
+    def test_etag_not_modified(self):
+        """Con If-None-Match igual al ETag se responde 304 sin cuerpo"""
+        res = self.client.get(SCHEMA_URL)
+        etag = res['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+    def test_etag_list_and_weak_match(self):
+        """If-None-Match se compara por etiqueta, no por subcadena"""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        for header in (f'"otra", W/{etag}', '*'):
+            res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(res.status_code,
+                             status.HTTP_304_NOT_MODIFIED)
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=f'"x{etag}x"')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_cache_file_keyed_on_code(self):
+        """Un archivo generado con otro codigo no se reutiliza"""
+        call_command('build_schema', stdout=open(os.devnull, 'w'))
+        schema.clear_cache()
+        schema.code_version.cache_clear()
+        self.addCleanup(schema.code_version.cache_clear)
+        with patch('core.schema.drf_spectacular.__version__', 'otra'):
+            path = schema.cache_path(None, 'en-us')
+
+            self.assertFalse(os.path.exists(path))
+            self.client.get(SCHEMA_URL)
+            self.assertTrue(os.path.exists(path))
+
+    def test_formats_have_distinct_etags(self):
+        """YAML y JSON se cachean por separado"""
+        yaml_res = self.client.get(SCHEMA_URL)
+        json_res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertNotEqual(yaml_res['ETag'], json_res['ETag'])
+        self.assertIn('openapi', yaml_res['Content-Type'])
+        self.assertIn('json', json_res['Content-Type'])
+
+    def test_build_schema_file_is_served(self):
+        """La vista usa el archivo generado por build_schema"""
+        call_command('build_schema', stdout=open(os.devnull, 'w'))
+        path = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        with open(path) as schema_file:
+            data = json.load(schema_file)
+        data['info']['title'] = 'Precalculado'
+        with open(path, 'w') as schema_file:
+            json.dump(data, schema_file)
+
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(json.loads(res.content)['info']['title'],
+                         'Precalculado')
@@ -0,0 +1,183 @@
+"""
+Tests para la particion de datos por usuario
+"""
+import unittest
+from collections import Counter
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeStats, ShardAssignment, Tag
+from core.sharding import HashRing, copy_user, next_sequence_value, \
+    shard_for_user
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class HashRingTests(SimpleTestCase):
+    """Tests del anillo de hash consistente"""
+
+    def test_keys_spread_over_nodes(self):
+        """Las llaves se reparten entre todos los nodos"""
+        ring = HashRing(['a', 'b', 'c'])
+
+        counts = Counter(ring.get(key) for key in range(3000))
+
+        self.assertEqual(set(counts), {'a', 'b', 'c'})
+        self.assertGreater(min(counts.values()), 600)
+
+    def test_adding_node_moves_few_keys(self):
+        """Agregar un nodo solo reasigna una parte de las llaves"""
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+
+        moved = [key for key in range(3000)
+                 if before.get(key) != after.get(key)]
+
+        self.assertTrue(all(after.get(key) == 'd' for key in moved))
+        self.assertLess(len(moved), 1200)
+
+
+class ShardSequenceTests(SimpleTestCase):
+    """Tests de los rangos de ids de cada shard"""
+
+    def test_next_value_in_shard_class(self):
+        """El siguiente id es el menor de la clase del shard"""
+        self.assertEqual(next_sequence_value(0, 1, 64), 1)
+        self.assertEqual(next_sequence_value(1, 1, 64), 65)
+        self.assertEqual(next_sequence_value(129, 2, 64), 130)
+        self.assertEqual(next_sequence_value(131, 2, 64), 194)
+        for max_id in range(200):
+            value = next_sequence_value(max_id, 3, 64)
+            self.assertGreater(value, max_id)
+            self.assertLessEqual(value, max_id + 64)
+            self.assertEqual(value % 64, 3)
+
+
+@unittest.skipUnless(len(settings.DATABASE_SHARDS) >= 2,
+                     'Requiere al menos dos shards configurados')
+class ShardedApiTests(TestCase):
+    """Tests con varias bases sqlite haciendo de shards"""
+    databases = {'default', *settings.DATABASE_SHARDS}
+
+    def setUp(self):
+        self.source, self.target = settings.DATABASE_SHARDS[:2]
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        ShardAssignment.objects.create(user=self.user, shard=self.source)
+        copy_user(self.user, self.source)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, title):
+        res = self.client.post(RECIPE_URL, {
+            'title': title, 'time_minutes': 5, 'price': '1.00',
+            'tags': [{'name': 'Cena'}],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def test_writes_go_to_user_shard(self):
+        """Las recetas y categorias se guardan en el shard del usuario"""
+        recipe_id = self.create_recipe('Sopa')
+
+        recipe = Recipe.objects.using(self.source).get(id=recipe_id)
+        self.assertEqual(list(recipe.tags.values_list('name', flat=True)),
+                         ['Cena'])
+        self.assertFalse(
+            Recipe.objects.using(self.target).filter(id=recipe_id).exists()
+        )
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual([item['title'] for item in res.data], ['Sopa'])
+
+    def test_new_user_assigned_by_ring(self):
+        """Un usuario sin asignacion queda en el shard de su anillo"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test.1234'
+        )
+
+        shard = shard_for_user(other.pk)
+
+        self.assertIn(shard, settings.DATABASE_SHARDS)
+        self.assertTrue(
+            get_user_model().objects.using(shard).filter(pk=other.pk).exists()
+        )
+
+    def test_move_user_preserves_ids(self):
+        """Mover al usuario copia sus filas con los mismos ids"""
+        recipe_id = self.create_recipe('Sopa')
+        tag_id = Tag.objects.using(self.source).get(user=self.user).id
+
+        call_command('move_user_shard', self.user.email, self.target,
+                     stdout=StringIO())
+
+        self.assertEqual(shard_for_user(self.user.pk), self.target)
+        recipe = Recipe.objects.using(self.target).get(id=recipe_id)
+        self.assertEqual(list(recipe.tags.values_list('id', flat=True)),
+                         [tag_id])
+        self.assertFalse(
+            Recipe.objects.using(self.source).filter(user=self.user).exists()
+        )
+        res = self.client.get(reverse('recipe:recipe-detail',
+                                      args=[recipe_id]))
+        self.assertEqual(res.data['tags'], [{'id': tag_id, 'name': 'Cena'}])
+
+    def test_writes_rejected_while_moving(self):
+        """Durante el movimiento se puede leer pero no escribir"""
+        ShardAssignment.objects.filter(user=self.user).update(moving=True)
+
+        res = self.client.post(RECIPE_URL, {
+            'title': 'Sopa', 'time_minutes': 5, 'price': '1.00',
+        }, format='json')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.client.get(RECIPE_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_move_waits_for_writes(self):
+        """Marcar el movimiento toma exclusivo el lock de escritura"""
+        module = 'core.management.commands.move_user_shard'
+        with patch(f'{module}.write_lock') as write_lock:
+            call_command('move_user_shard', self.user.email, self.target,
+                         stdout=StringIO())
+
+        write_lock.assert_called_once_with(self.user.pk, exclusive=True)
+
+    def test_user_delete_removes_shard_rows(self):
+        """Borrar al usuario borra tambien sus datos en el shard"""
+        self.create_recipe('Sopa')
+
+        self.user.delete()
+
+        self.assertFalse(get_user_model().objects.using(self.source)
+                         .filter(pk=self.user.pk).exists())
+        self.assertFalse(Recipe.objects.using(self.source).exists())
+        self.assertFalse(Tag.objects.using(self.source).exists())
+
+    def test_generate_data_writes_to_user_shards(self):
+        """El generador escribe los datos de cada usuario en su shard"""
+        call_command('generate_data', '--users=6', '--recipes=12',
+                     '--tags=2', '--ingredients=2', '--tags-per-recipe=1',
+                     '--ingredients-per-recipe=1', stdout=StringIO())
+
+        users = get_user_model().objects.exclude(pk=self.user.pk)
+        self.assertEqual(users.count(), 6)
+        self.assertFalse(Recipe.objects.exists())
+        for user in users:
+            shard = ShardAssignment.objects.get(user=user).shard
+            recipes = Recipe.objects.using(shard).filter(user=user)
+            self.assertEqual(recipes.count(), 2)
+            self.assertEqual(
+                RecipeStats.objects.using(shard).get(user=user).recipe_count,
+                2
+            )
+            self.assertEqual(shard_for_user(user.pk), shard)
@@ -0,0 +1,139 @@
+"""
+Tests para las firmas MinHash y el indice LSH
+"""
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import similarity
+from core.models import Ingredient, Recipe, RecipeLSHBucket, \
+    RecipeSignature
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class MinHashTests(SimpleTestCase):
+    """Tests de las firmas calculadas con numpy"""
+
+    def signature(self, tokens):
+        ids = np.zeros(len(tokens), dtype=np.int64)
+        return similarity.signatures(
+            ids, np.asarray(tokens, dtype=np.uint64)
+        )[1][0]
+
+    def test_estimate_tracks_jaccard(self):
+        """La fraccion de posiciones iguales aproxima el Jaccard"""
+        base = self.signature(range(0, 100))
+        close = self.signature(range(10, 110))
+        far = self.signature(range(90, 190))
+
+        self.assertGreater(similarity.similarity(base, close[None])[0], 0.6)
+        self.assertLess(similarity.similarity(base, far[None])[0], 0.2)
+
+    def test_batch_equals_single(self):
+        """Calcular en lote da las mismas firmas que una por una"""
+        ids = np.array([1, 1, 2, 2, 2], dtype=np.int64)
+        tokens = np.array([3, 5, 5, 7, 9], dtype=np.uint64)
+
+        batch_ids, matrix = similarity.signatures(ids, tokens)
+
+        self.assertEqual(batch_ids.tolist(), [1, 2])
+        np.testing.assert_array_equal(matrix[0], self.signature([3, 5]))
+        np.testing.assert_array_equal(matrix[1], self.signature([5, 7, 9]))
+        self.assertEqual(similarity.band_keys(matrix).shape,
+                         (2, similarity.BANDS))
+
+
+class SimilarRecipesApiTests(TestCase):
+    """Tests del endpoint de recetas similares"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'ing {index}')
+            for index in range(30)
+        ]
+
+    def create_recipe(self, title, ingredient_range):
+        recipe = Recipe.objects.create(
+            user=self.user, title=title, time_minutes=10,
+            price=Decimal('5.00')
+        )
+        recipe.ingredientes.add(*self.ingredients[ingredient_range])
+        return recipe
+
+    def test_similar_recipes_ranked(self):
+        """Regresa primero la receta con mas ingredientes en comun"""
+        base = self.create_recipe('Base', slice(0, 10))
+        close = self.create_recipe('Cercana', slice(0, 9))
+        self.create_recipe('Lejana', slice(20, 30))
+
+        res = self.client.get(similar_url(base.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]['id'], close.id)
+        self.assertGreater(res.data[0]['similarity'], 0.5)
+        self.assertNotIn('Lejana', [item['title'] for item in res.data])
+
+    def test_signature_follows_ingredient_changes(self):
+        """Cambiar los ingredientes actualiza la firma y las cubetas"""
+        recipe = self.create_recipe('Base', slice(0, 5))
+        before = bytes(RecipeSignature.objects.get(recipe=recipe).signature)
+
+        recipe.ingredientes.set(self.ingredients[10:15])
+
+        after = bytes(RecipeSignature.objects.get(recipe=recipe).signature)
+        self.assertNotEqual(before, after)
+        self.assertEqual(
+            RecipeLSHBucket.objects.filter(recipe=recipe).count(),
+            similarity.BANDS
+        )
+
+    def test_api_create_signature_has_all_links(self):
+        """Crear por la api deja una firma con todos los enlaces"""
+        res = self.client.post(reverse('recipe:recipe-list'), {
+            'title': 'Sopa', 'time_minutes': 5, 'price': '1.00',
+            'tags': [{'name': 'Cena'}],
+            'ingredientes': [{'name': 'ing 0'}, {'name': 'ing 1'}],
+        }, format='json')
+        recipe = Recipe.objects.get(id=res.data['id'])
+
+        _, expected = similarity.signatures(
+            *similarity.recipe_tokens([recipe.id], 'default')
+        )
+
+        stored = similarity.decode(
+            RecipeSignature.objects.get(recipe=recipe).signature
+        )
+        np.testing.assert_array_equal(stored, expected[0])
+
+    def test_invalid_limit(self):
+        """El limite debe estar entre 1 y 50"""
+        recipe = self.create_recipe('Base', slice(0, 3))
+
+        res = self.client.get(similar_url(recipe.id), {'limit': 500})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command(self):
+        """El comando indexa las recetas insertadas en lote"""
+        recipe = self.create_recipe('Base', slice(0, 3))
+        RecipeSignature.objects.all().delete()
+        RecipeLSHBucket.objects.all().delete()
+
+        call_command('rebuild_similarity', stdout=StringIO())
+
+        self.assertTrue(RecipeSignature.objects.filter(recipe=recipe).exists())
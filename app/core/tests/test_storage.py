@@ -0,0 +1,79 @@
+"""
+Tests para el almacenamiento direccionado por contenido
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from core.models import ImageBlob, Recipe
+from core.storage import ContentAddressedStorage, is_content_addressed
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Tests del storage por digest"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.media_root)
+        field = Recipe._meta.get_field('image')
+        patcher = patch.object(field, 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.user = get_user_model().objects.create_user(
+            email='admin@example.com', password='admin.1234'
+        )
+
+    def _create_recipe(self, title):
+        return Recipe.objects.create(
+            user=self.user, title=title, time_minutes=5, price=Decimal('5.5')
+        )
+
+    def test_save_uses_content_digest(self):
+        """El nombre del blob es el digest del contenido"""
+        content = b'imagen de prueba'
+        name = self.storage.save('uploads/recipe/a.JPG', ContentFile(content))
+
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(
+            name, f'uploads/recipe/{digest[:2]}/{digest}.jpg'
+        )
+        self.assertTrue(is_content_addressed(name))
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_duplicate_upload_stored_once(self):
+        """Subir el mismo contenido dos veces guarda un solo archivo"""
+        first = self.storage.save('uploads/recipe/a.jpg', ContentFile(b'x'))
+        second = self.storage.save('uploads/recipe/b.jpg', ContentFile(b'x'))
+
+        self.assertEqual(first, second)
+        directory = os.path.dirname(self.storage.path(first))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first)])
+
+    def test_blob_reference_counting(self):
+        """Las recetas que comparten imagen cuentan referencias"""
+        recipe_1 = self._create_recipe('Receta 1')
+        recipe_2 = self._create_recipe('Receta 2')
+        recipe_1.image.save('foto.jpg', ContentFile(b'foto'))
+        recipe_2.image.save('otra.jpg', ContentFile(b'foto'))
+
+        self.assertEqual(recipe_1.image.name, recipe_2.image.name)
+        blob = ImageBlob.objects.get(name=recipe_1.image.name)
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.size, 4)
+
+        recipe_1.delete()
+        recipe_2 = Recipe.objects.get(pk=recipe_2.pk)
+        recipe_2.image.save('nueva.jpg', ContentFile(b'nueva'))
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 0)
+        new_blob = ImageBlob.objects.get(name=recipe_2.image.name)
+        self.assertEqual(new_blob.ref_count, 1)
@@ -0,0 +1,211 @@
+"""
+Tests para la cola de tareas en la base de datos
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import tasks
+from core.models import BackgroundTask, Recipe, RecipeSignature, Tag
+
+calls = []
+
+
+@tasks.task('tests.record', max_attempts=2, timeout=60)
+def record(value):
+    calls.append(value)
+
+
+@tasks.task('tests.fail', max_attempts=2)
+def fail():
+    raise ValueError('sin suerte')
+
+
+class TaskQueueTests(TestCase):
+    """Tests de encolar, reclamar y ejecutar tareas"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_delay_without_queue_runs_now(self):
+        """Con la cola apagada la tarea se ejecuta en el momento"""
+        record.delay(value=1)
+
+        self.assertEqual(calls, [1])
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    @override_settings(TASK_QUEUE_ENABLED=True)
+    def test_delay_enqueues_on_commit(self):
+        """Con la cola la tarea se guarda al confirmar la transaccion"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            record.delay(value=1)
+            self.assertFalse(BackgroundTask.objects.exists())
+        for callback in callbacks:
+            callback()
+
+        task = BackgroundTask.objects.get()
+        self.assertEqual(task.name, 'tests.record')
+        self.assertEqual(task.kwargs, {'value': 1})
+        self.assertEqual(calls, [])
+
+    def test_claim_and_execute_success(self):
+        """La tarea reclamada se ejecuta y se borra al terminar"""
+        tasks.enqueue('tests.record', {'value': 'a'})
+
+        claimed = tasks.claim('w1')
+        self.assertEqual(len(claimed), 1)
+        task = claimed[0]
+        self.assertEqual(task.status, BackgroundTask.RUNNING)
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(task.locked_by, 'w1')
+        self.assertGreater(task.locked_until, timezone.now())
+        self.assertEqual(tasks.claim('w2'), [])
+
+        self.assertEqual(tasks.execute(task, 'w1'), 'success')
+        self.assertEqual(calls, ['a'])
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    def test_future_task_not_claimed(self):
+        """Una tarea programada no se toma antes de tiempo"""
+        tasks.enqueue('tests.record', {'value': 1},
+                      run_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertEqual(tasks.claim('w1'), [])
+
+    def test_failure_retries_with_backoff(self):
+        """Una falla regresa la tarea a la cola con espera"""
+        tasks.enqueue('tests.fail', {})
+        task = tasks.claim('w1')[0]
+
+        self.assertEqual(tasks.execute(task, 'w1'), 'retry')
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.QUEUED)
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertIn('sin suerte', task.last_error)
+        self.assertEqual(task.locked_by, '')
+
+    def test_failure_after_max_attempts(self):
+        """Al agotar los intentos la tarea queda como fallida"""
+        task = tasks.enqueue('tests.fail', {})
+        BackgroundTask.objects.filter(id=task.id).update(attempts=1)
+        task = tasks.claim('w1')[0]
+
+        self.assertEqual(tasks.execute(task, 'w1'), 'failed')
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.FAILED)
+        self.assertIsNotNone(task.finished_at)
+        self.assertEqual(tasks.claim('w1'), [])
+
+    def test_unknown_task_fails(self):
+        """Una tarea sin registrar no se reintenta"""
+        task = tasks.enqueue('tests.missing', {})
+
+        self.assertEqual(tasks.execute(tasks.claim('w1')[0], 'w1'),
+                         'failed')
+        task.refresh_from_db()
+        self.assertIn('tests.missing', task.last_error)
+
+    def test_backoff_grows_until_max(self):
+        """La espera se duplica por intento hasta el maximo"""
+        with override_settings(TASK_RETRY_BASE_SECONDS=10,
+                               TASK_RETRY_MAX_SECONDS=60):
+            self.assertTrue(5 <= tasks.backoff(1) <= 10)
+            self.assertTrue(20 <= tasks.backoff(3) <= 40)
+            self.assertTrue(30 <= tasks.backoff(10) <= 60)
+
+    def test_expired_visibility_is_reclaimed(self):
+        """Otro worker toma la tarea cuyo tiempo de visibilidad vencio"""
+        tasks.enqueue('tests.record', {'value': 1})
+        first = tasks.claim('w1')[0]
+        BackgroundTask.objects.filter(id=first.id).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        second = tasks.claim('w2')[0]
+        self.assertEqual(second.attempts, 2)
+        self.assertEqual(second.locked_by, 'w2')
+
+        # El primer worker ya no es duenio: su resultado no se guarda
+        tasks.execute(first, 'w1')
+        self.assertTrue(BackgroundTask.objects.filter(id=first.id).exists())
+        tasks.execute(second, 'w2')
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    def test_visibility_exhausted_fails(self):
+        """Una tarea que vence todos sus intentos queda como fallida"""
+        task = tasks.enqueue('tests.record', {'value': 1})
+        BackgroundTask.objects.filter(id=task.id).update(
+            status=BackgroundTask.RUNNING, attempts=2,
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(tasks.execute(tasks.claim('w1')[0], 'w1'),
+                         'failed')
+        self.assertEqual(calls, [])
+
+    def test_claim_with_skip_locked(self):
+        """Con SKIP LOCKED se reclaman varias tareas en orden"""
+        for value in range(3):
+            tasks.enqueue('tests.record', {'value': value})
+
+        with mock.patch.object(connection.features,
+                               'has_select_for_update_skip_locked', True):
+            claimed = tasks.claim('w1', limit=2)
+
+        self.assertEqual([task.kwargs['value'] for task in claimed], [0, 1])
+        self.assertEqual(
+            BackgroundTask.objects.filter(
+                status=BackgroundTask.QUEUED).count(), 1
+        )
+
+
+class RunWorkerCommandTests(TestCase):
+    """Tests del comando run_worker"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_once_runs_ready_tasks(self):
+        """--once ejecuta las tareas listas y termina"""
+        for value in range(3):
+            tasks.enqueue('tests.record', {'value': value})
+        tasks.enqueue('tests.fail', {})
+        out = StringIO()
+
+        call_command('run_worker', '--once', stdout=out)
+
+        self.assertEqual(calls, [0, 1, 2])
+        self.assertIn('4 tareas', out.getvalue())
+        self.assertEqual(BackgroundTask.objects.get().name, 'tests.fail')
+
+    @override_settings(TASK_QUEUE_ENABLED=True)
+    def test_tag_delete_refreshes_signatures_in_worker(self):
+        """Borrar una categoria recalcula las firmas en el worker"""
+        user = get_user_model().objects.create_user('user@example.com',
+                                                    'testpass123')
+        recipe = Recipe.objects.create(user=user, title='Sopa',
+                                       time_minutes=5, price=Decimal('1.00'))
+        tag = Tag.objects.create(user=user, name='Cena')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(tag)
+        call_command('run_worker', '--once', stdout=StringIO())
+        before = RecipeSignature.objects.get(recipe=recipe).signature
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+        self.assertEqual(BackgroundTask.objects.get().kwargs['recipe_ids'],
+                         [recipe.id])
+        call_command('run_worker', '--once', stdout=StringIO())
+
+        self.assertFalse(BackgroundTask.objects.exists())
+        self.assertFalse(RecipeSignature.objects.filter(
+            recipe=recipe, signature=before).exists())
@@ -0,0 +1,104 @@
+"""
+Tests para la grabacion y reproduccion de trafico
+"""
+import asyncio
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.schema import generate_schema
+from core.traffic import read_entries, replay, summarize
+
+
+class TrafficRecorderTests(TestCase):
+    """Tests del middleware que graba el trafico"""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        override = override_settings(TRAFFIC_RECORD_FILE=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='admin@example.com', password='admin.1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_records_anonymized_request_shape(self):
+        """Se graba la forma de la peticion sin datos del usuario"""
+        self.client.get(reverse('recipe:recipe-list'),
+                        {'tags': '1,2', 'search': 'privado'})
+
+        entry = read_entries(self.path)[0]
+        self.assertEqual(entry['m'], 'GET')
+        self.assertEqual(entry['u'], 'recipe:recipe-list')
+        self.assertEqual(entry['q'], {'tags': '1,2'})
+        self.assertEqual(entry['s'], 200)
+        self.assertIsInstance(entry['a'], int)
+        with open(self.path) as recording:
+            content = recording.read()
+        self.assertNotIn('admin@example.com', content)
+        self.assertNotIn('privado', content)
+
+    def test_documented_params_are_recorded(self):
+        """Todos los parametros de consulta de la api se graban"""
+        documented = {
+            parameter['name']
+            for operations in generate_schema()['paths'].values()
+            for operation in operations.values()
+            for parameter in operation.get('parameters', [])
+            if parameter['in'] == 'query'
+        }
+
+        self.assertEqual(documented - set(settings.TRAFFIC_RECORD_PARAMS),
+                         set())
+
+
+class ReplayTests(SimpleTestCase):
+    """Tests de la reproduccion contra un servidor local"""
+
+    def test_replay_reports_per_endpoint(self):
+        """Se reportan percentiles y errores por endpoint"""
+        entries = [
+            {'t': 0.0, 'm': 'GET', 'u': 'recipe:recipe-list', 'k': {},
+             'q': {}, 'b': 0, 'a': 3},
+            {'t': 0.01, 'm': 'GET', 'u': 'recipe:recipe-detail',
+             'k': {'pk': 1}, 'q': {}, 'b': 0, 'a': None},
+            {'t': 0.02, 'm': 'POST', 'u': 'recipe:recipe-list', 'k': {},
+             'q': {}, 'b': 120, 'a': 3},
+        ]
+        received = []
+
+        async def handle(reader, writer):
+            request = await reader.readuntil(b'\r\n\r\n')
+            received.append(request.decode())
+            status = b'500' if b'/recipes/1/' in request else b'200'
+            writer.write(b'HTTP/1.1 ' + status +
+                         b' OK\r\nContent-Length: 0\r\n\r\n')
+            await writer.drain()
+            writer.close()
+
+        async def scenario():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await replay(entries, f'http://127.0.0.1:{port}',
+                                    tokens={'3': 'abc'}, rate=10)
+
+        summary = summarize(asyncio.run(scenario()))
+
+        self.assertEqual(summary['GET recipe:recipe-list']['count'], 1)
+        self.assertEqual(summary['POST recipe:recipe-list']['count'], 1)
+        self.assertEqual(
+            summary['GET recipe:recipe-detail']['error_rate'], 1.0
+        )
+        authorized = [request for request in received
+                      if 'Authorization: Token abc' in request]
+        self.assertEqual(len(authorized), 2)
@@ -0,0 +1,211 @@
+"""
+Grabacion anonimizada del trafico y reproduccion para pruebas de capacidad
+"""
+import asyncio
+import hashlib
+import json
+import math
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import NoReverseMatch, reverse
+
+from core.metrics import view_name
+
+
+def user_bucket(user):
+    """Asigna el usuario a un bucket estable sin guardar su id"""
+    if user is None or not user.is_authenticated:
+        return None
+    digest = hashlib.sha256(
+        f'{settings.SECRET_KEY}:{user.pk}'.encode()
+    ).digest()
+    return int.from_bytes(digest[:4], 'big') % settings.TRAFFIC_USER_BUCKETS
+
+
+class TrafficRecorderMiddleware:
+    """
+    Guarda la forma de cada peticion en una linea JSON compacta: metodo,
+    nombre de la url, ids de la ruta, parametros permitidos, tamano del
+    cuerpo y bucket del usuario. No guarda cuerpos, headers ni rutas.
+    """
+
+    def __init__(self, get_response):
+        if not settings.TRAFFIC_RECORD_FILE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.params = set(settings.TRAFFIC_RECORD_PARAMS)
+        self.log_file = open(settings.TRAFFIC_RECORD_FILE, 'a',
+                             buffering=1)
+
+    def __call__(self, request):
+        started = time.time()
+        response = self.get_response(request)
+        match = request.resolver_match
+        entry = {
+            't': round(started, 4),
+            'm': request.method,
+            'u': view_name(request),
+            'k': {
+                key: value for key, value in
+                (match.kwargs.items() if match else ())
+                if str(value).isdigit()
+            },
+            'q': {
+                key: value for key, value in request.GET.items()
+                if key in self.params
+            },
+            'b': int(request.META.get('CONTENT_LENGTH') or 0),
+            'a': user_bucket(getattr(request, 'user', None)),
+            's': response.status_code,
+            'd': round((time.time() - started) * 1000, 2),
+        }
+        self.log_file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        return response
+
+
+def read_entries(path):
+    """Lee una grabacion ordenada por tiempo"""
+    with open(path) as log_file:
+        entries = [json.loads(line) for line in log_file if line.strip()]
+    return sorted(entries, key=lambda entry: entry['t'])
+
+
+def recipe_payload():
+    return {
+        'title': f'replay {uuid.uuid4().hex[:12]}',
+        'time_minutes': 30,
+        'price': '10.00',
+        'tags': [{'name': 'replay'}],
+    }
+
+
+PAYLOADS = {
+    'recipe:recipe-list': recipe_payload,
+    'recipe:recipe-detail': recipe_payload,
+    'recipe:tag-detail': lambda: {'name': f'replay {uuid.uuid4().hex[:8]}'},
+    'recipe:ingredient-detail':
+        lambda: {'name': f'replay {uuid.uuid4().hex[:8]}'},
+}
+
+
+def build_request(entry, tokens):
+    """Regresa (metodo, ruta, headers, cuerpo) o None si no se puede armar"""
+    try:
+        path = reverse(entry['u'], kwargs=entry['k'])
+    except NoReverseMatch:
+        return None
+    if entry['q']:
+        path = f'{path}?{urlencode(entry["q"])}'
+    headers = {}
+    token = tokens.get(str(entry['a'])) if entry['a'] is not None else None
+    if token:
+        headers['Authorization'] = f'Token {token}'
+    body = b''
+    if entry['m'] in ('POST', 'PUT', 'PATCH'):
+        payload = PAYLOADS.get(entry['u'], dict)()
+        body = json.dumps(payload).encode()
+        headers['Content-Type'] = 'application/json'
+    return entry['m'], path, headers, body
+
+
+async def send(host, port, method, path, headers, body, timeout):
+    """Hace una peticion HTTP/1.1 y regresa el status"""
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port), timeout
+    )
+    try:
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {host}',
+                 'Connection: close', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def replay(entries, target, tokens=None, concurrency=20, rate=1.0,
+                 timeout=30.0):
+    """
+    Reproduce las peticiones respetando los tiempos relativos grabados,
+    acelerados por `rate`, con a lo sumo `concurrency` en vuelo.
+    """
+    parts = urlsplit(target)
+    host, port = parts.hostname, parts.port or 80
+    tokens = tokens or {}
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    results = []
+    if not entries:
+        return results
+    first = entries[0]['t']
+    started = loop.time()
+
+    async def fire(entry, request):
+        delay = (entry['t'] - first) / rate - (loop.time() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            sent = loop.time()
+            try:
+                status = await send(host, port, *request, timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status = None
+            results.append({
+                'endpoint': f'{entry["m"]} {entry["u"]}',
+                'status': status,
+                'ms': (loop.time() - sent) * 1000,
+            })
+
+    tasks = []
+    for entry in entries:
+        request = build_request(entry, tokens)
+        if request is not None:
+            tasks.append(fire(entry, request))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def percentile(values, fraction):
+    """Percentil por rango mas cercano de una lista ordenada"""
+    if not values:
+        return 0.0
+    index = math.ceil(fraction * len(values)) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+def summarize(results):
+    """Agrupa latencias y errores por endpoint"""
+    endpoints = {}
+    for result in results:
+        endpoints.setdefault(result['endpoint'], []).append(result)
+    summary = {}
+    for endpoint, items in sorted(endpoints.items()):
+        latencies = sorted(item['ms'] for item in items)
+        errors = sum(1 for item in items
+                     if item['status'] is None or item['status'] >= 500)
+        client_errors = sum(1 for item in items
+                            if item['status'] and 400 <= item['status'] < 500)
+        summary[endpoint] = {
+            'count': len(items),
+            'error_rate': errors / len(items),
+            'client_error_rate': client_errors / len(items),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p90_ms': round(percentile(latencies, 0.90), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(latencies[-1], 2),
+        }
+    return summary
+
+
+def load_tokens(path):
+    """Lee el mapa bucket -> token de autenticacion"""
+    with open(path) as tokens_file:
+        tokens = json.load(tokens_file)
+    return {str(key): value for key, value in tokens.items()}
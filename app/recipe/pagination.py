@@ -0,0 +1,117 @@
+"""
+Paginacion por llave de la api de recetas
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagina con el valor de orden y el id de la ultima fila: cada pagina es
+    un rango del indice (user, campo, id) en lugar de un OFFSET. Solo se
+    activa cuando se pide `limit`, sin el la lista se regresa completa.
+    """
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    max_limit = 100
+    invalid_cursor_message = 'Cursor invalido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.limit_query_param not in request.query_params:
+            return None
+        limit = self.get_limit(request)
+        self.request = request
+        self.model = queryset.model
+        self.ordering = tuple(queryset.query.order_by)
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.after(self.decode(encoded)))
+        rows = list(queryset[:limit + 1])
+        self.next_values = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            self.next_values = [
+                getattr(rows[-1], name.lstrip('-')) for name in self.ordering
+            ]
+        return rows
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({
+                self.limit_query_param:
+                    f'Debe ser un entero entre 1 y {self.max_limit}'
+            })
+        return limit
+
+    def after(self, values):
+        """Filas posteriores a `values` en el orden de la consulta"""
+        condition = Q()
+        equal = {}
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def encode(self, values):
+        data = json.dumps({'o': self.ordering, 'v': [str(value)
+                                                     for value in values]})
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode(self, encoded):
+        """Valida el cursor contra el orden actual de la consulta"""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if tuple(data['o']) != self.ordering or \
+                    len(data['v']) != len(self.ordering):
+                raise ValueError
+            return [
+                self.model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, data['v'])
+            ]
+        except (ValueError, TypeError, KeyError, binascii.Error,
+                DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.limit_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Recetas por pagina (1 a {self.max_limit}); '
+                               'con el la respuesta es {next, results}',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor de la siguiente pagina, tomado de '
+                               '`next`',
+                'schema': {'type': 'string'},
+            },
+        ]
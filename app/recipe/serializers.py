@@ -1,9 +1,12 @@
 """
 Serializers para la api de receta
 """
+from django.conf import settings
+from django.db import router
 from rest_framework import serializers
 
-from core.models import Recipe, Tag, Ingredient
+from core import changes, imports, similarity
+from core.models import ChangeLogEntry, ImportJob, Recipe, Tag, Ingredient
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -47,15 +50,18 @@ class RecipeSerializer(serializers.ModelSerializer):
     def _get_or_create_tags(self, tags, recipe):
         """Crea o actualiza categorias"""
         auth_user = self.context['request'].user
+        # Las categorias se guardan en el mismo shard que la receta
+        manager = Tag.objects.db_manager(recipe._state.db)
         for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
+            tag_obj, created = manager.get_or_create(user=auth_user, **tag)
             recipe.tags.add(tag_obj)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Crea u obtiene ingredientes"""
         auth_user = self.context['request'].user
+        manager = Ingredient.objects.db_manager(recipe._state.db)
         for ingredient in ingredients:
-            ingredient, obj = Ingredient.objects.get_or_create(
+            ingredient, obj = manager.get_or_create(
                 user=auth_user, **ingredient
             )
             recipe.ingredientes.add(ingredient)
@@ -64,30 +70,57 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Crea la receta"""
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredientes', [])
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        # La receta y sus enlaces quedan en una sola entrada del registro
+        with changes.batch(router.db_for_write(Recipe)):
+            recipe = Recipe.objects.create(**validated_data)
+            # La firma de similitud se recalcula una vez al final
+            with similarity.deferred():
+                self._get_or_create_tags(tags, recipe)
+                self._get_or_create_ingredients(ingredients, recipe)
         return recipe
 
     def update(self, instance, validated_data):
         """Actualiza la receta"""
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredientes', [])
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+        with changes.batch(instance._state.db):
+            with similarity.deferred():
+                if tags is not None:
+                    instance.tags.clear()
+                    self._get_or_create_tags(tags, instance)
 
-        if ingredients is not None:
-            instance.ingredientes.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+                if ingredients is not None:
+                    instance.ingredientes.clear()
+                    self._get_or_create_ingredients(ingredients, instance)
 
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
 
-        instance.save()
+            instance.save()
         return instance
 
 
+class SimilarRecipeSerializer(RecipeSerializer):
+    """Receta con su similitud estimada a la receta consultada"""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['similarity']
+
+
+class PantryRecipeSerializer(RecipeSerializer):
+    """Receta con los ingredientes que faltan en la despensa"""
+    missing = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.ListField(
+        child=serializers.IntegerField(), read_only=True
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            'missing', 'missing_ingredients'
+        ]
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer para el retrieve de la receta"""
 
@@ -103,3 +136,175 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'image']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': True}}
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Rangos y orden de la lista de recetas"""
+    ORDERINGS = ['-id', 'id', 'price', '-price', 'time_minutes',
+                 '-time_minutes']
+
+    time_minutes_min = serializers.IntegerField(min_value=0, required=False)
+    time_minutes_max = serializers.IntegerField(min_value=0, required=False)
+    price_min = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         required=False)
+    price_max = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         required=False)
+    ordering = serializers.ChoiceField(choices=ORDERINGS, default='-id')
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Lista de ids para una operacion en lote"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=1000,
+    )
+
+
+class MergeSerializer(BulkIdsSerializer):
+    """Ids a fusionar y el id que los absorbe"""
+    into = serializers.IntegerField(min_value=1)
+
+    def validate(self, data):
+        data['ids'] = sorted(set(data['ids']) - {data['into']})
+        if not data['ids']:
+            raise serializers.ValidationError(
+                {'ids': 'Indica al menos un id distinto de into'}
+            )
+        return data
+
+
+class RenameItemSerializer(serializers.Serializer):
+    """Nuevo nombre de un elemento"""
+    id = serializers.IntegerField(min_value=1)
+    name = serializers.CharField(max_length=255)
+
+
+class BulkRenameSerializer(serializers.Serializer):
+    """Renombres a aplicar en una sola consulta"""
+    items = RenameItemSerializer(many=True)
+
+    def validate_items(self, items):
+        if not 1 <= len(items) <= 1000:
+            raise serializers.ValidationError(
+                'Se aceptan entre 1 y 1000 elementos'
+            )
+        if len({item['id'] for item in items}) != len(items):
+            raise serializers.ValidationError('Hay ids repetidos')
+        return items
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Ingrediente de la lista con las recetas que lo usan"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    count = serializers.IntegerField()
+    recipe_ids = serializers.ListField(child=serializers.IntegerField())
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Lista de compras combinada de varias recetas"""
+    recipes = serializers.ListField(child=serializers.IntegerField())
+    ingredients = ShoppingListItemSerializer(many=True)
+
+
+class HistogramBucketSerializer(serializers.Serializer):
+    """Cubeta del histograma, `le` es el limite superior inclusive"""
+    le = serializers.IntegerField(allow_null=True)
+    count = serializers.IntegerField()
+
+
+class TagUsageSerializer(serializers.Serializer):
+    """Categoria con el numero de recetas que la usan"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """Serializer de las estadisticas del usuario"""
+    recipe_count = serializers.IntegerField()
+    price_avg = serializers.DecimalField(max_digits=14, decimal_places=2,
+                                         allow_null=True)
+    price_min = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         allow_null=True)
+    price_max = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         allow_null=True)
+    time_minutes_histogram = HistogramBucketSerializer(many=True)
+    top_tags = TagUsageSerializer(many=True)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Trabajo de importacion con su avance"""
+    file = serializers.FileField(write_only=True)
+    format = serializers.ChoiceField(choices=ImportJob.FORMAT_CHOICES,
+                                     required=False)
+    progress = serializers.FloatField(read_only=True)
+    rows_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'file', 'format', 'status', 'size', 'progress',
+            'rows_processed', 'rows_imported', 'rows_failed',
+            'rows_per_second', 'errors', 'error', 'created_at', 'started_at',
+            'finished_at',
+        ]
+        read_only_fields = [
+            'id', 'status', 'size', 'rows_processed', 'rows_imported',
+            'rows_failed', 'errors', 'error', 'created_at', 'started_at',
+            'finished_at',
+        ]
+
+    def validate(self, data):
+        upload = data['file']
+        if upload.size > settings.IMPORT_MAX_BYTES:
+            raise serializers.ValidationError(
+                {'file': f'El archivo supera {settings.IMPORT_MAX_BYTES} '
+                         'bytes'}
+            )
+        data.setdefault('format', imports.detect_format(upload.name))
+        if data['format'] is None:
+            raise serializers.ValidationError(
+                {'format': 'Indica csv o jsonl, no se reconoce la extension'}
+            )
+        data['size'] = upload.size
+        return data
+
+
+class ChangeRecipeSerializer(serializers.ModelSerializer):
+    """Receta en el registro de cambios, con los ids de sus enlaces"""
+
+    class Meta:
+        model = Recipe
+        fields = [
+            'id', 'title', 'description', 'time_minutes', 'price', 'link',
+            'image', 'tags', 'ingredientes'
+        ]
+        read_only_fields = fields
+
+
+class ChangesParamsSerializer(serializers.Serializer):
+    """Parametros de la consulta de cambios"""
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.CHANGES_MAX_PAGE_SIZE,
+        default=settings.CHANGES_PAGE_SIZE
+    )
+
+
+class ChangeSerializer(serializers.Serializer):
+    """Alta o cambio con el objeto completo, o tombstone sin datos"""
+    seq = serializers.IntegerField()
+    type = serializers.ChoiceField(choices=ChangeLogEntry.KIND_CHOICES)
+    id = serializers.IntegerField()
+    deleted = serializers.BooleanField()
+    data = serializers.DictField(allow_null=True)
+
+
+class ChangeFeedSerializer(serializers.Serializer):
+    """Pagina del registro de cambios"""
+    since = serializers.IntegerField()
+    next_since = serializers.IntegerField()
+    has_more = serializers.BooleanField()
+    changes = ChangeSerializer(many=True)
@@ -0,0 +1,297 @@
+"""
+Tests para el registro de cambios y la sincronizacion incremental
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import changes, imports
+from core.models import ChangeLogEntry, ChangeSequence, Recipe, Tag
+
+CHANGES_URL = reverse('recipe:recipe-changes')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def entries(res):
+    return [(item['type'], item['id'], item['deleted'])
+            for item in res.data['changes']]
+
+
+class ChangesApiTests(TestCase):
+    """Tests del endpoint de cambios"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, title='Sopa', tags=()):
+        res = self.client.post(RECIPES_URL, {
+            'title': title, 'time_minutes': 10, 'price': '5.00',
+            'tags': [{'name': name} for name in tags],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return Recipe.objects.get(id=res.data['id'])
+
+    def sync(self, since=0, **params):
+        res = self.client.get(CHANGES_URL, {'since': since, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def test_initial_sync_returns_objects(self):
+        """Desde cero regresa cada objeto una vez con su estado"""
+        recipe = self.create_recipe(tags=['Cena', 'Rapida'])
+        tag_ids = sorted(recipe.tags.values_list('id', flat=True))
+
+        res = self.sync()
+
+        self.assertCountEqual(entries(res), [
+            ('recipe', recipe.id, False),
+            ('tag', tag_ids[0], False),
+            ('tag', tag_ids[1], False),
+        ])
+        data = next(item['data'] for item in res.data['changes']
+                    if item['type'] == 'recipe')
+        self.assertEqual(data['title'], 'Sopa')
+        self.assertEqual(sorted(data['tags']), tag_ids)
+        self.assertFalse(res.data['has_more'])
+        self.assertEqual(res.data['next_since'],
+                         ChangeSequence.objects.get(user=self.user).last_seq)
+
+    def test_recipe_create_uses_one_sequence_block(self):
+        """La receta y sus categorias se registran en un solo bloque"""
+        self.create_recipe(tags=['Cena', 'Rapida'])
+
+        self.assertEqual(ChangeLogEntry.objects.count(), 3)
+        self.assertEqual(
+            ChangeSequence.objects.get(user=self.user).last_seq, 3
+        )
+
+    def test_since_returns_only_new_changes(self):
+        """Solo regresa lo que cambio despues de `since`"""
+        sopa = self.create_recipe('Sopa')
+        self.create_recipe('Arroz')
+        since = self.sync().data['next_since']
+
+        self.client.patch(reverse('recipe:recipe-detail', args=[sopa.id]),
+                          {'time_minutes': 30})
+        res = self.sync(since)
+
+        self.assertEqual(entries(res), [('recipe', sopa.id, False)])
+        self.assertEqual(res.data['changes'][0]['data']['time_minutes'], 30)
+        self.assertEqual(self.sync(res.data['next_since']).data['changes'],
+                         [])
+
+    def test_delete_returns_tombstone(self):
+        """Un borrado llega como tombstone sin datos"""
+        recipe = self.create_recipe()
+        since = self.sync().data['next_since']
+
+        self.client.delete(reverse('recipe:recipe-detail', args=[recipe.id]))
+        res = self.sync(since)
+
+        self.assertEqual(entries(res), [('recipe', recipe.id, True)])
+        self.assertIsNone(res.data['changes'][0]['data'])
+
+    def test_tag_delete_changes_recipes(self):
+        """Borrar una categoria registra su tombstone y sus recetas"""
+        recipe = self.create_recipe(tags=['Cena'])
+        tag = recipe.tags.get()
+        since = self.sync().data['next_since']
+
+        self.client.delete(reverse('recipe:tag-detail', args=[tag.id]))
+        res = self.sync(since)
+
+        self.assertEqual(entries(res), [('tag', tag.id, True),
+                                        ('recipe', recipe.id, False)])
+        self.assertEqual(res.data['changes'][1]['data']['tags'], [])
+
+    def test_bulk_operations_are_recorded(self):
+        """Las operaciones en lote registran sus cambios explicitamente"""
+        recipe = self.create_recipe(tags=['Cena', 'Comida'])
+        cena, comida = recipe.tags.order_by('name')
+        since = self.sync().data['next_since']
+
+        self.client.post(reverse('recipe:tag-bulk-rename'), {
+            'items': [{'id': comida.id, 'name': 'Almuerzo'}]
+        }, format='json')
+        self.client.post(reverse('recipe:tag-bulk-delete'),
+                         {'ids': [cena.id]}, format='json')
+        res = self.sync(since)
+
+        self.assertEqual(entries(res), [('tag', comida.id, False),
+                                        ('tag', cena.id, True),
+                                        ('recipe', recipe.id, False)])
+        self.assertEqual(res.data['changes'][0]['data']['name'], 'Almuerzo')
+        self.assertEqual(res.data['changes'][2]['data']['tags'], [comida.id])
+
+    def test_import_is_recorded(self):
+        """Las recetas y categorias importadas entran al registro"""
+        row = imports.RecipeRowSerializer().run_validation({
+            'title': 'Pozole', 'time_minutes': 60, 'price': '9.00',
+            'tags': 'Cena',
+        })
+
+        recipe_ids, _ = imports.import_batch(self.user.id, [(1, row)],
+                                             'default')
+        res = self.sync()
+
+        self.assertCountEqual(entries(res), [
+            ('recipe', recipe_ids[0], False),
+            ('tag', Tag.objects.get(name='Cena').id, False),
+        ])
+
+    def test_pagination(self):
+        """Las paginas avanzan con next_since hasta agotar los cambios"""
+        for title in ('A', 'B', 'C'):
+            self.create_recipe(title)
+
+        first = self.sync(limit=2)
+        second = self.sync(first.data['next_since'], limit=2)
+
+        self.assertTrue(first.data['has_more'])
+        self.assertEqual(len(first.data['changes']), 2)
+        self.assertFalse(second.data['has_more'])
+        self.assertEqual(len(second.data['changes']), 1)
+
+    def test_other_users_changes_hidden(self):
+        """No regresa cambios de otros usuarios"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test.1234'
+        )
+        Recipe.objects.create(user=other, title='Ajena', time_minutes=5,
+                              price=Decimal('1.00'))
+
+        self.assertEqual(self.sync().data['changes'], [])
+
+    def test_invalid_params(self):
+        """Rechaza una secuencia o un limite invalidos"""
+        for params in ({'since': -1}, {'since': 'x'}, {'limit': 0}):
+            res = self.client.get(CHANGES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_delete_cascades(self):
+        """Borrar al usuario no deja entradas nuevas en el registro"""
+        self.create_recipe(tags=['Cena'])
+
+        self.user.delete()
+
+        self.assertFalse(ChangeLogEntry.objects.exists())
+        self.assertFalse(ChangeSequence.objects.exists())
+
+    def test_user_queryset_delete_cascades(self):
+        """Borrar usuarios en lote tampoco deja entradas"""
+        self.create_recipe(tags=['Cena'])
+
+        get_user_model().objects.filter(pk=self.user.pk).delete()
+
+        self.assertFalse(ChangeLogEntry.objects.exists())
+
+    def test_failed_user_delete_unmarks(self):
+        """Si el borrado falla el usuario vuelve a registrar cambios"""
+        with patch('django.db.models.deletion.Collector.delete',
+                   side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.user.delete()
+
+        self.assertFalse(changes.user_deleting(self.user.pk))
+        self.create_recipe()
+        self.assertTrue(
+            ChangeLogEntry.objects.filter(user=self.user).exists()
+        )
+
+
+class CompactChangesTests(TestCase):
+    """Tests de la compactacion del registro"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Sopa', time_minutes=5,
+            price=Decimal('1.00')
+        )
+
+    def test_superseded_entries_removed(self):
+        """Queda una entrada por objeto, la mas reciente"""
+        self.recipe.title = 'Sopa fria'
+        self.recipe.save()
+
+        superseded, tombstones = changes.compact('default', 3600)
+
+        self.assertEqual((superseded, tombstones), (1, 0))
+        self.assertEqual(
+            list(ChangeLogEntry.objects.values_list('seq', flat=True)), [2]
+        )
+
+    def test_old_tombstones_expire_clients(self):
+        """Sin los tombstones viejos los clientes atrasados resincronizan"""
+        tag = Tag.objects.create(user=self.user, name='Cena')
+        tag.delete()
+        ChangeLogEntry.objects.filter(deleted=True).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        out = StringIO()
+
+        call_command('compact_changes', '--tombstone-seconds', 86400,
+                     stdout=out)
+
+        self.assertIn('1 tombstones', out.getvalue())
+        self.assertEqual(
+            ChangeSequence.objects.get(user=self.user).compacted_seq, 3
+        )
+        res = self.client.get(CHANGES_URL, {'since': 1})
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+        res = self.client.get(CHANGES_URL, {'since': 0})
+        self.assertEqual(entries(res), [('recipe', self.recipe.id, False)])
+
+    def test_rebuild_replaces_log(self):
+        """La reconstruccion deja una entrada por objeto vivo"""
+        self.recipe.save()
+        Tag.objects.create(user=self.user, name='Cena')
+
+        changes.rebuild('default', [self.user.id])
+
+        self.assertEqual(ChangeLogEntry.objects.count(), 2)
+        sequence = ChangeSequence.objects.get(user=self.user)
+        self.assertEqual((sequence.last_seq, sequence.compacted_seq), (5, 3))
+
+
+class ChangesTransactionTests(TransactionTestCase):
+    """El registro se escribe en la transaccion del cambio"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_save_and_log_share_transaction(self):
+        """Si falla el registro tampoco se guarda el objeto"""
+        tag = Tag.objects.create(user=self.user, name='Cena')
+        url = reverse('recipe:tag-detail', args=[tag.id])
+
+        with patch('core.changes.write', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.patch(url, {'name': 'Comida'})
+            with self.assertRaises(RuntimeError):
+                Tag.objects.create(user=self.user, name='Postre')
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Cena')
+        self.assertFalse(Tag.objects.filter(name='Postre').exists())
@@ -0,0 +1,78 @@
+"""
+Tests para los formatos binarios de la API (MessagePack y CBOR)
+"""
+import json
+from decimal import Decimal
+
+import cbor2
+import msgpack
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+RECIPE_URL = reverse('recipe:recipe-list')
+FORMATS = {
+    'application/msgpack': (msgpack.packb,
+                            lambda body: msgpack.unpackb(body, raw=False)),
+    'application/cbor': (cbor2.dumps, cbor2.loads),
+}
+
+
+class BinaryFormatsTests(TestCase):
+    """Tests de la negociacion de MessagePack y CBOR"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+        recipe = Recipe.objects.create(
+            user=self.user, title='Sopa', time_minutes=10,
+            price=Decimal('5.50')
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Cena'))
+
+    def test_list_matches_json(self):
+        """La lista en formato binario trae los mismos datos que en JSON"""
+        expected = json.loads(self.client.get(RECIPE_URL).content)
+
+        for media_type, (_, decode) in FORMATS.items():
+            res = self.client.get(RECIPE_URL, HTTP_ACCEPT=media_type)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res['Content-Type'], media_type)
+            self.assertEqual(decode(res.content), expected)
+
+    def test_format_suffix(self):
+        """El parametro format tambien elige el formato"""
+        res = self.client.get(RECIPE_URL, {'format': 'msgpack'})
+
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+
+    def test_create_recipe(self):
+        """Crea recetas con cuerpos MessagePack o CBOR"""
+        for media_type, (encode, decode) in FORMATS.items():
+            payload = {'title': media_type, 'time_minutes': 5,
+                       'price': '3.00', 'tags': [{'name': 'Rapida'}]}
+
+            res = self.client.post(RECIPE_URL, encode(payload),
+                                   content_type=media_type,
+                                   HTTP_ACCEPT=media_type)
+
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            recipe = Recipe.objects.get(id=decode(res.content)['id'])
+            self.assertEqual(recipe.title, media_type)
+            self.assertEqual(recipe.price, Decimal('3.00'))
+
+    def test_invalid_body(self):
+        """Un cuerpo mal formado regresa 400"""
+        for media_type in FORMATS:
+            res = self.client.post(RECIPE_URL, b'\xc1\xff\x00',
+                                   content_type=media_type)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,167 @@
+"""
+Tests para la importacion de recetas en segundo plano
+"""
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import imports
+from core.models import ImportJob, Ingredient, Recipe, RecipeStats, Tag
+
+IMPORTS_URL = reverse('recipe:importjob-list')
+
+CSV_CONTENT = (
+    'title,time_minutes,price,tags,ingredientes\n'
+    'Huevos,10,5.00,Desayuno;Rapida,Huevo;Sal\n'
+    'Tortilla,25,8.50,Desayuno,Huevo;Papa\n'
+    'Sin precio,10,,,\n'
+    'Huevos,10,5.00,,\n'
+    'Pure,20,4.00,,Papa\n'
+)
+
+
+def detail_url(job_id):
+    return reverse('recipe:importjob-detail', args=[job_id])
+
+
+class ImportApiTests(TestCase):
+    """Tests del endpoint y del worker de importaciones"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(IMPORT_DIR=self.directory,
+                                          IMPORT_BATCH_SIZE=2)
+        self.settings.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def upload(self, name, content, **data):
+        data['file'] = SimpleUploadedFile(name, content.encode())
+        return self.client.post(IMPORTS_URL, data, format='multipart')
+
+    def test_upload_creates_pending_job(self):
+        """Subir un archivo regresa 202 con el trabajo pendiente"""
+        res = self.upload('recetas.csv', CSV_CONTENT)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res['Location'],
+                         'http://testserver' + detail_url(res.data['id']))
+        self.assertEqual(res.data['status'], ImportJob.PENDING)
+        self.assertEqual(res.data['format'], ImportJob.CSV)
+        self.assertEqual(res.data['size'], len(CSV_CONTENT))
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_unknown_format_rejected(self):
+        """Sin formato y con extension desconocida regresa 400"""
+        res = self.upload('recetas.txt', CSV_CONTENT)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_worker_imports_csv(self):
+        """El worker importa por lotes y reporta las filas con error"""
+        Tag.objects.create(user=self.user, name='Desayuno')
+        job_id = self.upload('recetas.csv', CSV_CONTENT).data['id']
+
+        call_command('process_imports', '--once', stdout=StringIO())
+        res = self.client.get(detail_url(job_id))
+
+        self.assertEqual(res.data['status'], ImportJob.DONE)
+        self.assertEqual(res.data['progress'], 1.0)
+        self.assertEqual(res.data['rows_processed'], 5)
+        self.assertEqual(res.data['rows_imported'], 3)
+        self.assertEqual(res.data['rows_failed'], 2)
+        self.assertEqual([error['row'] for error in res.data['errors']],
+                         [3, 4])
+        self.assertIn('price', res.data['errors'][0]['errors'])
+        self.assertEqual(Tag.objects.filter(name='Desayuno').count(), 1)
+        self.assertEqual(Ingredient.objects.filter(name='Huevo').count(), 1)
+        tortilla = Recipe.objects.get(title='Tortilla')
+        self.assertEqual(
+            sorted(tortilla.ingredientes.values_list('name', flat=True)),
+            ['Huevo', 'Papa']
+        )
+        self.assertEqual(RecipeStats.objects.get(user=self.user)
+                         .recipe_count, 3)
+        self.assertFalse(ImportJob.objects.get(id=job_id).file.storage
+                         .exists(ImportJob.objects.get(id=job_id).file.name))
+
+    def test_worker_imports_jsonl(self):
+        """Las lineas JSON invalidas se reportan sin detener el trabajo"""
+        lines = [
+            json.dumps({'title': 'Ensalada', 'time_minutes': 5,
+                        'price': '3.00', 'tags': ['Cena'],
+                        'ingredientes': [{'name': 'Lechuga'}]}),
+            '{no es json',
+            '',
+            json.dumps({'title': 'Sopa', 'time_minutes': 30,
+                        'price': '6.00'}),
+        ]
+        job_id = self.upload('recetas.jsonl', '\n'.join(lines)).data['id']
+
+        imports.process_next()
+        job = ImportJob.objects.get(id=job_id)
+
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual((job.rows_imported, job.rows_failed), (2, 1))
+        self.assertEqual(job.errors[0]['row'], 2)
+        self.assertEqual(
+            list(Recipe.objects.get(title='Ensalada').tags
+                 .values_list('name', flat=True)), ['Cena']
+        )
+
+    def test_stale_job_resumes_after_processed_rows(self):
+        """Un trabajo sin latido se reclama y sigue donde se quedo"""
+        job_id = self.upload('recetas.csv', CSV_CONTENT).data['id']
+        ImportJob.objects.filter(id=job_id).update(
+            status=ImportJob.RUNNING, rows_processed=2,
+            heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+
+        imports.process_next()
+        job = ImportJob.objects.get(id=job_id)
+
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(job.rows_processed, 5)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Huevos', 'Pure']
+        )
+
+    def test_running_job_not_claimed_twice(self):
+        """Un trabajo con latido reciente no se vuelve a tomar"""
+        job_id = self.upload('recetas.csv', CSV_CONTENT).data['id']
+        ImportJob.objects.filter(id=job_id).update(
+            status=ImportJob.RUNNING, heartbeat_at=timezone.now()
+        )
+
+        self.assertIsNone(imports.claim_job())
+
+    def test_jobs_limited_to_user(self):
+        """Cada usuario ve solo sus trabajos"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test.1234'
+        )
+        self.upload('recetas.csv', CSV_CONTENT)
+        self.client.force_authenticate(other)
+
+        res = self.client.get(IMPORTS_URL)
+
+        self.assertEqual(res.data, [])
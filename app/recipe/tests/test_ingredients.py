@@ -145,4 +145,22 @@ class PrivateIngredientAPITests(TestCase):
         recipe_2.ingredientes.add(ingredient)
 
         res = self.client.get(URL_INGREDIENT,{'assigned_only': 1 })
-        self.assertEqual(len(res.data),1)
\ No newline at end of file
+        self.assertEqual(len(res.data),1)
+
+    def test_merge_ingredients(self):
+        """Fusiona ingredientes reescribiendo las recetas"""
+        tomate = create_ingredient('Tomate', self.user)
+        jitomate = create_ingredient('Jitomate', self.user)
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salsa', time_minutes=5,
+            price=Decimal('1.00')
+        )
+        recipe.ingredientes.add(jitomate)
+
+        res = self.client.post(reverse('recipe:ingredient-merge'), {
+            'ids': [jitomate.id], 'into': tomate.id,
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(recipe.ingredientes.all()), [tomate])
+        self.assertFalse(Ingredient.objects.filter(id=jitomate.id).exists())
@@ -0,0 +1,138 @@
+"""
+Tests para la consulta de despensa
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import pantry
+from core.models import Ingredient, Recipe, RecipeIngredientCount
+
+PANTRY_URL = reverse('recipe:recipe-pantry')
+
+
+def create_recipe(user, title, ingredients=()):
+    """Crea una receta con sus ingredientes"""
+    recipe = Recipe.objects.create(user=user, title=title, time_minutes=10,
+                                   price=Decimal('5.00'))
+    recipe.ingredientes.add(*ingredients)
+    return recipe
+
+
+def counts():
+    return dict(RecipeIngredientCount.objects
+                .values_list('recipe_id', 'total'))
+
+
+class PantryApiTests(TestCase):
+    """Tests del endpoint de despensa"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.huevo, self.sal, self.papa, self.leche = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Huevo', 'Sal', 'Papa', 'Leche')
+        ]
+
+    def get(self, ingredients, **params):
+        params['ingredientes'] = ','.join(
+            str(ingredient.id) for ingredient in ingredients
+        )
+        return self.client.get(PANTRY_URL, params)
+
+    def test_only_fully_covered_recipes(self):
+        """Sin max_missing solo salen recetas con todo en la despensa"""
+        huevos = create_recipe(self.user, 'Huevos', [self.huevo, self.sal])
+        create_recipe(self.user, 'Tortilla', [self.huevo, self.papa])
+        create_recipe(self.user, 'Sin ingredientes')
+
+        res = self.get([self.huevo, self.sal, self.leche])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [huevos.id])
+        self.assertEqual(res.data[0]['missing'], 0)
+        self.assertEqual(res.data[0]['missing_ingredients'], [])
+
+    def test_ranked_by_missing(self):
+        """Con max_missing se ordenan por ingredientes faltantes"""
+        huevos = create_recipe(self.user, 'Huevos', [self.huevo, self.sal])
+        tortilla = create_recipe(self.user, 'Tortilla',
+                                 [self.huevo, self.papa, self.sal])
+        pure = create_recipe(self.user, 'Pure', [self.papa])
+        create_recipe(self.user, 'Flan', [self.huevo, self.papa,
+                                          self.leche])
+
+        res = self.get([self.huevo, self.sal], max_missing=1)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['id'], item['missing']) for item in res.data],
+            [(huevos.id, 0), (tortilla.id, 1), (pure.id, 1)]
+        )
+        self.assertEqual(res.data[1]['missing_ingredients'], [self.papa.id])
+
+    def test_limit_and_other_users(self):
+        """Respeta el limite y no regresa recetas de otros usuarios"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test.1234'
+        )
+        create_recipe(other, 'Ajena', [
+            Ingredient.objects.create(user=other, name='Huevo')
+        ])
+        first = create_recipe(self.user, 'Huevo 1', [self.huevo])
+        create_recipe(self.user, 'Huevo 2', [self.huevo])
+
+        res = self.get([self.huevo], limit=1)
+        foreign = self.client.get(PANTRY_URL, {
+            'ingredientes': other.ingredient_set.get().id
+        })
+
+        self.assertEqual([item['id'] for item in res.data], [first.id])
+        self.assertEqual(foreign.data, [])
+
+    def test_invalid_params(self):
+        """Parametros fuera de rango regresan 400"""
+        for params in ({'ingredientes': ''}, {'ingredientes': 'a,b'},
+                       {'ingredientes': '1', 'max_missing': 99},
+                       {'ingredientes': '1', 'limit': 0}):
+            res = self.client.get(PANTRY_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_counts_follow_link_changes(self):
+        """Los conteos siguen las altas, bajas y borrados de ingredientes"""
+        recipe = create_recipe(self.user, 'Huevos', [self.huevo, self.sal])
+        other = create_recipe(self.user, 'Papas', [self.papa, self.sal])
+        self.assertEqual(counts(), {recipe.id: 2, other.id: 2})
+
+        recipe.ingredientes.remove(self.sal)
+        self.papa.recipe_set.add(recipe)
+        self.assertEqual(counts(), {recipe.id: 2, other.id: 2})
+
+        self.sal.delete()
+        other.ingredientes.clear()
+        self.assertEqual(counts(), {recipe.id: 2, other.id: 0})
+
+        self.papa.recipe_set.clear()
+        incremental = counts()
+        pantry.rebuild('default')
+        self.assertEqual(incremental[recipe.id], 1)
+        self.assertEqual(counts(), {recipe.id: 1})
+
+    def test_counts_follow_merge(self):
+        """La fusion de ingredientes recalcula los conteos"""
+        recipe = create_recipe(self.user, 'Huevos',
+                               [self.huevo, self.sal, self.papa])
+        url = reverse('recipe:ingredient-merge')
+
+        self.client.post(url, {'ids': [self.sal.id, self.papa.id],
+                               'into': self.huevo.id}, format='json')
+
+        self.assertEqual(counts(), {recipe.id: 1})
@@ -8,7 +8,8 @@ from decimal import Decimal
 
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -448,6 +449,70 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(serializer_2.data, res.data)
         self.assertNotIn(serializer_3.data, res.data)
 
+    def test_filter_by_ranges(self):
+        """Test filtrar recetas por rango de tiempo y precio"""
+        rapida = create_recipe(user=self.user, time_minutes=20,
+                               price=Decimal('8.00'))
+        create_recipe(user=self.user, time_minutes=20, price=Decimal('15'))
+        create_recipe(user=self.user, time_minutes=90, price=Decimal('5'))
+
+        res = self.client.get(RECIPE_URL, {'time_minutes_max': 30,
+                                           'price_max': '10'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [rapida.id])
+
+    def test_ordering(self):
+        """Test ordenar por precio con el id como desempate"""
+        caro = create_recipe(user=self.user, price=Decimal('20'))
+        barato_1 = create_recipe(user=self.user, price=Decimal('3'))
+        barato_2 = create_recipe(user=self.user, price=Decimal('3'))
+
+        res = self.client.get(RECIPE_URL, {'ordering': 'price'})
+        desc = self.client.get(RECIPE_URL, {'ordering': '-price'})
+
+        self.assertEqual([item['id'] for item in res.data],
+                         [barato_1.id, barato_2.id, caro.id])
+        self.assertEqual([item['id'] for item in desc.data],
+                         [caro.id, barato_2.id, barato_1.id])
+
+    def test_invalid_filters(self):
+        """Test orden fuera de la lista o rangos invalidos regresan 400"""
+        for params in ({'ordering': 'title'}, {'price_max': 'barato'},
+                       {'time_minutes_min': -1}, {'limit': 0}):
+            res = self.client.get(RECIPE_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keyset_pagination(self):
+        """Test recorrer las paginas con el cursor de `next`"""
+        times = [30, 10, 20, 10, 40]
+        recipes = [create_recipe(user=self.user, time_minutes=minutes)
+                   for minutes in times]
+        expected = [recipe.id for recipe in
+                    sorted(recipes, key=lambda r: (r.time_minutes, r.id))]
+
+        seen = []
+        url, params = RECIPE_URL, {'ordering': 'time_minutes', 'limit': 2}
+        while url:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen += [item['id'] for item in res.data['results']]
+            url, params = res.data['next'], None
+
+        self.assertEqual(seen, expected)
+
+    def test_cursor_from_other_ordering(self):
+        """Test un cursor no sirve con otro orden"""
+        create_recipe(user=self.user)
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL, {'limit': 1})
+
+        other = self.client.get(
+            res.data['next'].replace('limit=1', 'limit=1&ordering=price')
+        )
+
+        self.assertEqual(other.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class ImageUploadTests(TestCase):
     """Tests para subir imagen"""
@@ -487,3 +552,49 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format='multipart')
 
         self.assertTrue(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class RecipeImageDeliveryTests(TestCase):
+    """Tests para entregar las imagenes a traves del proxy"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='admin@gmail.com', password='admin.1234')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+        self.recipe.image.save('foto.jpg', ContentFile(b'imagen'))
+
+    def tearDown(self):
+        self.recipe.image.delete()
+
+    @override_settings(MEDIA_DELIVERY='accel')
+    def test_image_delegated_to_proxy(self):
+        """El duenio recibe el X-Accel-Redirect sin el contenido"""
+        name = self.recipe.image.name
+        res = self.client.get(reverse('recipe:recipe-image', args=[name]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], f'/static/media/{name}')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res.content, b'')
+
+    def test_image_served_directly_without_proxy(self):
+        """Sin proxy la imagen se entrega como inmutable"""
+        name = self.recipe.image.name
+        res = self.client.get(reverse('recipe:recipe-image', args=[name]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), b'imagen')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_DELIVERY='accel')
+    def test_image_of_other_user_not_found(self):
+        """No se entregan imagenes de recetas de otro usuario"""
+        other_user = create_user(email='otro@gmail.com', password='admin.1234')
+        self.client.force_authenticate(other_user)
+        name = self.recipe.image.name
+        res = self.client.get(reverse('recipe:recipe-image', args=[name]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('X-Accel-Redirect', res)
@@ -0,0 +1,180 @@
+"""
+Tests para las estadisticas de recetas
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import stats
+from core.models import Recipe, Tag
+
+STATS_URL = reverse('recipe:recipe-stats')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, price='10.00', time_minutes=10, tags=()):
+    """Crea una receta con sus categorias"""
+    recipe = Recipe.objects.create(
+        user=user, title=f'Receta {price} {time_minutes}',
+        time_minutes=time_minutes, price=Decimal(price)
+    )
+    recipe.tags.add(*tags)
+    return recipe
+
+
+class RecipeStatsApiTests(TestCase):
+    """Tests del endpoint de estadisticas"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+
+    def assert_matches_rebuild(self):
+        """Lo incremental coincide con la reconstruccion completa"""
+        incremental = self.client.get(STATS_URL).data
+        stats.rebuild('default')
+        self.assertEqual(incremental, self.client.get(STATS_URL).data)
+
+    def test_empty_stats(self):
+        """Un usuario sin recetas tiene conteos en cero"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['price_avg'])
+        self.assertEqual(res.data['top_tags'], [])
+
+    def test_stats_follow_create_update_delete(self):
+        """El resumen se actualiza al crear, editar y borrar recetas"""
+        cena = Tag.objects.create(user=self.user, name='Cena')
+        postre = Tag.objects.create(user=self.user, name='Postre')
+        cheap = create_recipe(self.user, '2.00', 5, [cena])
+        create_recipe(self.user, '8.00', 50, [cena, postre])
+        expensive = create_recipe(self.user, '20.00', 300, [postre])
+
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['recipe_count'], 3)
+        self.assertEqual(res.data['price_avg'], '10.00')
+        self.assertEqual(res.data['price_min'], '2.00')
+        self.assertEqual(res.data['price_max'], '20.00')
+        histogram = {item['le']: item['count']
+                     for item in res.data['time_minutes_histogram']}
+        self.assertEqual((histogram[5], histogram[60], histogram[None]),
+                         (1, 1, 1))
+
+        expensive.price = Decimal('12.00')
+        expensive.save()
+        cheap.delete()
+
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['price_min'], '8.00')
+        self.assertEqual(res.data['price_max'], '12.00')
+        self.assertEqual(res.data['top_tags'], [
+            {'id': postre.id, 'name': 'Postre', 'recipe_count': 2},
+            {'id': cena.id, 'name': 'Cena', 'recipe_count': 1},
+        ])
+        self.assert_matches_rebuild()
+
+    def test_non_decimal_price(self):
+        """Acepta precios float o texto como antes de las estadisticas"""
+        recipe = Recipe.objects.create(user=self.user, title='Sopa',
+                                       time_minutes=10, price=5.5)
+        Recipe.objects.create(user=self.user, title='Arroz',
+                              time_minutes=10, price='3.25')
+        recipe.price = 7.1
+        recipe.save()
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['price_min'], '3.25')
+        self.assertEqual(res.data['price_max'], '7.10')
+        self.assert_matches_rebuild()
+
+    def test_stats_follow_api_tag_changes(self):
+        """Editar las categorias por la api actualiza su uso"""
+        res = self.client.post(RECIPE_URL, {
+            'title': 'Sopa', 'time_minutes': 20, 'price': '4.00',
+            'tags': [{'name': 'Cena'}, {'name': 'Caldo'}],
+        }, format='json')
+        self.client.patch(
+            reverse('recipe:recipe-detail', args=[res.data['id']]),
+            {'tags': [{'name': 'Caldo'}]}, format='json'
+        )
+
+        top = self.client.get(STATS_URL).data['top_tags']
+
+        self.assertEqual([tag['name'] for tag in top], ['Caldo'])
+        self.assert_matches_rebuild()
+
+    def test_stats_follow_tag_merge(self):
+        """Fusionar categorias en lote mantiene el uso correcto"""
+        cena = Tag.objects.create(user=self.user, name='Cena')
+        dinner = Tag.objects.create(user=self.user, name='dinner')
+        create_recipe(self.user, tags=[cena, dinner])
+        create_recipe(self.user, tags=[dinner])
+
+        self.client.post(reverse('recipe:tag-merge'), {
+            'ids': [dinner.id], 'into': cena.id,
+        }, format='json')
+
+        top = self.client.get(STATS_URL).data['top_tags']
+        self.assertEqual(top, [
+            {'id': cena.id, 'name': 'Cena', 'recipe_count': 2},
+        ])
+        self.assert_matches_rebuild()
+
+    def test_read_cost_does_not_grow(self):
+        """Leer cuesta las mismas consultas con 1 o 50 recetas"""
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(STATS_URL)
+            return len(captured)
+
+        create_recipe(self.user)
+        few = queries()
+        for index in range(49):
+            create_recipe(self.user, price=f'{index + 1}.00')
+
+        self.assertEqual(queries(), few)
+
+    def test_user_delete_cost_does_not_grow(self):
+        """Borrar al usuario cuesta lo mismo con 10 o 100 recetas"""
+        def delete_queries(email, count):
+            user = get_user_model().objects.create_user(email=email)
+            tag = Tag.objects.create(user=user, name='Cena')
+            for index in range(count):
+                create_recipe(user, price=f'{index + 1}.00', tags=[tag])
+            with CaptureQueriesContext(connection) as captured:
+                user.delete()
+            return len(captured)
+
+        few = delete_queries('few@example.com', 10)
+
+        self.assertEqual(delete_queries('many@example.com', 100), few)
+        self.assertEqual(self.client.get(STATS_URL).data['recipe_count'], 0)
+
+    def test_rebuild_command(self):
+        """El comando reconstruye las estadisticas de los datos en lote"""
+        Recipe.objects.bulk_create([
+            Recipe(user=self.user, title=f'Receta {index}', time_minutes=10,
+                   price=Decimal('3.00'))
+            for index in range(5)
+        ])
+        self.assertEqual(self.client.get(STATS_URL).data['recipe_count'], 0)
+
+        call_command('rebuild_recipe_stats', stdout=StringIO())
+
+        self.assertEqual(self.client.get(STATS_URL).data['recipe_count'], 5)
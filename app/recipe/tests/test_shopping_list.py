@@ -0,0 +1,99 @@
+"""
+Tests para la lista de compras de varias recetas
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe
+
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+
+
+def create_recipe(user, title, ingredients=()):
+    """Crea una receta con sus ingredientes"""
+    recipe = Recipe.objects.create(user=user, title=title, time_minutes=10,
+                                   price=Decimal('5.00'))
+    recipe.ingredientes.add(*ingredients)
+    return recipe
+
+
+def ids_param(recipes):
+    return {'ids': ','.join(str(recipe.id) for recipe in recipes)}
+
+
+class ShoppingListApiTests(TestCase):
+    """Tests del endpoint de lista de compras"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test.1234'
+        )
+        self.client.force_authenticate(self.user)
+        self.huevo, self.sal, self.papa = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Huevo', 'Sal', 'Papa')
+        ]
+
+    def test_grouped_ingredients(self):
+        """Regresa cada ingrediente una vez con sus recetas"""
+        huevos = create_recipe(self.user, 'Huevos', [self.huevo, self.sal])
+        tortilla = create_recipe(self.user, 'Tortilla',
+                                 [self.huevo, self.papa, self.sal])
+        pure = create_recipe(self.user, 'Pure', [self.papa])
+
+        res = self.client.get(SHOPPING_LIST_URL,
+                              ids_param([huevos, tortilla, pure]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipes'],
+                         sorted([huevos.id, tortilla.id, pure.id]))
+        self.assertEqual(res.data['ingredients'], [
+            {'id': self.huevo.id, 'name': 'Huevo', 'count': 2,
+             'recipe_ids': sorted([huevos.id, tortilla.id])},
+            {'id': self.papa.id, 'name': 'Papa', 'count': 2,
+             'recipe_ids': sorted([tortilla.id, pure.id])},
+            {'id': self.sal.id, 'name': 'Sal', 'count': 2,
+             'recipe_ids': sorted([huevos.id, tortilla.id])},
+        ])
+
+    def test_query_count_does_not_grow(self):
+        """El numero de consultas no depende de cuantas recetas se piden"""
+        recipes = [create_recipe(self.user, f'Receta {index}',
+                                 [self.huevo, self.sal])
+                   for index in range(10)]
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(SHOPPING_LIST_URL, ids_param(recipes[:2]))
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(SHOPPING_LIST_URL, ids_param(recipes))
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(res.data['ingredients'][0]['count'], 10)
+
+    def test_other_user_recipes_not_found(self):
+        """Las recetas de otro usuario regresan 404 con sus ids"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test.1234'
+        )
+        own = create_recipe(self.user, 'Propia', [self.huevo])
+        foreign = create_recipe(other, 'Ajena')
+
+        res = self.client.get(SHOPPING_LIST_URL, ids_param([own, foreign]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(res.data['ids'], [foreign.id])
+
+    def test_bounded_ids(self):
+        """Sin ids o con demasiados regresa 400"""
+        too_many = ','.join(str(index) for index in range(1, 102))
+        for params in ({}, {'ids': 'a'}, {'ids': too_many}):
+            res = self.client.get(SHOPPING_LIST_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
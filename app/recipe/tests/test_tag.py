@@ -4,7 +4,9 @@ Test para las categorias
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -13,6 +15,9 @@ from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+MERGE_URL = reverse('recipe:tag-merge')
+BULK_RENAME_URL = reverse('recipe:tag-bulk-rename')
+BULK_DELETE_URL = reverse('recipe:tag-bulk-delete')
 
 
 def create_user(email='admin@gmail.com', password='admin.1234'):
@@ -151,3 +156,94 @@ class TestTagPrivateAPI(TestCase):
         self.assertEqual(len(res.data), 1)
 
 
+class TestTagBulkAPI(TestCase):
+    """Prueba las operaciones en lote sobre las categorias"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, *tags):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Receta', time_minutes=10,
+            price=Decimal('2.50')
+        )
+        recipe.tags.add(*tags)
+        return recipe
+
+    def test_merge_rewrites_links_without_duplicates(self):
+        """Fusionar mueve los enlaces y descarta los repetidos"""
+        cena = create_tag(self.user, 'Cena')
+        dinner = create_tag(self.user, 'dinner')
+        supper = create_tag(self.user, 'supper')
+        both = self.create_recipe(cena, dinner)
+        two_sources = self.create_recipe(dinner, supper)
+        only_source = self.create_recipe(supper)
+
+        res = self.client.post(MERGE_URL, {
+            'ids': [dinner.id, supper.id], 'into': cena.id,
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['merged'], 2)
+        self.assertEqual(res.data['recipes_relinked'], 2)
+        self.assertEqual(res.data['duplicates_removed'], 2)
+        for recipe in (both, two_sources, only_source):
+            self.assertEqual(list(recipe.tags.all()), [cena])
+        self.assertEqual(list(Tag.objects.all()), [cena])
+
+    def test_merge_rejects_unowned_ids(self):
+        """No se puede fusionar la categoria de otro usuario"""
+        tag = create_tag(self.user)
+        other = create_tag(create_user(email='otro@example.com'))
+
+        res = self.client.post(MERGE_URL, {
+            'ids': [other.id], 'into': tag.id,
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(res.data['ids'], [other.id])
+        self.assertTrue(Tag.objects.filter(id=other.id).exists())
+
+    def test_merge_query_count_is_constant(self):
+        """El numero de consultas no depende del tamano del lote"""
+        def merge(count):
+            into = create_tag(self.user, 'destino')
+            tags = [create_tag(self.user, f'tag {i}') for i in range(count)]
+            self.create_recipe(*tags)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(MERGE_URL, {
+                    'ids': [tag.id for tag in tags], 'into': into.id,
+                }, format='json')
+            return len(queries)
+
+        self.assertEqual(merge(2), merge(40))
+
+    def test_bulk_rename(self):
+        """Renombra varias categorias con una sola peticion"""
+        tags = [create_tag(self.user, f'tag {i}') for i in range(3)]
+
+        res = self.client.post(BULK_RENAME_URL, {'items': [
+            {'id': tag.id, 'name': f'nuevo {tag.id}'} for tag in tags
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['renamed'], 3)
+        for tag in tags:
+            tag.refresh_from_db()
+            self.assertEqual(tag.name, f'nuevo {tag.id}')
+
+    def test_bulk_delete(self):
+        """Borra varias categorias y sus enlaces en una transaccion"""
+        tags = [create_tag(self.user, f'tag {i}') for i in range(3)]
+        kept = create_tag(self.user, 'se queda')
+        recipe = self.create_recipe(*tags, kept)
+
+        res = self.client.post(BULK_DELETE_URL, {
+            'ids': [tag.id for tag in tags],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'deleted': 3, 'recipes_unlinked': 3})
+        self.assertEqual(list(recipe.tags.all()), [kept])
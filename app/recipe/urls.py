@@ -10,8 +10,16 @@ router = DefaultRouter()
 router.register('recipes', views.RecipeViewSet)
 router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
+router.register('imports', views.ImportJobViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
+    path(
+        'images/<path:name>',
+        views.RecipeImageView.as_view(),
+        name='recipe-image'
+    ),
+    path('stats/', views.RecipeStatsView.as_view(), name='recipe-stats'),
+    path('changes/', views.ChangesView.as_view(), name='recipe-changes'),
     path('', include(router.urls))
 ]
@@ -1,8 +1,14 @@
 """
 Vistas de la api de recetas
 """
+import mimetypes
 from symbol import parameters
+from urllib.parse import quote
 
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Case, Count, Exists, OuterRef, Value, When
+from django.http import FileResponse, Http404, HttpResponse
 from drf_spectacular.utils import extend_schema_view, \
     OpenApiParameter, OpenApiTypes, extend_schema
 from rest_framework import viewsets, mixins, status
@@ -10,9 +16,24 @@ from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
 
-from core.models import Recipe, Tag, Ingredient
+from core import changes, pantry, signals, similarity, stats
+from core.db.aggregates import IdList
+from core.models import ChangeLogEntry, ImportJob, Recipe, \
+    RecipeIngredientCount, Tag, Ingredient, TagUsage
+from core.sharding import ShardedViewMixin
 from recipe import serializers
+from recipe.pagination import KeysetPagination
+
+SHOPPING_LIST_MAX_RECIPES = 100
+RANGE_FILTERS = (
+    ('time_minutes_min', 'time_minutes', 'gte'),
+    ('time_minutes_max', 'time_minutes', 'lte'),
+    ('price_min', 'price', 'gte'),
+    ('price_max', 'price', 'lte'),
+)
 
 @extend_schema_view(
         list=extend_schema(
@@ -26,16 +47,43 @@ from recipe import serializers
                     'ingredientes',
                     OpenApiTypes.STR,
                     description='Valores id de los ingredientes separados por coma'
-                )
+                ),
+                OpenApiParameter(
+                    'time_minutes_min',
+                    OpenApiTypes.INT,
+                    description='Tiempo minimo en minutos (inclusive)'
+                ),
+                OpenApiParameter(
+                    'time_minutes_max',
+                    OpenApiTypes.INT,
+                    description='Tiempo maximo en minutos (inclusive)'
+                ),
+                OpenApiParameter(
+                    'price_min',
+                    OpenApiTypes.DECIMAL,
+                    description='Precio minimo (inclusive)'
+                ),
+                OpenApiParameter(
+                    'price_max',
+                    OpenApiTypes.DECIMAL,
+                    description='Precio maximo (inclusive)'
+                ),
+                OpenApiParameter(
+                    'ordering',
+                    OpenApiTypes.STR,
+                    enum=serializers.RecipeFilterSerializer.ORDERINGS,
+                    description='Orden de la lista, default -id'
+                ),
             ]
         )
     )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ShardedViewMixin, viewsets.ModelViewSet):
     """Viewset para los apis de recetas"""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def _params_to_ints(self, list):
         """Convierte una lista de strings a enteros"""
@@ -54,9 +102,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
             ingredients_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredientes__id__in=ingredients_ids)
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-id').distinct()
+        filters = serializers.RecipeFilterSerializer(
+            data=self.request.query_params
+        )
+        filters.is_valid(raise_exception=True)
+        ranges = {
+            f'{field}__{lookup}': filters.validated_data[param]
+            for param, field, lookup in RANGE_FILTERS
+            if param in filters.validated_data
+        }
+        # El id desempata en la misma direccion, asi el orden es total y
+        # lo resuelve el indice (user, campo, id)
+        ordering = filters.validated_data['ordering']
+        if ordering.lstrip('-') != 'id':
+            ordering = (ordering, '-id' if ordering[0] == '-' else 'id')
+        else:
+            ordering = (ordering,)
+
+        queryset = queryset.filter(
+            user=self.request.user, **ranges
+        ).order_by(*ordering)
+        if tags or ingredients:
+            queryset = queryset.distinct()
+        return queryset
 
     def get_serializer_class(self):
         """Regresa el serializer en base a la request"""
@@ -64,6 +132,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         if self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        if self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        if self.action == 'pantry':
+            return serializers.PantryRecipeSerializer
         return self.serializer_class
 
     def perform_create(self, serializer):
@@ -80,6 +152,156 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(parameters=[
+        OpenApiParameter(
+            'limit',
+            OpenApiTypes.INT,
+            description='Maximo de recetas a regresar (1 a 50, default 10)'
+        )
+    ])
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Recetas del usuario con categorias e ingredientes parecidos"""
+        recipe = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= 50:
+            return Response({'limit': 'Debe ser un entero entre 1 y 50'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        scores = dict(similarity.similar_recipes(recipe, limit))
+        recipes = sorted(
+            self.queryset.filter(user=request.user, id__in=scores)
+            .prefetch_related('tags', 'ingredientes'),
+            key=lambda item: (-scores[item.id], item.id)
+        )
+        for item in recipes:
+            item.similarity = scores[item.id]
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ids',
+                OpenApiTypes.STR,
+                required=True,
+                description='Ids de las recetas separados por coma (maximo '
+                            f'{SHOPPING_LIST_MAX_RECIPES})'
+            ),
+        ],
+        responses=serializers.ShoppingListSerializer,
+    )
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """
+        Ingredientes de varias recetas sin repetir, con cuantas recetas los
+        usan y cuales, en una sola consulta agrupada.
+        """
+        params = request.query_params.get('ids', '')
+        try:
+            ids = set(self._params_to_ints(params))
+        except ValueError:
+            ids = set()
+        if not 1 <= len(ids) <= SHOPPING_LIST_MAX_RECIPES:
+            return Response(
+                {'ids': 'Indica entre 1 y '
+                        f'{SHOPPING_LIST_MAX_RECIPES} ids separados por coma'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        owned = set(self.queryset.filter(user=request.user, id__in=ids)
+                    .values_list('id', flat=True))
+        if ids - owned:
+            return Response({'ids': sorted(ids - owned)},
+                            status=status.HTTP_404_NOT_FOUND)
+        # Las recetas ya se validaron contra el usuario
+        ingredients = Recipe.ingredientes.through.objects \
+            .filter(recipe_id__in=owned) \
+            .values('ingredient_id', 'ingredient__name') \
+            .annotate(count=Count('recipe_id'),
+                      recipe_ids=IdList('recipe_id')) \
+            .order_by('-count', 'ingredient__name', 'ingredient_id')
+        serializer = serializers.ShoppingListSerializer({
+            'recipes': sorted(owned),
+            'ingredients': [
+                {'id': row['ingredient_id'], 'name': row['ingredient__name'],
+                 'count': row['count'], 'recipe_ids': row['recipe_ids']}
+                for row in ingredients
+            ],
+        })
+        return Response(serializer.data)
+
+    def _pantry_params(self, params):
+        """Valida los parametros de la despensa, regresa (valores, errores)"""
+        errors = {}
+        try:
+            ingredient_ids = set(self._params_to_ints(
+                params.get('ingredientes', '')
+            ))
+        except ValueError:
+            ingredient_ids = set()
+        if not 1 <= len(ingredient_ids) <= pantry.MAX_INGREDIENTS:
+            errors['ingredientes'] = (
+                'Indica entre 1 y '
+                f'{pantry.MAX_INGREDIENTS} ids separados por coma'
+            )
+        values = {'ingredientes': ingredient_ids}
+        for name, default, low, high in (
+            ('max_missing', 0, 0, pantry.MAX_MISSING),
+            ('limit', 20, 1, 100),
+        ):
+            try:
+                values[name] = int(params.get(name, default))
+            except ValueError:
+                values[name] = None
+            if values[name] is None or not low <= values[name] <= high:
+                errors[name] = f'Debe ser un entero entre {low} y {high}'
+        return values, errors
+
+    @extend_schema(parameters=[
+        OpenApiParameter(
+            'ingredientes',
+            OpenApiTypes.STR,
+            required=True,
+            description='Ids de los ingredientes disponibles separados por '
+                        'coma'
+        ),
+        OpenApiParameter(
+            'max_missing',
+            OpenApiTypes.INT,
+            description='Maximo de ingredientes faltantes por receta '
+                        f'(0 a {pantry.MAX_MISSING}, default 0)'
+        ),
+        OpenApiParameter(
+            'limit',
+            OpenApiTypes.INT,
+            description='Maximo de recetas a regresar (1 a 100, default 20)'
+        ),
+    ])
+    @action(methods=['GET'], detail=False)
+    def pantry(self, request):
+        """Recetas que se pueden preparar con los ingredientes indicados"""
+        values, errors = self._pantry_params(request.query_params)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        ingredient_ids = values['ingredientes']
+        ranked = pantry.cookable(request.user.pk, ingredient_ids,
+                                 values['max_missing'], values['limit'])
+        order = {recipe_id: index
+                 for index, (recipe_id, _) in enumerate(ranked)}
+        missing = pantry.missing_ingredients(order, ingredient_ids)
+        recipes = sorted(
+            self.queryset.filter(user=request.user, id__in=order)
+            .prefetch_related('tags', 'ingredientes'),
+            key=lambda item: order[item.id]
+        )
+        for item in recipes:
+            item.missing = len(missing[item.id])
+            item.missing_ingredients = missing[item.id]
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
@@ -91,11 +313,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.ListModelMixin, mixins.UpdateModelMixin,
-                            mixins.DestroyModelMixin, viewsets.GenericViewSet):
+class BaseRecipeAttrViewSet(ShardedViewMixin, mixins.ListModelMixin,
+                            mixins.UpdateModelMixin, mixins.DestroyModelMixin,
+                            viewsets.GenericViewSet):
     """"Base viewset for recipe atributes"""
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # Tabla intermedia con las recetas y el nombre de su llave hacia el
+    # modelo del viewset
+    through = None
+    through_field = None
 
     def get_queryset(self):
         """Metodo get(filtra)"""
@@ -109,14 +336,324 @@ class BaseRecipeAttrViewSet(mixins.ListModelMixin, mixins.UpdateModelMixin,
             user=self.request.user
         ).order_by('-name').distinct()
 
+    def get_serializer_class(self):
+        """Regresa el serializer de las operaciones en lote"""
+        if self.action == 'merge':
+            return serializers.MergeSerializer
+        if self.action == 'bulk_rename':
+            return serializers.BulkRenameSerializer
+        if self.action == 'bulk_delete':
+            return serializers.BulkIdsSerializer
+        return self.serializer_class
+
+    def _owned(self):
+        return self.queryset.filter(user=self.request.user)
+
+    def _links(self, ids):
+        """Filas de la tabla intermedia que apuntan a los ids"""
+        return self.through.objects.filter(
+            **{f'{self.through_field}_id__in': ids}
+        )
+
+    def _validated(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def links_changed(self, removed_ids, into=None, recipe_ids=()):
+        """
+        Las operaciones en lote no disparan senales; aqui se actualiza lo
+        que depende de los enlaces antes de borrar los elementos.
+        """
+
+    def _lock(self, ids, using):
+        """
+        Bloquea los elementos hasta confirmar: enlazarlos en otra
+        transaccion espera, asi las recetas afectadas no cambian.
+        """
+        return list(self._owned().using(using).filter(id__in=ids)
+                    .select_for_update().values_list('id', flat=True))
+
+    def _delete_unlinked(self, ids, using):
+        """Borra los elementos que ya no tienen enlaces, regresa cuantos"""
+        model = self.queryset.model
+        unlinked = self._owned().using(using).filter(id__in=ids).exclude(
+            Exists(self.through.objects.filter(
+                **{self.through_field: OuterRef('pk')}
+            ))
+        )
+        with signals.links_removed():
+            _, deleted = unlinked.delete()
+        return deleted.get(model._meta.label, 0)
+
+    def _missing(self, ids):
+        """Regresa la respuesta de error si algun id no es del usuario"""
+        found = set(self._owned().filter(id__in=ids)
+                    .values_list('id', flat=True))
+        missing = sorted(set(ids) - found)
+        if missing:
+            return Response({'ids': missing},
+                            status=status.HTTP_404_NOT_FOUND)
+        return None
+
+    @action(methods=['POST'], detail=False)
+    def merge(self, request):
+        """
+        Fusiona varios elementos en `into` con consultas por conjuntos: se
+        descartan los enlaces que quedarian duplicados, los demas se
+        reescriben y los elementos fusionados se borran.
+        """
+        data = self._validated(request)
+        ids, into = data['ids'], data['into']
+        missing = self._missing([*ids, into])
+        if missing:
+            return missing
+        field = f'{self.through_field}_id'
+        using = router.db_for_write(self.through)
+        with changes.batch(using):
+            self._lock([*ids, into], using)
+            affected = list(
+                self._links(ids).values_list('recipe_id', flat=True)
+            )
+            # La receta ya tiene `into`
+            existing, _ = self._links(ids).filter(
+                recipe_id__in=self.through.objects.filter(
+                    **{field: into}
+                ).values('recipe_id')
+            ).delete()
+            # La receta tiene varios de los elementos fusionados
+            duplicated, _ = self._links(ids).filter(Exists(
+                self._links(ids).filter(
+                    recipe_id=OuterRef('recipe_id'), id__lt=OuterRef('id')
+                )
+            )).delete()
+            relinked = self._links(ids).update(**{field: into})
+            self.links_changed(ids, into, set(affected))
+            merged = self._delete_unlinked(ids, using)
+            similarity.schedule_update(set(affected), using)
+            changes.record(request.user.pk, changes.RECIPE, affected, using)
+        return Response({
+            'into': into,
+            'merged': merged,
+            'recipes_relinked': relinked,
+            'duplicates_removed': existing + duplicated,
+        })
+
+    @action(methods=['POST'], detail=False, url_path='bulk-rename')
+    def bulk_rename(self, request):
+        """Renombra varios elementos con un solo UPDATE"""
+        items = self._validated(request)['items']
+        ids = [item['id'] for item in items]
+        missing = self._missing(ids)
+        if missing:
+            return missing
+        using = router.db_for_write(self.queryset.model)
+        with transaction.atomic(using=using):
+            renamed = self._owned().filter(id__in=ids).update(name=Case(
+                *[When(id=item['id'], then=Value(item['name']))
+                  for item in items]
+            ))
+            changes.record(self.request.user.pk,
+                           changes.MODEL_KINDS[self.queryset.model], ids,
+                           using)
+        return Response({'renamed': renamed})
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Borra varios elementos y sus enlaces en una transaccion"""
+        ids = self._validated(request)['ids']
+        missing = self._missing(ids)
+        if missing:
+            return missing
+        using = router.db_for_write(self.through)
+        with changes.batch(using):
+            self._lock(ids, using)
+            affected = list(
+                self._links(ids).values_list('recipe_id', flat=True)
+            )
+            unlinked, _ = self._links(ids).delete()
+            self.links_changed(ids, recipe_ids=set(affected))
+            deleted = self._delete_unlinked(ids, using)
+            similarity.schedule_update(set(affected), using)
+            changes.record(request.user.pk, changes.RECIPE, affected, using)
+        return Response({'deleted': deleted, 'recipes_unlinked': unlinked})
+
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """ViewSet para las categorias"""
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    through = Recipe.tags.through
+    through_field = 'tag'
+
+    def links_changed(self, removed_ids, into=None, recipe_ids=()):
+        """Mantiene el uso de las categorias de las estadisticas"""
+        using = router.db_for_write(TagUsage)
+        TagUsage.objects.using(using).filter(tag_id__in=removed_ids).delete()
+        if into is not None:
+            stats.refresh_tag_usage([into], using)
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """API para los ingredientes"""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+    through = Recipe.ingredientes.through
+    through_field = 'ingredient'
+
+    def links_changed(self, removed_ids, into=None, recipe_ids=()):
+        """Recalcula el conteo de ingredientes de las recetas afectadas"""
+        pantry.rebuild(router.db_for_write(RecipeIngredientCount),
+                       recipe_ids)
+
+
+class ImportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Importaciones de recetas: el archivo se guarda y process_imports lo
+    procesa en segundo plano; el trabajo se consulta para ver su avance.
+    """
+    serializer_class = serializers.ImportJobSerializer
+    queryset = ImportJob.objects.all()
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Solo los trabajos del usuario, los mas recientes primero"""
+        return self.queryset.filter(
+            user=self.request.user
+        ).order_by('-created_at', '-id')
+
+    def perform_create(self, serializer):
+        """Registra el trabajo pendiente"""
+        serializer.save(user=self.request.user)
+
+    @extend_schema(responses={202: serializers.ImportJobSerializer})
+    def create(self, request, *args, **kwargs):
+        """Acepta el archivo y regresa el trabajo con 202"""
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        response['Location'] = reverse(
+            'recipe:importjob-detail', args=[response.data['id']],
+            request=request
+        )
+        return response
+
+
+@extend_schema(exclude=True)
+class RecipeImageView(ShardedViewMixin, APIView):
+    """Entrega la imagen de una receta solo a su duenio"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, name):
+        """Valida la receta y delega la transferencia al proxy"""
+        if not Recipe.objects.filter(user=request.user, image=name).exists():
+            raise Http404
+        content_type = mimetypes.guess_type(name)[0] or \
+            'application/octet-stream'
+        if settings.MEDIA_DELIVERY == 'accel':
+            # nginx envia el archivo con sendfile y agrega el Cache-Control,
+            # ningun byte de la imagen pasa por el worker de Python.
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = quote(
+                settings.MEDIA_ACCEL_REDIRECT_URL + name
+            )
+            return response
+        storage = Recipe._meta.get_field('image').storage
+        response = FileResponse(storage.open(name), content_type=content_type)
+        # Los nombres nunca se reescriben (uuid o digest), son inmutables.
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+
+class RecipeStatsView(ShardedViewMixin, APIView):
+    """Estadisticas de las recetas del usuario desde su resumen"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses=serializers.RecipeStatsSerializer)
+    def get(self, request):
+        """Regresa el resumen, el histograma y las categorias mas usadas"""
+        serializer = serializers.RecipeStatsSerializer(
+            stats.user_stats(request.user.pk)
+        )
+        return Response(serializer.data)
+
+
+class ChangesView(ShardedViewMixin, APIView):
+    """Cambios de recetas, categorias e ingredientes para sincronizar"""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    kind_serializers = {
+        changes.RECIPE: serializers.ChangeRecipeSerializer,
+        changes.TAG: serializers.TagSerializer,
+        changes.INGREDIENT: serializers.IngredientSerializer,
+    }
+
+    def objects(self, kind, ids):
+        """Estado actual de los objetos que siguen vivos, por id"""
+        queryset = changes.KINDS[kind].objects.filter(
+            user=self.request.user, id__in=ids
+        )
+        if kind == changes.RECIPE:
+            queryset = queryset.prefetch_related('tags', 'ingredientes')
+        return {obj.pk: obj for obj in queryset}
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'since',
+                OpenApiTypes.INT,
+                description='Ultimo `next_since` recibido, 0 para copiar '
+                            'todo'
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Entradas por pagina (1 a '
+                            f'{settings.CHANGES_MAX_PAGE_SIZE})'
+            ),
+        ],
+        responses=serializers.ChangeFeedSerializer,
+    )
+    def get(self, request):
+        """
+        Regresa las altas, cambios y tombstones posteriores a `since`. Un
+        objeto que cambio varias veces aparece una vez con su estado actual.
+        """
+        params = serializers.ChangesParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        since = params.validated_data['since']
+        entries, has_more = changes.since(
+            request.user.pk, since, params.validated_data['limit'],
+            router.db_for_read(ChangeLogEntry)
+        )
+        latest = {(entry.kind, entry.object_id): entry for entry in entries}
+        wanted = {}
+        for entry in latest.values():
+            if not entry.deleted:
+                wanted.setdefault(entry.kind, []).append(entry.object_id)
+        alive = {kind: self.objects(kind, ids) for kind, ids in wanted.items()}
+        items = []
+        for entry in sorted(latest.values(), key=lambda entry: entry.seq):
+            obj = alive.get(entry.kind, {}).get(entry.object_id)
+            data = None
+            if obj is not None:
+                data = self.kind_serializers[entry.kind](
+                    obj, context={'request': request}
+                ).data
+            items.append({
+                'seq': entry.seq,
+                'type': entry.kind,
+                'id': entry.object_id,
+                # Borrado despues de esta entrada: su tombstone llega luego
+                'deleted': obj is None,
+                'data': data,
+            })
+        return Response(serializers.ChangeFeedSerializer({
+            'since': since,
+            'next_since': entries[-1].seq if entries else since,
+            'has_more': has_more,
+            'changes': items,
+        }).data)
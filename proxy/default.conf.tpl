@@ -1,13 +1,62 @@
 server {
     listen ${LISTEN_PORT};
 
+    sendfile on;
+    tcp_nopush on;
+    open_file_cache max=10000 inactive=5m;
+    open_file_cache_valid 2m;
+    open_file_cache_min_uses 1;
+    open_file_cache_errors on;
+
+    # Los estaticos y lo que la app no comprimio. Las respuestas que ya traen
+    # Content-Encoding de la app pasan sin tocarse.
+    gzip on;
+    gzip_vary on;
+    gzip_proxied any;
+    gzip_min_length 1024;
+    gzip_comp_level 5;
+    gzip_types text/plain text/css application/javascript application/json
+               application/msgpack application/cbor image/svg+xml;
+
+    # Estaticos con el hash de ManifestStaticFilesStorage en el nombre
+    location ~ "^/static/static/.+\.[0-9a-f]{12}\.[A-Za-z0-9]+$" {
+        root /vol;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+    # Las imagenes nunca se reescriben (uuid o digest). Con MEDIA_DELIVERY=accel
+    # la ubicacion es interna y solo se alcanza por X-Accel-Redirect.
+    location ^~ /static/media/uploads/ {
+        ${MEDIA_LOCATION_ACCESS}
+        alias /vol/static/media/uploads/;
+        add_header Cache-Control "${MEDIA_CACHE_CONTROL}";
+    }
+
     location /static {
         alias /vol/static;
     }
 
+    # Solo para el scraper de Prometheus dentro de la red privada
+    location = /metrics {
+        allow 10.0.0.0/8;
+        allow 172.16.0.0/12;
+        allow 192.168.0.0/16;
+        allow 127.0.0.1;
+        deny all;
+        uwsgi_pass ${APP_HOST}:${APP_PORT};
+        include /etc/nginx/uwsgi_params;
+    }
+
+    # Archivos de importacion de recetas, se procesan en segundo plano
+    location = /api/recipe/imports/ {
+        uwsgi_pass ${APP_HOST}:${APP_PORT};
+        include /etc/nginx/uwsgi_params;
+        client_max_body_size 500M;
+    }
+
     location / {
         uwsgi_pass ${APP_HOST}:${APP_PORT};
         include /etc/nginx/uwsgi_params;
         client_max_body_size 10M;
     }
-}
\ No newline at end of file
+}
@@ -2,5 +2,14 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
-nginx -g 'daemon off;'
\ No newline at end of file
+if [ "$MEDIA_DELIVERY" = "accel" ]; then
+    export MEDIA_LOCATION_ACCESS="internal;"
+    export MEDIA_CACHE_CONTROL="private, max-age=31536000, immutable"
+else
+    export MEDIA_LOCATION_ACCESS=""
+    export MEDIA_CACHE_CONTROL="public, max-age=31536000, immutable"
+fi
+
+envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT} ${MEDIA_LOCATION_ACCESS} ${MEDIA_CACHE_CONTROL}' \
+    < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
+nginx -g 'daemon off;'
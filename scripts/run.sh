@@ -2,9 +2,13 @@
 
 set -e
 
-python manage.py wait_for_db
-python manage.py collectstatic --noinput
-python manage.py migrate
+# Espera la db, y corre collectstatic y migrate solo cuando hace falta
+python manage.py startup
 
+# Los workers de uWSGI comparten las metricas por archivos en este directorio
+# (lo crea la imagen), se vacia en cada arranque para no sumar procesos de la
+# corrida anterior.
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/vol/prometheus}
+find "$PROMETHEUS_MULTIPROC_DIR" -mindepth 1 -delete
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi